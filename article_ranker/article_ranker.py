@@ -25,32 +25,120 @@ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
 '''
 
+from collections import defaultdict
 from datetime import datetime
-from gensim import similarities
 import logging
 from models.mongodb_models import *
 from mongoengine import *
-import numpy
-from user_models import UserModelCentroid
+from ranking_engine import CentroidRankingEngine
+import threading
+import time
 
 logger = logging.getLogger("main")
 
 class ArticleRanker(object):
     
-    def __init__(self, extractor):
+    def __init__(self, extractor, ranking_engine = None, user_model_cache = None,
+                 flush_size = 1, flush_interval = 0, vendor_refresh_interval = 300):
+        '''
+        ranking_engine : CentroidRankingEngine with the users' profiles. If None
+                         and no user_model_cache is set the profiles of all 
+                         users are loaded from database.
+        user_model_cache : If set, articles are ranked by the user model returned
+                           by user_model_cache.get(user_id) instead of the 
+                           ranking engine.
+        flush_size : Ratings are collected and written with one batched insert
+                     as soon as at least flush_size ratings are pending. 
+                     With 1 the ratings of each article are inserted at once.
+        flush_interval : Pending ratings are also written if the last write
+                         is at least flush_interval seconds ago. 0 disables it,
+                         which is only allowed with flush_size 1. Otherwise 
+                         the last ratings would stay pending until enough new
+                         ones come in.
+        vendor_refresh_interval : Vendors and their subscribers are kept in 
+                                  memory and reloaded from database every
+                                  vendor_refresh_interval seconds.
+        '''
         logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', 
                             level=logging.DEBUG)
                 
         self.feature_extractor_ = extractor
         
+        if ranking_engine is None and user_model_cache is None:
+            ranking_engine = CentroidRankingEngine(
+                                num_features = extractor.get_feature_number())
+            ranking_engine.load()
+        self.ranking_engine_ = ranking_engine
+        self.user_model_cache_ = user_model_cache
+        
+        if flush_size > 1 and flush_interval <= 0:
+            raise ValueError("flush_interval has to be set if flush_size > 1.")
+        
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.pending_ratings_ = []
+        self.last_flush_ = time.time()
+        self.ratings_lock_ = threading.Lock()
+        
+        self.vendor_refresh_interval = vendor_refresh_interval
+        self.vendors_ = {}
+        self.subscribers_ = {}
+        self.last_vendor_refresh_ = None
+        
+    def refresh_vendors(self):
+        '''
+        Reloads vendor name -> vendor map and vendor id -> subscriber ids index.
+        '''
+        vendors = dict((v.name, v) for v in Vendor.objects())
+        
+        #subscriptions are read raw to not dereference each vendor
+        subscribers = defaultdict(list)
+        for user in User._get_collection().find({}, {'subscriptions': 1}):
+            for vendor_ref in user.get('subscriptions', []):
+                #references are either stored as DBRef or ObjectId
+                vendor_id = getattr(vendor_ref, 'id', vendor_ref)
+                subscribers[vendor_id].append(user['_id'])
+        
+        self.vendors_ = vendors
+        self.subscribers_ = dict(subscribers)
+        self.last_vendor_refresh_ = time.time()
+        
+        logger.debug("Loaded %d vendors with %d subscriptions." % 
+                     (len(vendors), sum(len(s) for s in subscribers.itervalues())))
+        
+    def __refresh_vendors_if_outdated(self):
+        if (self.last_vendor_refresh_ is None or
+            time.time() - self.last_vendor_refresh_ >= self.vendor_refresh_interval):
+            self.refresh_vendors()
+        
     def get_vendor(self, article_as_dict):
         #get vendor for article
         try:
-            article_vendor = Vendor.objects(name = article_as_dict['news_vendor']).first()
+            self.__refresh_vendors_if_outdated()
+            
+            vendor_name = article_as_dict['news_vendor']
+            article_vendor = self.vendors_.get(vendor_name)
+            
+            if article_vendor is None:
+                #vendor might have been added since last refresh
+                article_vendor = Vendor.objects(name = vendor_name).first()
+                if article_vendor is not None:
+                    self.vendors_[vendor_name] = article_vendor
         except Exception as e:
             logger.error("Could not get vender due to error %s: %s" % (type(e), e))
             return None
         return article_vendor
+    
+    def get_subscriber_ids(self, vendor):
+        '''
+        Returns ids of all users who subscribed to vendor.
+        '''
+        try:
+            self.__refresh_vendors_if_outdated()
+        except Exception as e:
+            logger.error("Could not refresh subscribers due to error %s: %s" % (type(e), e))
+        
+        return self.subscribers_.get(vendor.id, [])
         
     def save_article(self, article_vendor, article_as_dict):
         #save news article with to database
@@ -85,13 +173,95 @@ class ArticleRanker(object):
         
         return stored_article
     
+    def queue_rating(self, user_id, article, rating):
+        '''
+        Adds rating to the pending ratings. See flush_ratings.
+        '''
+        with self.ratings_lock_:
+            self.pending_ratings_.append(RankedArticle(user_id = user_id,
+                                                       article = article,
+                                                       rating = rating))
+        
+    def flush_ratings(self, force = True):
+        '''
+        Writes all pending ratings with one batched insert.
+        
+        If force is False the ratings are only written if flush_size or 
+        flush_interval is reached.
+        '''
+        with self.ratings_lock_:
+            if len(self.pending_ratings_) == 0:
+                self.last_flush_ = time.time()
+                return
+            
+            interval_reached = (self.flush_interval > 0 and
+                                time.time() - self.last_flush_ >= self.flush_interval)
+            if (not force and 
+                len(self.pending_ratings_) < self.flush_size and
+                not interval_reached):
+                return
+            
+            ranked_articles = self.pending_ratings_
+            self.pending_ratings_ = []
+            self.last_flush_ = time.time()
+        
+        try:
+            RankedArticle.objects.insert(ranked_articles, load_bulk = False)
+        except Exception as e:
+            logger.error("Could not save %d article ratings at once due to error "
+                         "%s: %s. Save them one by one." 
+                         % (len(ranked_articles), type(e), e))
+            self.__save_ratings_one_by_one(ranked_articles)
+            return
+        
+        logger.debug("Saved %d article ratings" % len(ranked_articles))
+        
+    def __save_ratings_one_by_one(self, ranked_articles):
+        '''
+        Saves each rating on its own so that a failure loses only this rating.
+        
+        The failed batch insert might have saved some ratings already. Ratings 
+        are upserted by user and article to not save them twice.
+        '''
+        num_saved = 0
+        for ranked_article in ranked_articles:
+            try:
+                RankedArticle.objects(user_id = ranked_article.user_id,
+                                      article = ranked_article.article
+                                      ).update_one(upsert = True,
+                                                   set__rating = ranked_article.rating)
+                num_saved += 1
+            except Exception as e:
+                logger.error("Could not save rating of article for user %s due "
+                             "to error %s: %s" 
+                             % (ranked_article.user_id, type(e), e))
+                
+        logger.debug("Saved %d of %d article ratings one by one" 
+                     % (num_saved, len(ranked_articles)))
+    
     def save_rating(self, user, article, rating):
-        ranked_article = RankedArticle(user_id = user.id,
-                                       article = article,
-                                       rating = rating)
-        ranked_article.save()
+        self.queue_rating(user.id, article, rating)
+        self.flush_ratings(force = False)
 
-        logger.debug("Saved article rating")
+    def rank_with_user_models(self, article, user_ids):
+        '''
+        Ranks article with the cached user model of each user.
+        
+        Returns list of (user id, ranking) tuples.
+        '''
+        rankings = []
+        for user_id in user_ids:
+            try:
+                user_model = self.user_model_cache_.get(user_id)
+                ranking = user_model.rank(article)
+            except Exception as inst:
+                logger.error("Could not rank article for user %s due to error "
+                             "%s: %s" % (user_id, type(inst), inst))
+                continue
+            
+            rankings.append((user_id, ranking))
+            
+        return rankings
 
     def rank_article(self, article_as_dict):           
         article_vendor = self.get_vendor(article_as_dict)
@@ -107,13 +277,16 @@ class ArticleRanker(object):
             return
         
         #get users for vendor
-        users = User.objects(subscriptions = article_vendor)
+        user_ids = self.get_subscriber_ids(article_vendor)
         
-        #rank article for each user to her profile
-        for u in users:            
-            user_model = UserModelCentroid(user_id = u.id, 
-                                           extractor = self.feature_extractor_)
-            
-            ranking = user_model.rank(stored_article)
+        if self.user_model_cache_ is None:
+            #rank article for all users to their profiles at once
+            rankings = self.ranking_engine_.rank(stored_article.features.data, 
+                                                 user_ids)
+        else:
+            rankings = self.rank_with_user_models(stored_article, user_ids)
+        
+        for user_id, ranking in rankings:
+            self.queue_rating(user_id, stored_article, ranking)
             
-            self.save_rating(u, stored_article, ranking) 
+        self.flush_ratings(force = False)
@@ -26,17 +26,22 @@ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 '''
 
 from article_ranker import ArticleRanker
-from datetime import datetime
+from collections import OrderedDict
+from datetime import datetime, timedelta
 from feature_extractor.extractors import EsaFeatureExtractor
+from feature_extractor.lemma_cache import LemmaCache
 import json
 import logging
-from models.mongodb_models import Vendor, User, Article
+from models.mongodb_models import Vendor, User, Article, UserModel
 from mongoengine import *
+from ranking_engine import CentroidRankingEngine
+import signal
 import socket
 import stomp
 import sys
 import time
 from daemon import Daemon
+import user_models
 import yaml
 
 """
@@ -49,6 +54,140 @@ as top articles if their rank is high enough.
 
 logger = logging.getLogger("main")
 
+class UserModelCache(object):
+    '''
+    Size bounded LRU cache of loaded user models.
+    
+    Models are keyed by user id. Loading a user model means several database 
+    queries and unpickling the classifier.
+    
+    Each cached model remembers version and trained_at of the stored UserModel
+    it was loaded from. The trainer sets UserModel.trained_at when it saves a
+    new model. The cache polls for changed models every check_interval seconds
+    and drops a cached model if version or trained_at of the stored model 
+    differ from the ones it was loaded with.
+    
+    trained_at is set by the clock of the trainer and a model may be written
+    after a newer one. Each check therefore looks safety_margin seconds back 
+    from the latest trained_at seen and skips models which were already 
+    reported.
+    '''
+    
+    def __init__(self, user_model_class, extractor, max_size = 1000, 
+                 check_interval = 60, safety_margin = 300):
+        '''
+        user_model_class : class from user_models, e.g. UserModelSVM
+        extractor : feature extractor passed to each user model
+        max_size : maximum number of cached user models
+        check_interval : seconds between two checks for newly trained models
+        safety_margin : seconds a check looks back for models saved late
+        '''
+        self.user_model_class = user_model_class
+        self.extractor = extractor
+        self.max_size = max_size
+        self.check_interval = check_interval
+        self.safety_margin = timedelta(seconds = safety_margin)
+        
+        #user id -> (user model, (version, trained_at) of stored model)
+        self.models_ = OrderedDict()
+        #user id -> (version, trained_at) of stored models found by checks
+        self.reported_ = {}
+        self.last_check_ = datetime.now() - self.safety_margin
+        self.last_check_time_ = time.time()
+        
+    def __stored_stamp(self, user_id):
+        '''
+        Returns (version, trained_at) of the stored model of user or None.
+        '''
+        stored_model = UserModel.objects(user_id = user_id).only("version", 
+                                                                 "trained_at").first()
+        if stored_model is None:
+            return None
+        
+        return stored_model.version, stored_model.trained_at
+        
+    def get(self, user_id):
+        '''
+        Returns the loaded user model of user.
+        '''
+        try:
+            #move to end as most recently used
+            user_model, stamp = self.models_.pop(user_id)
+        except KeyError:
+            #read before loading, a model saved in between is found by the next check
+            stamp = self.__stored_stamp(user_id)
+            
+            user_model = self.user_model_class(user_id = user_id,
+                                               extractor = self.extractor)
+            user_model.load()
+            
+            if len(self.models_) >= self.max_size:
+                self.models_.popitem(last = False)
+        
+        self.models_[user_id] = (user_model, stamp)
+        return user_model
+    
+    def invalidate(self, user_id):
+        self.models_.pop(user_id, None)
+        
+    def __len__(self):
+        return len(self.models_)
+        
+    def changed_users(self):
+        '''
+        Returns ids of users whose model was trained since the last check. 
+        Cached models which were loaded from an older stored model are removed.
+        
+        The database is only queried every check_interval seconds. Otherwise an
+        empty list is returned.
+        '''
+        if time.time() - self.last_check_time_ < self.check_interval:
+            return []
+        
+        try:
+            stored_models = [(m.user_id, (m.version, m.trained_at))
+                             for m 
+                             in UserModel.objects(trained_at__gte = self.last_check_).only("user_id",
+                                                                                           "version",
+                                                                                           "trained_at")]
+        except Exception as inst:
+            logger.error("Could not check for new user models due to error "
+                         "%s: %s" % (type(inst), inst))
+            return []
+        
+        self.last_check_time_ = time.time()
+        
+        user_ids = []
+        for user_id, stamp in stored_models:
+            #found again because of the safety margin
+            if self.reported_.get(user_id) == stamp:
+                continue
+            
+            self.reported_[user_id] = stamp
+            user_ids.append(user_id)
+            
+            cached = self.models_.get(user_id)
+            if cached is not None and cached[1] != stamp:
+                self.invalidate(user_id)
+        
+        #continue from the clock of the trainer
+        trained_ats = [stamp[1] for _, stamp in stored_models 
+                       if stamp[1] is not None]
+        if len(trained_ats) > 0:
+            self.last_check_ = max(self.last_check_, 
+                                   max(trained_ats) - self.safety_margin)
+            
+        #models before the window are not found again
+        for user_id, stamp in self.reported_.items():
+            if stamp[1] is None or stamp[1] < self.last_check_:
+                del self.reported_[user_id]
+            
+        if len(user_ids) > 0:
+            logger.info("%d user models were trained since last check." 
+                        % len(user_ids))
+            
+        return user_ids
+
 class StompListener(object):
     
     def __init__(self, config):
@@ -67,15 +206,58 @@ class StompListener(object):
         logger.info("Load feature extractor.")
         try:
             self.feature_extractor_ = EsaFeatureExtractor(prefix = self.config_["prefix"])
+            #outdated article features are extracted again by the user models
+            self.feature_extractor_.lemma_cache = LemmaCache()
         except Exception as inst:
             logger.error("Could not load feature extractor."
                          "Unknown error %s: %s" % (type(inst), inst))
             sys.exit(1)
         
-        self.ranker = ArticleRanker(extractor = self.feature_extractor_)        
+        ranker_config = self.config_.get('ranker', None) or {}
+        
+        user_model_class = getattr(user_models, 
+                                   ranker_config.get('user_model', 'UserModelCentroid'))
+        self.user_model_cache_ = UserModelCache(user_model_class = user_model_class,
+                                                extractor = self.feature_extractor_,
+                                                max_size = ranker_config.get('cache_size', 1000),
+                                                check_interval = ranker_config.get('check_interval', 60),
+                                                safety_margin = ranker_config.get('safety_margin', 300))
+        
+        if user_model_class is user_models.UserModelCentroid:
+            #centroid profiles of all users are kept in the ranking engine
+            self.ranking_engine_ = CentroidRankingEngine(
+                                    num_features = self.feature_extractor_.get_feature_number())
+            self.ranking_engine_.load()
+            self.ranker = ArticleRanker(extractor = self.feature_extractor_,
+                                        ranking_engine = self.ranking_engine_,
+                                        flush_size = ranker_config.get('flush_size', 1),
+                                        flush_interval = ranker_config.get('flush_interval', 0),
+                                        vendor_refresh_interval = ranker_config.get('vendor_refresh_interval', 300))
+        else:
+            self.ranking_engine_ = None
+            self.ranker = ArticleRanker(extractor = self.feature_extractor_,
+                                        user_model_cache = self.user_model_cache_,
+                                        flush_size = ranker_config.get('flush_size', 1),
+                                        flush_interval = ranker_config.get('flush_interval', 0),
+                                        vendor_refresh_interval = ranker_config.get('vendor_refresh_interval', 300))
+            
+    def refresh_user_models(self):
+        '''
+        Drops outdated user models from cache and ranking engine.
+        '''
+        for user_id in self.user_model_cache_.changed_users():
+            if self.ranking_engine_ is not None:
+                self.ranking_engine_.load_user(user_id)
             
     def rank_article(self, article_as_dict):
+        self.refresh_user_models()
         self.ranker.rank_article(article_as_dict)
+        
+    def flush_ratings(self, force = False):
+        '''
+        Writes pending ratings if the flush interval is reached or force is set.
+        '''
+        self.ranker.flush_ratings(force = force)
             
     def on_error(self, hears, message):
         logger.error('received an error %s' % message)
@@ -125,8 +307,10 @@ class ArticleRankerDaemon(Daemon):
             try:
                 trys = trys-1
                 
+                listener = StompListener(self.config_)
+                
                 conn = stomp.Connection()
-                conn.set_listener('', StompListener(self.config_))
+                conn.set_listener('', listener)
                 conn.start()
                 conn.connect()
                 
@@ -143,8 +327,33 @@ class ArticleRankerDaemon(Daemon):
         
         if connected:
             logger.info("Connected to STOMP broker")
-            while 1:
-                time.sleep(20)
+            
+            #pending ratings are written at least every flush interval
+            sleep_time = 20
+            flush_interval = listener.ranker.flush_interval
+            if flush_interval > 0:
+                sleep_time = min(sleep_time, flush_interval)
+            
+            #Daemon.stop() sends SIGTERM until the process is gone
+            def exit_on_sigterm(signum, frame):
+                signal.signal(signal.SIGTERM, signal.SIG_IGN)
+                sys.exit(0)
+            signal.signal(signal.SIGTERM, exit_on_sigterm)
+            
+            try:
+                while 1:
+                    time.sleep(sleep_time)
+                    listener.flush_ratings()
+            finally:
+                #no new articles are ranked while the last ratings are written
+                try:
+                    conn.disconnect()
+                except Exception as inst:
+                    logger.error("Could not disconnect from STOMP broker due to "
+                                 "error %s: %s" % (type(inst), inst))
+                    
+                logger.info("Write pending ratings before exit.")
+                listener.flush_ratings(force = True)
         
 if __name__ == "__main__":
     from optparse import OptionParser
@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+@author: Karsten Jeschkies <jeskar@web.de>
+
+The MIT License (MIT)
+Copyright (c) 2012-2013 Karsten Jeschkies <jeskar@web.de>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to use,
+copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the
+Software, and to permit persons to whom the Software is furnished to do so,
+subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+'''
+
+"""
+Ranks an article for all subscribers at once.
+
+The centroid profiles of all users are stacked row-wise into one sparse matrix
+with unit length rows. The cosine similarity of an article to every profile is
+then a single sparse matrix-vector product instead of one similarity index per
+user and article.
+"""
+
+from gensim import matutils
+import logging
+from models.mongodb_models import UserModel
+import numpy
+import scipy.sparse
+from user_models import UserModelCentroid
+
+logger = logging.getLogger("main")
+
+class CentroidRankingEngine(object):
+    '''
+    Keeps the learned centroid profiles of all users in memory.
+
+    A user can have more than one profile. Like UserModelCentroid.rank the
+    best fitting profile decides the ranking.
+    '''
+
+    def __init__(self, num_features, threshold = 0.3):
+        '''
+        num_features : Number of features of the feature extractor
+        threshold : Minimum cosine similarity for an article to be ranked as
+                    UserModelCentroid.READ
+        '''
+        self.num_features = num_features
+        self.threshold = threshold
+
+        #user id -> list of (feature ids, weights) tuples with unit length
+        self.profiles_ = {}
+
+        self.index_ = None
+        self.dirty_ = True
+
+    def load(self):
+        '''
+        Loads centroid profiles of all users from database.
+        '''
+        self.profiles_ = {}
+        self.dirty_ = True
+
+        user_models = UserModel.objects(version = UserModelCentroid.get_version())
+        for user_model in user_models.only("user_id", "data"):
+            self.set_profiles(user_model.user_id, user_model.data)
+
+        logger.info("Loaded centroid profiles of %d users." % len(self.profiles_))
+
+    def load_user(self, user_id):
+        '''
+        Reloads the centroid profiles of a single user from database.
+        '''
+        user_model = UserModel.objects(user_id = user_id,
+                                       version = UserModelCentroid.get_version()
+                                       ).only("user_id", "data").first()
+
+        if user_model is None:
+            self.remove_user(user_id)
+        else:
+            self.set_profiles(user_id, user_model.data)
+
+    def set_profiles(self, user_id, profiles):
+        '''
+        Replaces the profiles of user.
+
+        profiles : list of sparse vectors, i.e. lists of (feature id, weight)
+        '''
+        normalized_profiles = []
+        for profile in (profiles or []):
+            if len(profile) == 0:
+                continue
+
+            ids, weights = zip(*profile)
+            ids = numpy.asarray(ids, dtype = numpy.int32)
+            weights = numpy.asarray(weights, dtype = numpy.float32)
+
+            #features of an outdated extractor might not fit
+            mask = ids < self.num_features
+            ids, weights = ids[mask], weights[mask]
+
+            norm = numpy.sqrt(numpy.dot(weights, weights))
+            if norm == 0:
+                continue
+
+            normalized_profiles.append((ids, weights / norm))
+
+        if len(normalized_profiles) == 0:
+            self.remove_user(user_id)
+            return
+
+        self.profiles_[user_id] = normalized_profiles
+        self.dirty_ = True
+
+    def remove_user(self, user_id):
+        if self.profiles_.pop(user_id, None) is not None:
+            self.dirty_ = True
+
+    def __len__(self):
+        return len(self.profiles_)
+
+    def __build_index(self):
+        '''
+        Stacks all profiles into one csr matrix. Profiles of the same user are
+        in consecutive rows.
+        '''
+        self.user_ids_ = []
+        self.position_ = {}
+        block_starts = []
+
+        indptr = [0]
+        indices = []
+        data = []
+        for user_id, profiles in self.profiles_.iteritems():
+            self.position_[user_id] = len(self.user_ids_)
+            self.user_ids_.append(user_id)
+            block_starts.append(len(indptr) - 1)
+
+            for ids, weights in profiles:
+                indices.append(ids)
+                data.append(weights)
+                indptr.append(indptr[-1] + len(ids))
+
+        num_rows = len(indptr) - 1
+        if num_rows == 0:
+            self.index_ = None
+        else:
+            self.index_ = scipy.sparse.csr_matrix((numpy.concatenate(data),
+                                                   numpy.concatenate(indices),
+                                                   numpy.asarray(indptr)),
+                                                  shape = (num_rows,
+                                                           self.num_features))
+        self.block_starts_ = numpy.asarray(block_starts, dtype = numpy.intp)
+        self.dirty_ = False
+
+        logger.debug("Built ranking index with %d profiles of %d users." %
+                     (num_rows, len(self.user_ids_)))
+
+    def __best_similarities(self, features):
+        '''
+        Returns the best cosine similarity of features to the profiles of each
+        user as array in order of self.user_ids_ or None if there are no profiles.
+        '''
+        if self.dirty_:
+            self.__build_index()
+
+        if self.index_ is None:
+            return None
+
+        vector = matutils.unitvec(matutils.sparse2full(features,
+                                                       self.num_features))
+
+        #cosine similarity of article to each profile
+        sims = self.index_.dot(vector)
+
+        #best fitting profile of each user
+        return numpy.maximum.reduceat(sims, self.block_starts_)
+
+    def similarities(self, features):
+        '''
+        Returns dict user id -> best cosine similarity of features to the
+        profiles of user.
+
+        features : sparse vector, list of (feature id, weight)
+        '''
+        best_sims = self.__best_similarities(features)
+
+        if best_sims is None:
+            return {}
+
+        return dict((user_id, float(best_sims[pos]))
+                    for user_id, pos in self.position_.iteritems())
+
+    def rank(self, features, user_ids):
+        '''
+        Ranks an article for each user.
+
+        Returns list of (user id, ranking) tuples. Users without a learned profile
+        get UserModelCentroid.UNREAD.
+
+        features : sparse vector of article, list of (feature id, weight)
+        user_ids : iterable of user ids
+        '''
+        best_sims = self.__best_similarities(features)
+
+        rankings = []
+        for user_id in user_ids:
+            pos = None if best_sims is None else self.position_.get(user_id)
+
+            if pos is None:
+                logger.debug("No learned profile for user %s." % user_id)
+                rankings.append((user_id, UserModelCentroid.UNREAD))
+            elif best_sims[pos] > self.threshold:
+                rankings.append((user_id, UserModelCentroid.READ))
+            else:
+                rankings.append((user_id, UserModelCentroid.UNREAD))
+
+        return rankings
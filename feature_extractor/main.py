@@ -28,8 +28,10 @@ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 from feature_extractor.extractors import EsaFeatureExtractor
 import json
 import logging
+import multiprocessing
 import socket
 import sys
+import threading
 import time
 from utils.daemon import Daemon
 import stomp #needs to be after daemon for some reason
@@ -41,41 +43,165 @@ Text features are then extracted based on a feature model learned in an offline
 process. The articles are then send on to the article ranker.
 """
 
+#The extractor is loaded once before the worker processes are forked. Workers
+#share its read-only models with the parent.
+extractor = None
+
+def extract_features(message):
+    '''
+    Extracts features from clean content and adds them to message.
+    
+    Returns message or None if features could not be extracted. Never raises,
+    so the pool always calls back with a result.
+    '''
+    logger = logging.getLogger("main")
+    
+    try:
+        logger.debug("Got article '%s'" % message.get('headline'))
+        
+        features = extractor.get_features(message['clean_content'])
+        version = extractor.get_version()
+        
+        #add features to json representation of article
+        message['features'] = {'version': version, 
+                               'data': features}
+    except Exception as inst:
+        logger.error("Could not extract features. "
+                     "Unknown Error %s: %s" % (type(inst), inst))
+        return None
+    
+    return message
+
 class StompListener(object):
     
     def __init__(self, config):
+        '''
+        The number of worker processes is set with extractor/workers in config.
+        With 0 (default) features are extracted in the listener callback.
+        If extractor/ordered is true (default) articles are sent on in the order
+        they were received. An article whose features are not extracted after
+        extractor/timeout seconds (default 60), e.g. because its worker died, 
+        is dropped.
+        '''
+        global extractor
+        
         self.config_ = config
         self.logger_ = logging.getLogger("main")
         
+        extractor_config = config.get('extractor', None) or {}
+        self.num_workers = extractor_config.get('workers', 0)
+        self.ordered = extractor_config.get('ordered', True)
+        self.timeout = extractor_config.get('timeout', 60)
+        
         self.extractor = EsaFeatureExtractor(prefix = config['prefix'])
+        extractor = self.extractor
+        
+        self.pool_ = None
+        if self.num_workers > 0:
+            self.logger_.info("Start %d extractor processes." % self.num_workers)
+            self.pool_ = multiprocessing.Pool(self.num_workers)
+            
+            #limit number of articles waiting for a worker
+            self.pending_ = threading.BoundedSemaphore(2 * self.num_workers)
+            
+            #results which wait for their predecessors if ordered
+            self.results_lock_ = threading.Lock()
+            self.results_ = {}
+            self.next_received_ = 0
+            self.next_to_send_ = 0
+            
+            #sequence number -> time the article was given to the pool
+            self.in_flight_ = {}
+            
+            watchdog = threading.Thread(target = self.__drop_timed_out)
+            watchdog.daemon = True
+            watchdog.start()
  
-    def __extract_features(self, message):
+    def __send(self, message):
         '''
-        Extracts features from clean content and sends it on
+        Sends message on to Article Ranker
         '''
-
-        self.logger_.debug("Got article '%s'" % message['headline'])
-
-        features = self.extractor.get_features(message['clean_content'])
-        version = self.extractor.get_version()
+        if message is None:
+            return
         
-        #add features to json representation of article
-        message['features'] = {'version': version, 
-                               'data': features}
-        
-        #send message on to Article Ranker
         try:
             self.conn_.send(json.dumps(message), destination="queue/features")
         except Exception as inst:
             self.logger_.error("Could not send message to feature queue. "
                                "Unknown Error %s: %s" % (type(inst), inst))
+            
+    def __drop_timed_out(self):
+        '''
+        Gives up on articles which are not extracted within the timeout. The
+        pool never calls back for them if their worker died.
+        '''
+        while True:
+            time.sleep(max(1, self.timeout / 10.0))
+            
+            now = time.time()
+            with self.results_lock_:
+                timed_out = [sequence_number 
+                             for sequence_number, start 
+                             in self.in_flight_.iteritems()
+                             if now - start > self.timeout]
+            
+            for sequence_number in timed_out:
+                self.logger_.error("Features of article %d were not extracted "
+                                   "within %d s. Drop article." % 
+                                   (sequence_number, self.timeout))
+                self.__on_result(sequence_number, None)
+            
+    def __on_result(self, sequence_number, message):
+        '''
+        Called in the result thread of the pool for each processed article 
+        and for articles which timed out. A failed article is None and 
+        skipped in order.
+        '''
+        with self.results_lock_:
+            #result of an article which already timed out
+            if self.in_flight_.pop(sequence_number, None) is None:
+                return
+            
+            self.pending_.release()
+            
+            if not self.ordered:
+                self.__send(message)
+                return
+            
+            self.results_[sequence_number] = message
+            
+            #send all results which are complete in order
+            while self.next_to_send_ in self.results_:
+                self.__send(self.results_.pop(self.next_to_send_))
+                self.next_to_send_ += 1
     
     def on_error(self, hears, message):
         self.logger_ .error('received an error %s' % message)
         
     def on_message(self, headers, message):
         received_message = json.loads(message)
-        self.__extract_features(received_message)
+        
+        if self.pool_ is None:
+            self.__send(extract_features(received_message))
+            return
+        
+        #block if workers are busy
+        self.pending_.acquire()
+        
+        sequence_number = self.next_received_
+        self.next_received_ += 1
+        
+        with self.results_lock_:
+            self.in_flight_[sequence_number] = time.time()
+            
+        try:
+            self.pool_.apply_async(extract_features, (received_message,),
+                                   callback = lambda result: self.__on_result(sequence_number, 
+                                                                              result))
+        except Exception as inst:
+            self.logger_.error("Could not pass article to extractor processes. "
+                               "Unknown Error %s: %s" % (type(inst), inst))
+            self.__on_result(sequence_number, None)
         
     def set_stomp_connection(self, connection):
         self.conn_ = connection
@@ -118,14 +244,15 @@ class FeatureExtractorDaemon(Daemon):
         
         hosts = [('localhost', 61613)]
         
+        #load models and start workers only once
+        listener = StompListener(self.config_)
+        
         connected = False
         trys = 5
         while not connected:
             try:
                 trys = trys-1
                 
-                listener = StompListener(self.config_)
-                
                 conn = stomp.Connection()
                 conn.set_listener('', listener)
                 conn.start()
@@ -29,9 +29,9 @@ Created on 12.12.2012
 
 Implementation of a centroid classifier
 '''
-from gensim.similarities import MatrixSimilarity
 import numpy as np
-from sklearn.utils import array2d
+from sklearn.utils import atleast2d_or_csr
+from sklearn.utils.extmath import safe_sparse_dot
 
 class CentroidClassifier(object):
     '''
@@ -71,9 +71,12 @@ class CentroidClassifier(object):
         for i, y_i in enumerate(unique_y):
             centroids[i, :] = np.mean(X[y == y_i, :], axis=0)
             
-        #Build similarity index from centroids
-        self.similarity_index = MatrixSimilarity(corpus = centroids,
-                                                 num_features = n_features)
+        self.centroids_ = centroids
+        
+        #Normalize centroids to unit length for cosine similarity
+        norms = np.sqrt(np.sum(centroids ** 2, axis=1))
+        norms[norms == 0] = 1.0
+        self.unit_centroids_ = centroids / norms[:, np.newaxis]
         
     def predict(self, X):
         """
@@ -88,13 +91,11 @@ class CentroidClassifier(object):
         C : array, shape = [n_samples]
             Predicted target values for X
         """
-        X = array2d(X)
+        X = atleast2d_or_csr(X)
         
-        n_samples = X.shape[0]
-        predictions = np.empty(shape=(n_samples))
-        for i, sample in enumerate(X):
-            similarities = self.similarity_index[sample]
-            class_id = np.argmax(similarities)
-            predictions[i] = self.classes[class_id]
+        #cosine similarity of all samples to all centroids. The samples do
+        #not have to be normalized to find the closest centroid.
+        similarities = safe_sparse_dot(X, self.unit_centroids_.T)
+        class_ids = np.asarray(np.argmax(similarities, axis=1)).ravel()
         
-        return predictions
\ No newline at end of file
+        return self.classes[class_ids].astype(np.float64)
\ No newline at end of file
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+The MIT License (MIT)
+Copyright (c) 2012-2013 Karsten Jeschkies <jeskar@web.de>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of 
+this software and associated documentation files (the "Software"), to deal in 
+the Software without restriction, including without limitation the rights to use, 
+copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the 
+Software, and to permit persons to whom the Software is furnished to do so, 
+subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all 
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, 
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A 
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT 
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION 
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE 
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+'''
+
+'''
+@author: karsten jeschkies <jeskar@web.de>
+
+Checkpoints of long running model builds.
+
+A checkpoint is a pickled state object. It is written to a temporary file
+first and then renamed so that a crash while writing never leaves a broken
+checkpoint behind.
+'''
+
+from gensim import utils
+import logging
+import os
+
+logger = logging.getLogger('gensim.models.esamodel')
+
+def save_checkpoint(state, fname):
+    tmp_fname = fname + '.tmp'
+    utils.pickle(state, tmp_fname)
+    os.rename(tmp_fname, fname)
+    
+    logger.debug("Saved checkpoint %s." % fname)
+
+def load_checkpoint(fname):
+    '''
+    Returns the state saved in fname or None if there is no checkpoint.
+    '''
+    if not os.path.exists(fname):
+        return None
+    
+    logger.info("Resuming from checkpoint %s." % fname)
+    return utils.unpickle(fname)
@@ -37,6 +37,7 @@ by Gabrilovich, E. and Markovitch, S.
 in "Proceedings of the 20th international joint conference on artificial intelligence"
 '''
 
+from checkpoint import save_checkpoint, load_checkpoint
 from collections import defaultdict
 from gensim.similarities import Similarity, MatrixSimilarity
 from itertools import izip
@@ -45,8 +46,10 @@ import itertools
 from kmedoids import KMedoids 
 import math
 import numpy as np
+import os
 import scipy
-from selectkbest import iSelectKBest, if_classif
+import scipy.sparse
+from selectkbest import iSelectKBest, if_classif, ClassifAccumulator
 
 from gensim import interfaces, matutils, utils, similarities
 
@@ -105,7 +108,12 @@ class CosineEsaModel(interfaces.TransformationABC):
                  test_corpus, test_corpus_targets, num_test_corpus,
                  num_best_features = 1000,
                  num_features = None,
-                 tmp_path = 'complete_similarity'):
+                 tmp_path = 'complete_similarity',
+                 num_best = None,
+                 threshold = None,
+                 checkpoint_prefix = None,
+                 checkpoint_interval = 1000,
+                 processes = 1):
         """
         The similarity between a document and each document of the corpus is
         the feature created.
@@ -126,8 +134,22 @@ class CosineEsaModel(interfaces.TransformationABC):
         num_best_features : Number of features which should be selected for cESA model.
                             If one wants to use all concepts as features the she has
                             to set num_best_features to the size of corpus.
+        num_best : If set only the num_best strongest concepts of a document are
+                   returned. See __getitem__.
+        threshold : If set only concepts with a weight >= threshold are returned.
+        checkpoint_prefix : If set the similarity index of corpus and the state
+                            of the feature selection are saved with this prefix
+                            every checkpoint_interval test documents. A build
+                            with the same prefix resumes from the checkpoint.
+                            Use a new prefix for a different corpus.
+        processes : With processes > 1 the test corpus is split into chunks 
+                    which are transformed and accumulated for the feature 
+                    selection by a pool of processes.
         """
         
+        self.num_best = num_best
+        self.threshold = threshold
+        
         if num_features is None:
             logger.info("scanning corpus to determine the number of features")
             num_features = 1 + utils.get_max_id(corpus)
@@ -135,23 +157,67 @@ class CosineEsaModel(interfaces.TransformationABC):
         self.num_features = num_features
         
         #create similarity index of complete corpus
-        complete_similarity_index = Similarity(output_prefix = tmp_path,
-                                                    corpus = corpus,
-                                                    num_features = self.num_features)
+        complete_similarity_index = None
+        if checkpoint_prefix is not None:
+            index_fname = checkpoint_prefix + '.similarity'
+            tmp_path = checkpoint_prefix + '.shard'
+            if os.path.exists(index_fname):
+                logger.info("Resuming with similarity index %s." % index_fname)
+                complete_similarity_index = Similarity.load(index_fname)
+        
+        if complete_similarity_index is None:
+            complete_similarity_index = Similarity(output_prefix = tmp_path,
+                                                   corpus = corpus,
+                                                   num_features = self.num_features)
+            if checkpoint_prefix is not None:
+                complete_similarity_index.save(index_fname)
         
         #reduce concept count by feature selection
         self.selector = iSelectKBest(if_classif, k = num_best_features)
         
+        #continue feature selection after the last checkpointed test document
+        accumulator = None
+        checkpoint = None
+        if checkpoint_prefix is not None:
+            selection_fname = checkpoint_prefix + '.selection'
+            accumulator = load_checkpoint(selection_fname)
+            checkpoint = lambda accumulator: save_checkpoint(accumulator, 
+                                                             selection_fname)
+            
+        if accumulator is None:
+            accumulator = ClassifAccumulator(len(document_titles))
+            
         #transform each document of test_corpus
-        logger.info("Test corpus of %d documents..." % num_test_corpus)
+        logger.info("Test corpus of %d documents, %d done..." % 
+                    (num_test_corpus, accumulator.n_samples))
             
-        transformed_test_corpus = (complete_similarity_index[doc]
-                                   for doc 
-                                   in test_corpus)
+        remaining_test_corpus = itertools.islice(test_corpus, 
+                                                 accumulator.n_samples, None)
+        test_targets = itertools.islice(test_corpus_targets, 
+                                        accumulator.n_samples, None)
+        
+        if processes > 1:
+            #the workers query the similarity index document by document, a
+            #dense chunk of similarities to all concepts would be too big
+            transform = lambda doc: complete_similarity_index[doc]
+            X_y = izip(remaining_test_corpus, test_targets)
+        else:
+            transform = None
+            transformed_test_corpus = (complete_similarity_index[doc]
+                                       for doc 
+                                       in remaining_test_corpus)
+            X_y = izip(transformed_test_corpus, test_targets)
 
         logger.info("Select best features...")
-        X_y = izip(transformed_test_corpus, test_corpus_targets)
-        self.selector.fit(X_y, len(document_titles))
+        self.selector.fit(X_y, len(document_titles),
+                          accumulator = accumulator,
+                          checkpoint = checkpoint,
+                          checkpoint_interval = checkpoint_interval,
+                          processes = processes,
+                          transform = transform)
+        
+        if checkpoint is not None:
+            checkpoint(accumulator)
         
         logger.info("Done selecting.")
         
@@ -189,6 +255,10 @@ class CosineEsaModel(interfaces.TransformationABC):
         Return esa representation of the input vector and/or corpus.
         
         bow should already be weights, e.g. with TF-IDF
+        
+        The shifted similarities are almost never zero. If num_best or threshold
+        is set only the strongest concepts are kept to get a truly sparse 
+        vector. The kept weights are normalized to unit length.
         """
         # if the input vector is in fact a corpus, return a transformed corpus 
         # as a result
@@ -199,34 +269,83 @@ class CosineEsaModel(interfaces.TransformationABC):
         #use similarity index to calculate similarity with each vector of corpus
         vector = self.similarity_index[bow]
         
+        return self.__sparsify(vector, eps)
+    
+    def __sparsify(self, vector, eps):
+        '''
+        Returns the sparse vector of the (best) concepts of the cosine 
+        similarities in vector. vector is changed.
+        '''
         #consine similarity is in [-1, 1] shift and scale to make it [0, 1]
         vector += 1
         vector /= 2
+        
+        #models saved before top-k output have no num_best and threshold
+        num_best = getattr(self, 'num_best', None)
+        threshold = getattr(self, 'threshold', None)
+        
+        concept_ids = np.arange(len(vector))
+        if num_best is not None and num_best < len(vector):
+            #partial sort, the order of the best concepts does not matter
+            start = len(vector) - num_best
+            concept_ids = np.argpartition(vector, start - 1)[start:]
+            concept_ids.sort()
+        if threshold is not None:
+            concept_ids = concept_ids[vector[concept_ids] >= threshold]
+        weights = vector[concept_ids]
 
         #normalize
-        vector = matutils.unitvec(vector)
+        weights = matutils.unitvec(weights)
 
         # make sure there are no explicit zeroes in the vector (must be sparse)
-        vector = [(concept_id, weight) 
-                  for concept_id, weight 
-                  in enumerate(vector) 
-                  if abs(weight) > eps]
-        return vector
+        mask = np.abs(weights) > eps
+        return zip(concept_ids[mask].tolist(), weights[mask].tolist())
+    
+    def transform_matrix(self, X, eps=1e-12):
+        '''
+        Transforms several documents at once. The cosine similarities of all
+        documents to all concepts are one matrix product.
+        
+        X : Dense or sparse matrix, shape = [n_documents, num_features]
+        
+        Returns list of cesa representations, one for each row of X.
+        '''
+        X = scipy.sparse.csr_matrix(X, dtype = np.float32)
+        
+        #normalize documents, the rows of the index are already unit length
+        lengths = np.sqrt(np.asarray(X.multiply(X).sum(axis = 1)).ravel())
+        lengths[lengths == 0] = 1
+        X = scipy.sparse.spdiags(1 / lengths, 0, len(lengths), len(lengths)) * X
+        
+        sims = np.asarray(X * self.similarity_index.index.T)
+        
+        return [self.__sparsify(vector, eps) for vector in sims]
     
     def save(self, fname):
         '''
         See MatrixSimilarity.save()
+        
+        The matrix of the similarity index is stored in fname.matrix.npy to be 
+        loaded memory-mapped. The similarity index without it is pickled to 
+        fname.index.
         '''
-        logger.info("storing %s object to %s and %s" % (self.__class__.__name__, 
-                                                        fname, 
-                                                        fname + '.index'))
+        logger.info("storing %s object to %s, %s and %s" % (self.__class__.__name__, 
+                                                            fname, 
+                                                            fname + '.index',
+                                                            fname + '.matrix.npy'))
         # first, remove the similarity index from self., so it doesn't get pickled
         sim = self.similarity_index
+        index = sim.index
         del self.similarity_index
+        sim.index = None
         try:
-            sim.save(fname + ".index")
+            #MatrixSimilarity.save() of gensim writes fname.index.npy itself,
+            #the similarity index is pickled directly to not overwrite anything
+            np.save(fname + ".matrix.npy", index)
+            utils.pickle(sim, fname + ".index")
             utils.pickle(self, fname) # store index-less object
         finally:
+            sim.index = index
             self.similarity_index = sim
         
 
@@ -239,6 +358,15 @@ class CosineEsaModel(interfaces.TransformationABC):
                                                           fname, 
                                                           fname + ".index"))
         result = utils.unpickle(fname)
-        result.similarity_index = MatrixSimilarity.load(fname + ".index")
+        result.similarity_index = utils.unpickle(fname + ".index")
+        
+        #older models were saved with MatrixSimilarity.save() which stores the
+        #matrix in fname.index.npy
+        if getattr(result.similarity_index, 'index', None) is None:
+            matrix_fname = fname + ".matrix.npy"
+            if not os.path.exists(matrix_fname):
+                matrix_fname = fname + ".index.npy"
+            result.similarity_index.index = np.load(matrix_fname, 
+                                                    mmap_mode = 'r') # load back as read-only
         return result
 #endclass CosineEsaModel
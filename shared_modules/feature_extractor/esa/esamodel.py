@@ -40,6 +40,7 @@ import itertools
 from kmedoids import KMedoids 
 import math
 import numpy
+import scipy.sparse
 
 from gensim import interfaces, matutils, utils, similarities
 
@@ -105,7 +106,8 @@ class EsaModel(interfaces.TransformationABC):
     Model persistency is achieved via its load/save methods.
     """
     def __init__(self, corpus, document_titles, num_clusters = None,
-                 num_features = None):
+                 num_features = None, sparse = False, cluster_init = 'random',
+                 cluster_batch_size = None, checkpoint_prefix = None):
         """
         Computes the interpreter matrix by calculating the TF-IDF value of each
         token in each concept (doc) in corpus.
@@ -114,6 +116,16 @@ class EsaModel(interfaces.TransformationABC):
         num_features gives the number of features of corpus
         
         If num_clusters == None all documents are used as concepts.
+        
+        If sparse is True the interpreter matrix is kept as sparse csc matrix.
+        See to_sparse().
+        
+        cluster_init is the seeding method of the clusterer, 'random' or 
+        'kmedoids++'. With cluster_batch_size the clusterer runs in mini-batch 
+        mode. See KMedoids.
+        
+        If checkpoint_prefix is set the clusterer saves its state after each
+        iteration and resumes from it when the model is built again.
         """
         
         if not num_clusters:
@@ -132,7 +144,10 @@ class EsaModel(interfaces.TransformationABC):
         clusterer = KMedoids(corpus = corpus, 
                              num_features = self.num_features,
                              num_clusters = self.num_clusters,
-                             max_iterations = 10)
+                             max_iterations = 10,
+                             init = cluster_init,
+                             batch_size = cluster_batch_size,
+                             checkpoint_prefix = checkpoint_prefix)
         clusters = clusterer.cluster()
         
         #set the corpus to medoids
@@ -140,6 +155,8 @@ class EsaModel(interfaces.TransformationABC):
         #each column is a doc and is seen as a concept
         self.corpus = clusterer.get_medoids().T
         
+        if sparse:
+            self.to_sparse()
         
         #reduce document titles
         self.document_titles = DocumentTitles()
@@ -158,6 +175,26 @@ class EsaModel(interfaces.TransformationABC):
     def __str__(self):
         return " \n".join(self.document_titles)
     
+    def is_sparse(self):
+        return scipy.sparse.issparse(self.corpus)
+    
+    def to_sparse(self, eps = 0.0):
+        '''
+        Converts the interpreter matrix to a sparse csc matrix. Entries with
+        an absolute value <= eps are dropped.
+        
+        For a sparse input document only the rows of its tokens have to be
+        touched during the transformation.
+        '''
+        corpus = numpy.asarray(self.corpus)
+        if eps > 0:
+            corpus = numpy.where(numpy.abs(corpus) > eps, corpus, 0)
+        self.corpus = scipy.sparse.csc_matrix(corpus, dtype = numpy.float32)
+        
+        logger.info("Interpreter matrix has %d non-zero entries (%.2f%%)." % 
+                    (self.corpus.nnz, 
+                     100.0 * self.corpus.nnz / max(1, numpy.prod(self.corpus.shape))))
+    
     def get_concept_titles(self, doc_vec):
         '''
         Converts ids from document vector to concept titles.
@@ -177,36 +214,94 @@ class EsaModel(interfaces.TransformationABC):
         if is_corpus:
             return self._apply(bow)
 
-        #use corpus as interpreter matrix
-        #simply multiply feature vector of input with corpus matrix
-        #to get the weight of the concept
-        vector = numpy.dot(matutils.sparse2full(bow, self.num_features),
-                          self.corpus)
-
+        if self.is_sparse():
+            #sparse vector times sparse interpreter matrix
+            if len(bow) == 0:
+                return []
+            ids, weights = zip(*bow)
+            vector = scipy.sparse.csr_matrix((weights, 
+                                              (numpy.zeros(len(ids)), ids)),
+                                             shape = (1, self.num_features),
+                                             dtype = numpy.float32)
+            result = (vector * self.corpus).tocsr()
+            result.sort_indices()
+            
+            concept_ids = result.indices
+            weights = result.data
+        else:
+            #use corpus as interpreter matrix
+            #simply multiply feature vector of input with corpus matrix
+            #to get the weight of the concept
+            weights = numpy.dot(matutils.sparse2full(bow, self.num_features),
+                                self.corpus)
+            concept_ids = numpy.arange(len(weights))
 
+        return self.__sparsify(concept_ids, weights, eps)
+    
+    def __sparsify(self, concept_ids, weights, eps):
+        '''
+        Normalizes weights and returns the sparse vector of all concepts with
+        a weight > eps.
+        '''
         #normalize
-        vector = matutils.unitvec(vector)
+        length = numpy.sqrt(numpy.dot(weights, weights))
+        if length > 0:
+            weights = weights / length
 
         # make sure there are no explicit zeroes in the vector (must be sparse)
-        vector = [(concept_id, weight) 
-                  for concept_id, weight 
-                  in enumerate(vector) 
-                  if abs(weight) > eps]
-        return vector
+        mask = numpy.abs(weights) > eps
+        return zip(concept_ids[mask].tolist(), weights[mask].tolist())
+    
+    def transform_matrix(self, X, eps=1e-12):
+        '''
+        Transforms several documents at once with one matrix-matrix product.
+        
+        X : Dense or sparse matrix, shape = [n_documents, num_features]
+        
+        Returns list of esa representations, one for each row of X.
+        '''
+        if self.is_sparse():
+            result = (scipy.sparse.csr_matrix(X, dtype = numpy.float32) * self.corpus).tocsr()
+            result.sort_indices()
+            
+            return [self.__sparsify(result.indices[result.indptr[i]:result.indptr[i + 1]],
+                                    result.data[result.indptr[i]:result.indptr[i + 1]],
+                                    eps)
+                    for i in xrange(result.shape[0])]
+        
+        if scipy.sparse.issparse(X):
+            result = numpy.asarray(X * self.corpus)
+        else:
+            result = numpy.dot(X, self.corpus)
+            
+        concept_ids = numpy.arange(result.shape[1])
+        return [self.__sparsify(concept_ids, weights, eps) for weights in result]
     
     def save(self, fname):
         '''
         See MatrixSimilarity.save()
+        
+        A sparse interpreter matrix is stored as its data, indices and indptr
+        arrays in fname.data.npy, fname.indices.npy and fname.indptr.npy.
         '''
-        logger.info("storing %s object to %s and %s" % (self.__class__.__name__, 
-                                                        fname, 
-                                                        fname + '.npy'))
         # first, remove the index from self.__dict__, so it doesn't get pickled
         index = self.corpus
         del self.corpus
         try:
+            if scipy.sparse.issparse(index):
+                logger.info("storing %s object to %s and sparse matrix to %s.*.npy" % 
+                            (self.__class__.__name__, fname, fname))
+                self.sparse_shape = index.shape
+                numpy.save(fname + '.data.npy', index.data)
+                numpy.save(fname + '.indices.npy', index.indices)
+                numpy.save(fname + '.indptr.npy', index.indptr)
+            else:
+                logger.info("storing %s object to %s and %s" % (self.__class__.__name__, 
+                                                                fname, 
+                                                                fname + '.npy'))
+                self.sparse_shape = None
+                numpy.save(fname + '.npy', index) # store index
             utils.pickle(self, fname) # store index-less object
-            numpy.save(fname + '.npy', index) # store index
         finally:
             self.corpus = index
 
@@ -218,6 +313,15 @@ class EsaModel(interfaces.TransformationABC):
         """
         logger.info("loading %s object from %s" % (cls.__name__, fname))
         result = utils.unpickle(fname)
-        result.corpus = numpy.load(fname + '.npy', mmap_mode='r') # load back as read-only
+        
+        sparse_shape = getattr(result, 'sparse_shape', None)
+        if sparse_shape is None:
+            result.corpus = numpy.load(fname + '.npy', mmap_mode='r') # load back as read-only
+        else:
+            result.corpus = scipy.sparse.csc_matrix(
+                                (numpy.load(fname + '.data.npy', mmap_mode='r'),
+                                 numpy.load(fname + '.indices.npy', mmap_mode='r'),
+                                 numpy.load(fname + '.indptr.npy', mmap_mode='r')),
+                                shape = sparse_shape)
         return result
 #endclass EsaModel
\ No newline at end of file
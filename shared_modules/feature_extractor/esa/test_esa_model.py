@@ -31,6 +31,7 @@ The tests are not complete and were used for debugging.
 '''
 
 from esamodel import EsaModel, DocumentTitles
+from gensim import matutils
 from gensim.corpora import Dictionary, MmCorpus
 from gensim.models import tfidfmodel
 import logging
@@ -87,6 +88,46 @@ class TestESAModel(unittest.TestCase):
         
         for concept_id, weight in sorted(esa_test_doc, key=lambda item: -item[1]):
             print "%s %.3f" % (esa_model.document_titles[concept_id], weight)
+
+    def test_sparse_interpreter_matrix(self):
+        tfidf_model = tfidfmodel.TfidfModel(corpus, normalize=True)
+        esa_model = EsaModel(tfidf_model[corpus], num_clusters = 9, 
+                             document_titles = concepts,
+                             num_features = len(dictionary))
+        
+        tfidf_test_doc = tfidf_model[dictionary.doc2bow(['user', 'computer', 'time'])]
+        dense_esa_test_doc = esa_model[tfidf_test_doc]
+        
+        esa_model.to_sparse()
+        self.assertTrue(esa_model.is_sparse())
+        sparse_esa_test_doc = esa_model[tfidf_test_doc]
+        
+        self.assertEqual([concept_id for concept_id, _ in dense_esa_test_doc],
+                         [concept_id for concept_id, _ in sparse_esa_test_doc])
+        for (_, dense_weight), (_, sparse_weight) in zip(dense_esa_test_doc, 
+                                                         sparse_esa_test_doc):
+            self.assertAlmostEqual(dense_weight, sparse_weight, 5)
+
+    def test_transform_matrix(self):
+        tfidf_model = tfidfmodel.TfidfModel(corpus, normalize=True)
+        esa_model = EsaModel(tfidf_model[corpus], num_clusters = 9, 
+                             document_titles = concepts,
+                             num_features = len(dictionary))
+        
+        tfidf_test_docs = [tfidf_model[dictionary.doc2bow(text)] 
+                           for text in [['user', 'computer', 'time'], ['graph', 'trees']]]
+        X = matutils.corpus2csc(tfidf_test_docs, num_terms = len(dictionary)).T
+        
+        for sparse in [False, True]:
+            if sparse:
+                esa_model.to_sparse()
+            
+            for esa_test_doc, batch_esa_test_doc in zip([esa_model[doc] for doc in tfidf_test_docs],
+                                                        esa_model.transform_matrix(X)):
+                self.assertEqual(dict(esa_test_doc).keys(), 
+                                 dict(batch_esa_test_doc).keys())
+                for (_, weight), (_, batch_weight) in zip(esa_test_doc, batch_esa_test_doc):
+                    self.assertAlmostEqual(weight, batch_weight, 5)
          
     #@unittest.skip("Skip bigger test") 
     def test_constructor_with_file_wikicorpus(self):
@@ -28,25 +28,125 @@ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 An extractor creates a feature vector from a text. This implementation relies
 heavily on gensim. Som additions were made to gensim. See esamodel.
 
-All extractors have to load at least one feature model.
+All extractors have to load at least one feature model. If there is a model
+bundle for the prefix (see model_bundle) the dictionary, LDA and cESA model are 
+loaded memory-mapped.
 '''
 
 from esa.esamodel import EsaModel
-from esa.cosine_esamodel import CosineEsaModel
-from gensim import corpora, models, utils
+from gensim import matutils, models, utils
 import logging
+from model_bundle import load_cesa, load_dictionary, load_lda
+import multiprocessing
+import numpy
+import scipy.sparse
 
 logger = logging.getLogger("extractor")
 
+def lemmatize_batch(documents, processes = 1):
+    '''
+    Lemmatizes each document. If processes > 1 the documents are lemmatized by
+    a pool of processes.
+    
+    Returns list of token lists.
+    '''
+    if processes <= 1:
+        return [utils.lemmatize(document) for document in documents]
+    
+    pool = multiprocessing.Pool(processes)
+    try:
+        return pool.map(utils.lemmatize, documents, 
+                        chunksize = max(1, len(documents) / (4 * processes)))
+    finally:
+        pool.terminate()
+        
+def bow_matrix(dictionary, token_lists):
+    '''
+    Returns the bag-of-words of all token lists as sparse csr matrix,
+    shape = [n_documents, len(dictionary)].
+    '''
+    bows = [dictionary.doc2bow(tokens) for tokens in token_lists]
+    return matutils.corpus2csc(bows, num_terms = len(dictionary),
+                               num_docs = len(bows)).T.tocsr()
+    
+def tfidf_matrix(tfidf_model, X):
+    '''
+    Transforms each row of the bag-of-words matrix X like tfidf_model[bow].
+    '''
+    num_terms = X.shape[1]
+    
+    idfs = numpy.zeros(num_terms)
+    for term_id, idf in tfidf_model.idfs.iteritems():
+        if term_id < num_terms:
+            idfs[term_id] = idf
+    
+    X = X * scipy.sparse.spdiags(idfs, 0, num_terms, num_terms)
+    X = X.tocsr()
+    X.eliminate_zeros()
+    
+    if getattr(tfidf_model, 'normalize', True):
+        lengths = numpy.sqrt(numpy.asarray(X.multiply(X).sum(axis = 1)).ravel())
+        lengths[lengths == 0] = 1
+        X = scipy.sparse.spdiags(1 / lengths, 0, len(lengths), len(lengths)) * X
+        
+    return X.tocsr()
+
+def lda_matrix(lda_model, X, eps = 0.01):
+    '''
+    Infers the topic distribution of each row of X in one inference call like
+    lda_model[doc]. Topics with a probability < eps are set to 0.
+    
+    Returns dense array, shape = [n_documents, num_topics].
+    '''
+    gamma, _ = lda_model.inference(list(matutils.Sparse2Corpus(X, 
+                                                              documents_columns = False)))
+    topic_dists = gamma / gamma.sum(axis = 1)[:, numpy.newaxis]
+    topic_dists[topic_dists < eps] = 0
+    return topic_dists
+
+def matrix_to_vectors(X):
+    '''
+    Converts each row of sparse matrix X to a gensim sparse vector.
+    '''
+    X = scipy.sparse.csr_matrix(X)
+    X.sort_indices()
+    return [zip(X.indices[X.indptr[i]:X.indptr[i + 1]].tolist(),
+                X.data[X.indptr[i]:X.indptr[i + 1]].tolist())
+            for i in xrange(X.shape[0])]
+
 class Extractor:
     '''
     Extractor interface
+    
+    If lemma_cache is set to a LemmaCache lemmatized texts are cached.
     '''
     
+    lemma_cache = None
+    
+    def lemmatize(self, document):
+        if self.lemma_cache is None:
+            return utils.lemmatize(document)
+        return self.lemma_cache.lemmatize(document)
+    
+    def lemmatize_batch(self, documents, processes = 1):
+        if self.lemma_cache is None:
+            return lemmatize_batch(documents, processes)
+        return self.lemma_cache.lemmatize_batch(documents, 
+                                                lambda docs: lemmatize_batch(docs, processes))
+    
     def get_features(self, document):
         logger.debug("get_features not implemented!")
         raise NotImplementedError()
     
+    def get_features_batch(self, documents, processes = 1):
+        '''
+        Returns the features of each document.
+        
+        Extractors transform all documents with matrix operations at once. 
+        The documents are lemmatized by processes processes.
+        '''
+        return [self.get_features(document) for document in documents]
+    
     def get_feature_number(self):
         logger.debug("get_feature_number not implemented!")
         raise NotImplementedError()
@@ -61,13 +161,13 @@ class TfidfFeatureExtractor(Extractor):
     def __init__(self, prefix):
         logger.info("Load dictionary and tfidf model with prefix %s" 
                     % prefix)
-        self.dictionary = corpora.Dictionary.load(prefix + "_wordids.dict")
+        self.dictionary = load_dictionary(prefix)
         self.tfidf_model = models.TfidfModel.load(prefix + "_tfidf.model")
         
     def get_features(self, document):
         #create list of tokens from doc
         logger.debug("Lemmatize document.")
-        tokens = utils.lemmatize(document)
+        tokens = self.lemmatize(document)
         
         #create bow of doc from token list
         logger.debug("Create bag-of-words representation from article.")
@@ -79,6 +179,11 @@ class TfidfFeatureExtractor(Extractor):
         
         return doc_tfidf
     
+    def get_features_batch(self, documents, processes = 1):
+        token_lists = self.lemmatize_batch(documents, processes)
+        X = tfidf_matrix(self.tfidf_model, bow_matrix(self.dictionary, token_lists))
+        return matrix_to_vectors(X)
+    
     def get_feature_number(self):
         return len(self.dictionary)
     
@@ -91,14 +196,14 @@ class LdaFeatureExtractor(Extractor):
     def __init__(self, prefix):
         logger.info("Load dictionary and tfidf and lda model with prefix %s" 
                     % prefix)
-        self.dictionary = corpora.Dictionary.load(prefix + "_wordids.dict")
+        self.dictionary = load_dictionary(prefix)
         self.tfidf_model = models.TfidfModel.load(prefix + "_tfidf.model")
-        self.lda_model = models.LdaModel.load(prefix+ "_lda.model")
+        self.lda_model = load_lda(prefix, id2word = self.dictionary)
         
     def get_features(self, document):
         #create list of tokens from doc
         logger.debug("Lemmatize document.")
-        tokens = utils.lemmatize(document)
+        tokens = self.lemmatize(document)
         
         #create bow of doc from token list
         logger.debug("Create bag-of-words representation from article.")
@@ -114,6 +219,11 @@ class LdaFeatureExtractor(Extractor):
         
         return doc_lda
     
+    def get_features_batch(self, documents, processes = 1):
+        token_lists = self.lemmatize_batch(documents, processes)
+        X = tfidf_matrix(self.tfidf_model, bow_matrix(self.dictionary, token_lists))
+        return matrix_to_vectors(lda_matrix(self.lda_model, X))
+    
     def get_feature_number(self):
         return self.lda_model.num_topics
     
@@ -126,13 +236,13 @@ class LdaBowFeatureExtractor(Extractor):
     def __init__(self, prefix):
         logger.info("Load dictionary and lda model with prefix %s" 
                     % prefix)
-        self.dictionary = corpora.Dictionary.load(prefix + "_wordids.dict")
+        self.dictionary = load_dictionary(prefix)
         self.lda_model = models.LdaModel.load(prefix+ "_lda_on_bow.model")
         
     def get_features(self, document):
         #create list of tokens from doc
         logger.debug("Lemmatize document.")
-        tokens = utils.lemmatize(document)
+        tokens = self.lemmatize(document)
         
         #create bow of doc from token list
         logger.debug("Create bag-of-words representation from article.")
@@ -144,6 +254,11 @@ class LdaBowFeatureExtractor(Extractor):
         
         return doc_lda
     
+    def get_features_batch(self, documents, processes = 1):
+        token_lists = self.lemmatize_batch(documents, processes)
+        X = bow_matrix(self.dictionary, token_lists)
+        return matrix_to_vectors(lda_matrix(self.lda_model, X))
+    
     def get_feature_number(self):
         return self.lda_model.num_topics
     
@@ -159,15 +274,15 @@ class EsaFeatureExtractor(Extractor):
         '''
         logger.info("Load dictionary, tfidf model, lda model and esa model with prefix %s" 
                     % prefix)
-        self.dictionary = corpora.Dictionary.load(prefix + "_wordids.dict")
+        self.dictionary = load_dictionary(prefix)
         self.tfidf_model = models.TfidfModel.load(prefix + "_tfidf.model")
-        self.lda_model = models.LdaModel.load(prefix+ "_lda.model")
+        self.lda_model = load_lda(prefix, id2word = self.dictionary)
         self.esa_model = EsaModel.load(prefix + "_esa_on_lda.model")
             
     def get_features(self, document):
         #create list of tokens from doc
         logger.debug("Lemmatize document.")
-        tokens = utils.lemmatize(document)
+        tokens = self.lemmatize(document)
         
         #create bow of doc from token list
         logger.debug("Create bag-of-words representation from article.")
@@ -187,6 +302,11 @@ class EsaFeatureExtractor(Extractor):
         
         return doc_esa
     
+    def get_features_batch(self, documents, processes = 1):
+        token_lists = self.lemmatize_batch(documents, processes)
+        X = tfidf_matrix(self.tfidf_model, bow_matrix(self.dictionary, token_lists))
+        return self.esa_model.transform_matrix(lda_matrix(self.lda_model, X))
+    
     def get_feature_number(self):
         return len(self.esa_model.document_titles)
     
@@ -196,20 +316,28 @@ class EsaFeatureExtractor(Extractor):
     
 class cEsaFeatureExtractor(Extractor):
     
-    def __init__(self, prefix):
+    def __init__(self, prefix, num_best = None, threshold = None):
         '''
         prefix is the prefix path to tfidf, lda and esa model.
+        
+        num_best and threshold override the top-k output of the cesa model. 
+        See CosineEsaModel.
         '''
         logger.info("Load dictionary, tfidf model, lda model and cosine esa model with prefix %s" 
                     % prefix)
-        self.dictionary = corpora.Dictionary.load(prefix + "_wordids.dict")
+        self.dictionary = load_dictionary(prefix)
         self.tfidf_model = models.TfidfModel.load(prefix + "_tfidf.model")
-        self.cesa_model = CosineEsaModel.load(prefix + "_cesa.model")
+        self.cesa_model = load_cesa(prefix)
+        
+        if num_best is not None:
+            self.cesa_model.num_best = num_best
+        if threshold is not None:
+            self.cesa_model.threshold = threshold
             
     def get_features(self, document):
         #create list of tokens from doc
         logger.debug("Lemmatize document.")
-        tokens = utils.lemmatize(document)
+        tokens = self.lemmatize(document)
         
         #create bow of doc from token list
         logger.debug("Create bag-of-words representation from article.")
@@ -225,9 +353,26 @@ class cEsaFeatureExtractor(Extractor):
         
         return doc_cesa
     
+    def get_features_batch(self, documents, processes = 1):
+        token_lists = self.lemmatize_batch(documents, processes)
+        X = tfidf_matrix(self.tfidf_model, bow_matrix(self.dictionary, token_lists))
+        return self.cesa_model.transform_matrix(X)
+    
     def get_feature_number(self):
         return len(self.cesa_model.document_titles)
     
-    @classmethod
     def get_version(self):
-        return u"cESA-1.1"
+        '''
+        The top-k output changes the features, so num_best and threshold are
+        part of the version if they are set.
+        '''
+        version = u"cESA-1.1"
+        
+        #models saved before top-k output have no num_best and threshold
+        num_best = getattr(self.cesa_model, 'num_best', None)
+        threshold = getattr(self.cesa_model, 'threshold', None)
+        if num_best is not None:
+            version += u"-best%d" % num_best
+        if threshold is not None:
+            version += u"-threshold%g" % threshold
+        return version
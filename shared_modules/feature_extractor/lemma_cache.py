@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+The MIT License (MIT)
+Copyright (c) 2012-2013 Karsten Jeschkies <jeskar@web.de>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of 
+this software and associated documentation files (the "Software"), to deal in 
+the Software without restriction, including without limitation the rights to use, 
+copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the 
+Software, and to permit persons to whom the Software is furnished to do so, 
+subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all 
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, 
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A 
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT 
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION 
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE 
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+'''
+
+'''
+@author: karsten jeschkies <jeskar@web.de>
+
+Lemmatization is by far the slowest step of feature extraction. The same article
+text is lemmatized by the feature extractor, feature conversion, model training
+and evaluation. The lemma cache keeps lemmatized texts in MongoDB keyed by a hash
+of the text.
+
+>>> extractor = EsaFeatureExtractor(prefix)
+>>> extractor.lemma_cache = LemmaCache(max_size = 100000)
+'''
+
+from datetime import datetime
+from gensim import utils
+import hashlib
+import logging
+from models.mongodb_models import LemmatizedContent
+from mongoengine import queryset
+
+logger = logging.getLogger("extractor")
+
+def content_hash(document):
+    return hashlib.sha1(utils.to_utf8(document)).hexdigest()
+
+class LemmaCache(object):
+    '''
+    Size bounded cache of lemmatized texts in MongoDB.
+    
+    If the cache holds more than max_size texts the least recently used texts
+    are removed. The size is checked every check_interval new texts.
+    '''
+    
+    def __init__(self, max_size = 100000, check_interval = 1000):
+        self.max_size = max_size
+        self.check_interval = check_interval
+        self.num_inserts_ = 0
+        
+    def lemmatize(self, document):
+        '''
+        Returns the lemmatized tokens of document like gensim.utils.lemmatize.
+        '''
+        return self.lemmatize_batch([document])[0]
+    
+    def lemmatize_batch(self, documents, lemmatize_function = None):
+        '''
+        Returns the lemmatized tokens of each document. Only documents which 
+        are not cached are lemmatized by lemmatize_function. It is called with 
+        the list of these documents and has to return a list of token lists.
+        '''
+        if lemmatize_function is None:
+            lemmatize_function = lambda docs: [utils.lemmatize(doc) for doc in docs]
+        
+        hashes = [content_hash(document) for document in documents]
+        
+        try:
+            cached = dict((c.content_hash, c.tokens) 
+                          for c 
+                          in LemmatizedContent.objects(content_hash__in = hashes).only("content_hash",
+                                                                                       "tokens"))
+            if len(cached) > 0:
+                LemmatizedContent.objects(content_hash__in = cached.keys()).update(
+                                            set__accessed = datetime.now())
+        except Exception as inst:
+            logger.error("Could not read lemma cache due to error %s: %s" %
+                         (type(inst), inst))
+            cached = {}
+            
+        #lemmatize each missing text only once
+        missing = dict((key, document) 
+                       for key, document in zip(hashes, documents) 
+                       if key not in cached)
+        
+        if len(missing) > 0:
+            missing_hashes = missing.keys()
+            token_lists = lemmatize_function([missing[key] for key in missing_hashes])
+            new_entries = dict(zip(missing_hashes, token_lists))
+            
+            self.__insert(new_entries)
+            cached.update(new_entries)
+            
+        logger.debug("Lemma cache: %d hits, %d misses." % 
+                     (len(documents) - len(missing), len(missing)))
+        
+        return [cached[key] for key in hashes]
+    
+    def __insert(self, entries):
+        now = datetime.now()
+        try:
+            #another process might have cached some of the texts in between,
+            #the other texts are inserted anyway
+            LemmatizedContent.objects.insert([LemmatizedContent(content_hash = key,
+                                                                tokens = tokens,
+                                                                accessed = now)
+                                              for key, tokens in entries.iteritems()],
+                                             load_bulk = False, safe = True,
+                                             write_options = {'continue_on_error': True})
+        except queryset.NotUniqueError as inst:
+            logger.debug("Some texts were in lemma cache already: %s" % inst)
+        except Exception as inst:
+            logger.error("Could not write lemma cache due to error %s: %s" %
+                         (type(inst), inst))
+            return
+        
+        self.num_inserts_ += len(entries)
+        if self.num_inserts_ >= self.check_interval:
+            self.num_inserts_ = 0
+            self.evict()
+            
+    def evict(self):
+        '''
+        Removes the least recently used texts if the cache is too big.
+        '''
+        try:
+            excess = LemmatizedContent.objects.count() - self.max_size
+            if excess <= 0:
+                return
+            
+            oldest = [c.id 
+                      for c 
+                      in LemmatizedContent.objects.order_by("accessed").only("id").limit(excess)]
+            LemmatizedContent.objects(id__in = oldest).delete()
+            
+            logger.info("Removed %d texts from lemma cache." % len(oldest))
+        except Exception as inst:
+            logger.error("Could not evict lemma cache due to error %s: %s" %
+                         (type(inst), inst))
@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+The MIT License (MIT)
+Copyright (c) 2012-2013 Karsten Jeschkies <jeskar@web.de>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of 
+this software and associated documentation files (the "Software"), to deal in 
+the Software without restriction, including without limitation the rights to use, 
+copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the 
+Software, and to permit persons to whom the Software is furnished to do so, 
+subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all 
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, 
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A 
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT 
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION 
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE 
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+'''
+
+'''
+@author: karsten jeschkies <jeskar@web.de>
+
+A model bundle stores the large arrays of the feature models in .npy files next
+to the pickled models. The arrays are loaded memory-mapped and read-only. Thus
+several processes using the same models share the physical pages and loading
+the models takes only a fraction of a second.
+
+The bundle of a prefix consists of
+- prefix_wordids.mmdict : the dictionary as sorted token and id arrays
+- prefix_lda.mmmodel : the LDA model with its topic matrices stored separately,
+  its id2word is the dictionary of the bundle
+- prefix_cesa.mmmodel : the cESA model with its similarity matrix stored 
+  separately
+The ESA model already maps its interpreter matrix. The original models are 
+left untouched.
+
+Create a bundle from existing models with:
+python model_bundle.py -p prefix
+'''
+
+from collections import defaultdict
+from esa.cosine_esamodel import CosineEsaModel
+from gensim import corpora, models, utils
+import logging
+import numpy
+import os
+
+logger = logging.getLogger("extractor")
+
+DICTIONARY_SUFFIX = "_wordids.mmdict"
+LDA_SUFFIX = "_lda.mmmodel"
+LDA_ARRAYS = ['expElogbeta', 'state.sstats']
+CESA_SUFFIX = "_cesa.mmmodel"
+
+def _get_attribute(obj, path):
+    for name in path.split("."):
+        obj = getattr(obj, name)
+    return obj
+
+def _set_attribute(obj, path, value):
+    names = path.split(".")
+    for name in names[:-1]:
+        obj = getattr(obj, name)
+    setattr(obj, names[-1], value)
+
+def save_with_arrays(obj, fname, attributes):
+    '''
+    Pickles obj to fname without the numpy arrays given as attribute paths,
+    e.g. "state.sstats". Each array is saved to fname.<attribute>.npy.
+    '''
+    logger.info("storing %s object to %s" % (obj.__class__.__name__, fname))
+    
+    arrays = dict((attribute, _get_attribute(obj, attribute)) 
+                  for attribute in attributes)
+    
+    #remove the arrays, so they don't get pickled
+    for attribute in attributes:
+        _set_attribute(obj, attribute, None)
+    try:
+        for attribute, array in arrays.iteritems():
+            numpy.save("%s.%s.npy" % (fname, attribute), array)
+        utils.pickle(obj, fname)
+    finally:
+        for attribute, array in arrays.iteritems():
+            _set_attribute(obj, attribute, array)
+
+def load_with_arrays(fname, attributes):
+    '''
+    Loads an object saved with save_with_arrays. The arrays are memory-mapped
+    read-only.
+    '''
+    logger.info("loading object from %s" % fname)
+    
+    result = utils.unpickle(fname)
+    for attribute in attributes:
+        _set_attribute(result, attribute, 
+                       numpy.load("%s.%s.npy" % (fname, attribute), 
+                                  mmap_mode = 'r'))
+    return result
+
+class MmapDictionary(object):
+    '''
+    Read-only replacement for gensim.corpora.Dictionary.
+    
+    The tokens are kept in a sorted numpy array and looked up by binary search.
+    Unlike the token2id dict of Dictionary the arrays can be memory-mapped.
+    '''
+    
+    ARRAYS = ['tokens', 'ids', 'positions']
+    
+    def __init__(self, dictionary):
+        '''
+        dictionary : gensim.corpora.Dictionary
+        '''
+        tokens = sorted(dictionary.token2id.iterkeys())
+        
+        self.tokens = numpy.array(tokens, dtype = unicode)
+        self.ids = numpy.array([dictionary.token2id[token] for token in tokens],
+                               dtype = numpy.int32)
+        
+        #position of each id in tokens
+        self.positions = numpy.argsort(self.ids).astype(numpy.int32)
+        
+        self.max_token_length = max(len(token) for token in tokens) if tokens else 0
+        
+    def doc2bow(self, document):
+        '''
+        Converts document (a list of tokens) into the bag-of-words format, a
+        list of (token id, token count) tuples. Unknown tokens are ignored.
+        '''
+        counts = defaultdict(int)
+        for token in document:
+            token = utils.to_unicode(token)
+            #longer tokens would be truncated by numpy and cannot be known
+            if len(token) <= self.max_token_length:
+                counts[token] += 1
+                
+        if len(counts) == 0 or len(self.tokens) == 0:
+            return []
+        
+        words = numpy.array(counts.keys(), dtype = self.tokens.dtype)
+        positions = numpy.searchsorted(self.tokens, words)
+        positions = numpy.minimum(positions, len(self.tokens) - 1)
+        known = self.tokens[positions] == words
+        
+        return sorted((int(self.ids[position]), counts[word]) 
+                      for position, word, is_known 
+                      in zip(positions, counts.iterkeys(), known) 
+                      if is_known)
+        
+    def __getitem__(self, token_id):
+        return self.tokens[self.positions[token_id]]
+    
+    def __len__(self):
+        return len(self.ids)
+    
+    def save(self, fname):
+        save_with_arrays(self, fname, self.ARRAYS)
+        
+    @classmethod
+    def load(cls, fname):
+        return load_with_arrays(fname, cls.ARRAYS)
+    
+def save_lda_model(lda_model, fname):
+    save_with_arrays(lda_model, fname, LDA_ARRAYS)
+    
+def load_lda_model(fname):
+    return load_with_arrays(fname, LDA_ARRAYS)
+
+def load_dictionary(prefix):
+    '''
+    Loads memory-mapped dictionary of prefix if there is a bundle. 
+    Otherwise the pickled dictionary is loaded.
+    '''
+    if os.path.exists(prefix + DICTIONARY_SUFFIX):
+        return MmapDictionary.load(prefix + DICTIONARY_SUFFIX)
+    return corpora.Dictionary.load(prefix + "_wordids.dict")
+
+def load_lda(prefix, id2word = None):
+    '''
+    Loads memory-mapped LDA model of prefix if there is a bundle. 
+    Otherwise the pickled model is loaded.
+    
+    id2word : The dictionary of the bundle if it is already loaded. Otherwise
+              it is loaded for the LDA model of the bundle.
+    '''
+    if os.path.exists(prefix + LDA_SUFFIX):
+        lda_model = load_lda_model(prefix + LDA_SUFFIX)
+        if id2word is None:
+            id2word = MmapDictionary.load(prefix + DICTIONARY_SUFFIX)
+        lda_model.id2word = id2word
+        return lda_model
+    return models.LdaModel.load(prefix + "_lda.model")
+
+def load_cesa(prefix):
+    '''
+    Loads memory-mapped cESA model of prefix if there is a bundle. 
+    Otherwise the model saved by make_cesa is loaded.
+    '''
+    if os.path.exists(prefix + CESA_SUFFIX):
+        return CosineEsaModel.load(prefix + CESA_SUFFIX)
+    return CosineEsaModel.load(prefix + "_cesa.model")
+
+def save_bundle(prefix):
+    '''
+    Converts the dictionary, LDA and cESA model of prefix into a model bundle.
+    Models which do not exist are skipped.
+    '''
+    dictionary = corpora.Dictionary.load(prefix + "_wordids.dict")
+    mmap_dictionary = MmapDictionary(dictionary)
+    mmap_dictionary.save(prefix + DICTIONARY_SUFFIX)
+    
+    if os.path.exists(prefix + "_lda.model"):
+        lda_model = models.LdaModel.load(prefix + "_lda.model")
+        #id2word would be pickled as a second copy of the dictionary, 
+        #load_lda() attaches the memory-mapped dictionary instead
+        lda_model.id2word = None
+        save_lda_model(lda_model, prefix + LDA_SUFFIX)
+        
+    if os.path.exists(prefix + "_cesa.model"):
+        #saving stores the similarity matrix as separate array
+        cesa_model = CosineEsaModel.load(prefix + "_cesa.model")
+        cesa_model.save(prefix + CESA_SUFFIX)
+    
+if __name__ == "__main__":
+    from optparse import OptionParser
+    
+    p = OptionParser()
+    p.add_option('-p', '--prefix', action="store", dest='prefix',
+                 help="specify path prefix of the models")
+    (options, args) = p.parse_args()
+    
+    logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', 
+                        level=logging.INFO)
+    
+    save_bundle(options.prefix)
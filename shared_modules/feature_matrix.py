@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+The MIT License (MIT)
+Copyright (c) 2012-2013 Karsten Jeschkies <jeskar@web.de>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of 
+this software and associated documentation files (the "Software"), to deal in 
+the Software without restriction, including without limitation the rights to use, 
+copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the 
+Software, and to permit persons to whom the Software is furnished to do so, 
+subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all 
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, 
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A 
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT 
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION 
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE 
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+'''
+
+'''
+@author: karsten jeschkies <jeskar@web.de>
+
+Loads the features of many articles at once into a matrix.
+
+Only the features of the articles are read from the database. The sparse
+feature vectors are put into a csr matrix directly without building a full
+vector per article.
+'''
+
+import logging
+from models.mongodb_models import Article
+import numpy
+import scipy.sparse
+
+logger = logging.getLogger("main")
+
+def load_feature_matrix(article_ids, num_features, version = None, 
+                        dense = False, batch_size = 1000):
+    '''
+    Returns (features, id_to_row, stale_ids).
+    
+    features is a float32 csr matrix, or a dense array if dense is True, with
+    one row per article. id_to_row maps the article ids to their rows. 
+    Articles without features or with features of another version than 
+    version are left out. The ids of the latter are returned as stale_ids.
+    
+    article_ids : iterable of article ids
+    num_features : number of features of the extractor. Larger feature ids 
+                   are dropped.
+    version : version of the feature extractor or None to accept all features
+    batch_size : number of ids per database query
+    '''
+    article_ids = list(article_ids)
+    collection = Article._get_collection()
+    
+    id_to_row = {}
+    stale_ids = []
+    indptr = [0]
+    indices = []
+    data = []
+    
+    for start in xrange(0, len(article_ids), batch_size):
+        batch_ids = article_ids[start:start + batch_size]
+        
+        for doc in collection.find({'_id': {'$in': batch_ids}}, 
+                                   {'features': 1}):
+            features = doc.get('features')
+            if features is None or features.get('data') is None:
+                logger.error("Article %s does not have any features." % 
+                             doc['_id'])
+                continue
+            
+            if version is not None and features.get('version') != version:
+                stale_ids.append(doc['_id'])
+                continue
+            
+            for feature_id, weight in features['data']:
+                if feature_id < num_features:
+                    indices.append(feature_id)
+                    data.append(weight)
+            
+            id_to_row[doc['_id']] = len(indptr) - 1
+            indptr.append(len(indices))
+            
+    X = scipy.sparse.csr_matrix((numpy.asarray(data, dtype = numpy.float32),
+                                 numpy.asarray(indices, dtype = numpy.int32),
+                                 numpy.asarray(indptr, dtype = numpy.int32)),
+                                shape = (len(indptr) - 1, num_features))
+    X.sum_duplicates()
+    
+    if dense:
+        X = X.toarray()
+        
+    return X, id_to_row, stale_ids
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+The MIT License (MIT)
+Copyright (c) 2012-2013 Karsten Jeschkies <jeskar@web.de>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of 
+this software and associated documentation files (the "Software"), to deal in 
+the Software without restriction, including without limitation the rights to use, 
+copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the 
+Software, and to permit persons to whom the Software is furnished to do so, 
+subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all 
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, 
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A 
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT 
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION 
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE 
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+'''
+'''
+@author: karsten jeschkies <jeskar@web.de>
+
+Background extraction of outdated article features.
+
+When the feature extractor is updated the features of all older articles are
+outdated. Instead of extracting them one by one inside training and ranking
+loops the ids of outdated articles are put into a FeatureQueue. A worker thread
+extracts the features of whole batches with Extractor.get_features_batch,
+which lemmatizes with a pool of processes, and writes back only the features of
+each article.
+
+>>> queue = FeatureQueue(extractor, processes = 4)
+>>> queue.start()
+>>> queue.put(stale_ids)
+>>> queue.wait(stale_ids)
+>>> queue.stop()
+'''
+
+import logging
+from models.mongodb_models import Article, Features
+from mongoengine import queryset
+import Queue
+import threading
+
+logger = logging.getLogger("main")
+
+#policies for articles with outdated features during training
+WAIT = "wait"
+SKIP = "skip"
+
+def save_features(article_id, version, data):
+    '''
+    Sets the features of article without writing the whole document.
+    '''
+    try:
+        Article.objects(id = article_id).update_one(set__features = Features(version = version,
+                                                                             data = data))
+    except queryset.OperationError as e:
+        logger.error("Could not save features of article with id %s: %s" %
+                     (article_id, e))
+
+class FeatureQueue(object):
+    '''
+    Extracts features of queued articles in a background thread.
+    
+    Each article is queued only once until its features are extracted.
+    '''
+    
+    def __init__(self, extractor, processes = 1, batch_size = 100):
+        '''
+        extractor : Feature extractor. Its version is written with the features.
+        processes : Number of processes which lemmatize a batch
+        batch_size : Maximum number of articles which are extracted at once
+        '''
+        self.extractor = extractor
+        self.processes = processes
+        self.batch_size = batch_size
+        
+        self.queue_ = Queue.Queue()
+        #article id -> threading.Event which is set when the article is done
+        self.pending_ = {}
+        self.lock_ = threading.Lock()
+        self.worker_ = None
+        
+    def start(self):
+        if self.worker_ is not None:
+            return
+        
+        self.worker_ = threading.Thread(target = self.__run)
+        self.worker_.daemon = True
+        self.worker_.start()
+        
+    def stop(self):
+        '''
+        Extracts all queued articles and stops the worker thread.
+        '''
+        if self.worker_ is None:
+            return
+        
+        self.queue_.put(None)
+        self.worker_.join()
+        self.worker_ = None
+        
+    def put(self, article_ids):
+        '''
+        Queues articles for extraction. Articles which are already queued are
+        not queued again.
+        '''
+        if self.worker_ is None:
+            self.start()
+            
+        with self.lock_:
+            for article_id in article_ids:
+                if article_id not in self.pending_:
+                    self.pending_[article_id] = threading.Event()
+                    self.queue_.put(article_id)
+                    
+    def wait(self, article_ids, timeout = None):
+        '''
+        Blocks until the features of all articles with ids article_ids are
+        extracted or timeout seconds have passed for one of them.
+        
+        Returns True if all articles are done.
+        '''
+        with self.lock_:
+            events = [self.pending_[article_id] 
+                      for article_id in article_ids 
+                      if article_id in self.pending_]
+            
+        for event in events:
+            event.wait(timeout)
+            
+        return all(event.is_set() for event in events)
+    
+    def __len__(self):
+        with self.lock_:
+            return len(self.pending_)
+        
+    def __next_batch(self):
+        '''
+        Returns up to batch_size queued ids and whether the queue was stopped.
+        Blocks until at least one id is queued.
+        '''
+        batch = []
+        
+        item = self.queue_.get()
+        while item is not None:
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                return batch, False
+            try:
+                item = self.queue_.get_nowait()
+            except Queue.Empty:
+                return batch, False
+            
+        return batch, True
+    
+    def __run(self):
+        stopped = False
+        while not stopped:
+            batch, stopped = self.__next_batch()
+            
+            if len(batch) > 0:
+                try:
+                    self.__extract(batch)
+                except Exception as inst:
+                    logger.error("Could not extract features due to error %s: %s" %
+                                 (type(inst), inst))
+                finally:
+                    with self.lock_:
+                        for article_id in batch:
+                            self.pending_.pop(article_id).set()
+            
+    def __extract(self, article_ids):
+        version = self.extractor.get_version()
+        
+        #only the content is needed
+        docs = [doc 
+                for doc 
+                in Article._get_collection().find({'_id': {'$in': article_ids}},
+                                                  {'clean_content': 1})
+                if doc.get('clean_content') is not None]
+        
+        if len(docs) == 0:
+            return
+        
+        logger.info("Extract features of %d articles." % len(docs))
+        
+        features = self.extractor.get_features_batch([doc['clean_content'] 
+                                                      for doc in docs],
+                                                     processes = self.processes)
+        
+        for doc, data in zip(docs, features):
+            save_features(doc['_id'], version, data)
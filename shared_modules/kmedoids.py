@@ -30,14 +30,17 @@ This is an implementation of a kMedoids clusterer.
 It works memory independent. However, this makes the clusterer very slow!
 """
 
-from collections import defaultdict
-from gensim.similarities import Similarity, SparseMatrixSimilarity, MatrixSimilarity
-from gensim import matutils
+from checkpoint import save_checkpoint, load_checkpoint
+from collections import OrderedDict
+from gensim.similarities import Similarity
+from gensim import matutils, utils
 import itertools
 import logging
 import multiprocessing
 import numpy
+import os
 import random
+import scipy.sparse
 
 
 logger = logging.getLogger('gensim.models.kmedoids')
@@ -45,21 +48,99 @@ logger = logging.getLogger('gensim.models.kmedoids')
 POOL_SIZE = multiprocessing.cpu_count()
 CHUNK_SIZE = 1000
 
-def assign_doc_to_cluster(args):
-    id_doc, similarity_index = args
+#medoid matrix in shared memory. Set in each worker by init_assign_worker.
+#While medoids are recalculated it holds the cluster centroids.
+_shared_medoids = None
+
+def init_assign_worker(shared_medoids, num_features):
+    '''
+    Maps the shared medoid buffer as matrix with num_features columns.
+    The workers are forked once and see every update of the buffer.
+    '''
+    global _shared_medoids
+    _shared_medoids = numpy.frombuffer(shared_medoids, 
+                                       dtype = numpy.float32).reshape((-1, num_features))
+
+def enumerate_chunks(corpus, chunk_size):
+    '''
+    Yields (position of first document, list of documents) for each chunk 
+    of corpus.
+    '''
+    start = 0
+    for chunk in utils.chunkize_serial(corpus, chunk_size):
+        yield start, chunk
+        start += len(chunk)
+        
+def normalize_rows(chunk):
+    '''
+    Returns a copy of the csr matrix chunk with unit length rows.
+    '''
+    chunk = chunk.astype(numpy.float32)
+    rows = numpy.repeat(numpy.arange(chunk.shape[0]), numpy.diff(chunk.indptr))
+    norms = numpy.sqrt(numpy.bincount(rows, weights = chunk.data ** 2,
+                                      minlength = chunk.shape[0]))
     
-    #get similarity of doc to each medoid
-    similarities_to_medoids = similarity_index[id_doc[1]]
-            
-    #get best fit
-    best_fit_position = 0
-    best_sim = -1
-    for pos, sim in enumerate(similarities_to_medoids):
-        if sim > best_sim:
-            best_sim = sim
-            best_fit_position = pos 
+    nonzero = norms[rows] > 0
+    chunk.data[nonzero] /= norms[rows][nonzero]
+    return chunk
+
+def assign_chunk(args):
+    '''
+    Returns the position of the closest medoid for each document of a chunk and
+    the sum of the unit length documents of each cluster as sparse matrix.
+    
+    The medoid rows have unit length. The documents do not have to be normalized
+    because it does not change the order of the similarities of one document.
+    '''
+    start, chunk, num_medoids = args
+    
+    #cosine similarities of each doc (rows) to each medoid (columns)
+    similarities = chunk * _shared_medoids[:num_medoids].T
+    positions = numpy.asarray(similarities).argmax(axis = 1)
+    
+    #sum docs of each cluster with a cluster indicator matrix
+    indicator = scipy.sparse.csr_matrix((numpy.ones(len(positions), 
+                                                    dtype = numpy.float32),
+                                         (positions, numpy.arange(len(positions)))),
+                                        shape = (num_medoids, len(positions)))
+    centroid_sums = (indicator * normalize_rows(chunk)).tocoo()
             
-    return id_doc[0], best_fit_position   
+    return start, positions, centroid_sums
+
+def closest_members_chunk(args):
+    '''
+    Returns (cluster positions, doc ids, similarities) of the documents of a 
+    chunk which are closest to the centroid of their cluster. There is one 
+    document for each cluster which has members in chunk.
+    
+    Each document is only compared to the centroid of its own cluster.
+    '''
+    start, chunk, positions = args
+    
+    clusters, best, similarities = closest_members(normalize_rows(chunk), 
+                                                   positions, _shared_medoids)
+    
+    return clusters, start + best, similarities
+
+def closest_members(chunk, positions, centroids):
+    '''
+    Returns (cluster positions, rows, similarities) of the rows of the csr 
+    matrix chunk which are closest to the row of their cluster in centroids.
+    '''
+    rows = numpy.repeat(numpy.arange(chunk.shape[0]), numpy.diff(chunk.indptr))
+    
+    #dot product of each doc with the centroid of its cluster
+    products = chunk.data * centroids[positions[rows], chunk.indices]
+    similarities = numpy.bincount(rows, weights = products, 
+                                  minlength = chunk.shape[0])
+    
+    #the last doc of each cluster in this order is the best one
+    order = numpy.lexsort((similarities, positions))
+    sorted_positions = positions[order]
+    last = numpy.append(sorted_positions[1:] != sorted_positions[:-1], True)
+    best = order[last]
+    
+    return positions[best], best, similarities[best]
     
 
 class KMedoids(object):
@@ -72,13 +153,42 @@ class KMedoids(object):
     member. This is the "kmedian based" kmedoids.
     
     So far this implementation uses the kmeans based approach.
+    
+    The initial medoids are either drawn at random or by k-medoids++ seeding.
+    k-medoids++ draws each new medoid with a probability proportional to the 
+    squared cosine distance to the closest medoid drawn so far.
+    
+    In mini-batch mode each iteration only looks at a random sample of 
+    batch_size documents. The centroid of a cluster is a running mean of the 
+    sampled members and the medoid is the sampled member closest to it. Only 
+    the final assignment reads the whole corpus.
     '''
     
-    def __init__(self, corpus, num_features, num_clusters, max_iterations):
-        
-        self.similarity_index = Similarity(output_prefix = 'similarities', 
-                                           corpus = corpus,
-                                           num_features = num_features)
+    def __init__(self, corpus, num_features, num_clusters, max_iterations,
+                 processes = POOL_SIZE, chunk_size = CHUNK_SIZE, 
+                 init = 'random', seed_sample_size = 100000, batch_size = None,
+                 checkpoint_prefix = None):
+        '''
+        processes : Number of worker processes for the assignment step. With 
+                    processes <= 1 all documents are assigned in this process.
+        chunk_size : Number of documents which are assigned at once
+        init : 'random' or 'kmedoids++'
+        seed_sample_size : Number of random documents the k-medoids++ seeds are
+                           drawn from. None uses all documents.
+        batch_size : Number of documents sampled per iteration in mini-batch 
+                     mode. None disables mini-batch mode.
+        checkpoint_prefix : If set the similarity index of corpus and the 
+                            clustering state after each iteration are saved 
+                            with this prefix. A clusterer with the same prefix
+                            resumes from the last checkpoint. Use a new prefix
+                            for a different corpus.
+        '''
+        if init not in ('random', 'kmedoids++'):
+            raise ValueError("Unknown init method '%s'." % init)
+
+        self.checkpoint_prefix = checkpoint_prefix
+        self.similarity_index = self.__create_similarity_index(corpus, 
+                                                               num_features)
         
         self.num_docs = len(self.similarity_index)
         self.num_clusters = num_clusters
@@ -86,38 +196,144 @@ class KMedoids(object):
         self.num_features = num_features
         self.corpus = corpus
         
+        self.processes = processes
+        self.chunk_size = chunk_size
+        self.init = init
+        self.seed_sample_size = seed_sample_size
+        self.batch_size = batch_size
+        
         self.MIN_CLUSTER_SIZE = 2
         
+        #the medoid matrix lives in shared memory so that long-lived workers 
+        #get each new medoid matrix without pickling it
+        self.shared_medoids_ = multiprocessing.RawArray('f', 
+                                                        self.num_clusters * 
+                                                        self.num_features)
+        self.medoid_matrix_ = numpy.frombuffer(self.shared_medoids_, 
+                                               dtype = numpy.float32
+                                               ).reshape((self.num_clusters,
+                                                          self.num_features))
+        self.medoid_ids_ = []
+        self.pool_ = None
+        
+    def __create_similarity_index(self, corpus, num_features):
+        if self.checkpoint_prefix is None:
+            return Similarity(output_prefix = 'similarities', 
+                              corpus = corpus,
+                              num_features = num_features)
+        
+        index_fname = self.checkpoint_prefix + '.similarity'
+        if os.path.exists(index_fname):
+            logger.info("Resuming with similarity index %s." % index_fname)
+            return Similarity.load(index_fname)
+        
+        similarity_index = Similarity(output_prefix = self.checkpoint_prefix + '.shard', 
+                                      corpus = corpus,
+                                      num_features = num_features)
+        similarity_index.save(index_fname)
+        return similarity_index
+    
+    def __save_checkpoint(self, state):
+        if self.checkpoint_prefix is not None:
+            save_checkpoint(state, self.checkpoint_prefix + '.kmedoids')
+            
+    def __load_checkpoint(self):
+        if self.checkpoint_prefix is None:
+            return None
+        
+        state = load_checkpoint(self.checkpoint_prefix + '.kmedoids')
+        mode = 'minibatch' if self.batch_size else 'full'
+        if state is not None and state['mode'] != mode:
+            logger.warning("Ignoring checkpoint of %s mode." % state['mode'])
+            return None
+        
+        return state
+        
     def get_medoids(self):
         '''
-        Retuirns a Matrix containing the medoids
+        Retuirns a Matrix containing the medoids. The rows are in the order 
+        of the keys of the clusters.
         '''
-        return self.medoid_similarity_index.index
-        
-    def __medoid_generator(self):
+        return numpy.array(self.medoid_matrix_[:len(self.medoid_ids_)])
+            
+    def __create_medoid_matrix(self):
         '''
-        Yields all medoid documents
+        Writes the unit length medoid vectors into the shared medoid matrix.
+        Row i is the medoid self.medoid_ids_[i].
         '''
-        for medoid_id in self.medoids.iterkeys():
-            yield self.similarity_index.vector_by_id(medoid_id)
-            
-    def __create_medoid_similarity_index(self):
-        self.medoid_similarity_index = MatrixSimilarity(
-                                           corpus = list(self.__medoid_generator()),
-                                           num_features = self.num_features)        
+        self.medoid_ids_ = self.medoids.keys()
         
-    def __random_init_medoids(self):
+        for pos, medoid_id in enumerate(self.medoid_ids_):
+            vector = self.similarity_index.vector_by_id(medoid_id)
+            #shards are dense if the corpus is dense enough
+            if scipy.sparse.issparse(vector):
+                vector = vector.toarray()
+            self.medoid_matrix_[pos] = matutils.unitvec(numpy.asarray(vector).ravel())
+        
+    def __set_medoids(self, medoid_ids):
         #the keys are the indices of the medoids
         #the values are indices list of the elements belonging to medoid
-        self.medoids = defaultdict(list)
+        self.medoids = OrderedDict((int(medoid_id), []) for medoid_id in medoid_ids)
+        
+        #create matrix of medoids  
+        self.__create_medoid_matrix()
+            
+    def __random_init_medoids(self):
+        #init distinct random medoids
+        self.__set_medoids(random.sample(xrange(self.num_docs), 
+                                         min(self.num_clusters, self.num_docs)))
+        
+    def __kmedoidspp_init_medoids(self):
+        #draw seeds from a random sample of documents
+        num_samples = min(self.seed_sample_size or self.num_docs, self.num_docs)
+        sample_ids = numpy.asarray(sorted(random.sample(xrange(self.num_docs), 
+                                                        num_samples)))
+        sample = self.__vectors_by_ids(sample_ids)
+        
+        chosen = numpy.zeros(num_samples, dtype = numpy.bool_)
+        best_similarities = numpy.empty(num_samples)
+        best_similarities.fill(-1.0)
         
-        #init random medoids
-        for x in xrange(self.num_clusters):
-            medoid_index = random.randrange(self.num_docs)
-            self.medoids[medoid_index] = []  
+        pos = random.randrange(num_samples)
+        for count in xrange(min(self.num_clusters, num_samples)):
+            if count > 0:
+                #squared cosine distance to closest seed
+                weights = numpy.maximum(1.0 - best_similarities, 0.0) ** 2
+                weights[chosen] = 0.0
+                total = weights.sum()
+                
+                if total > 0:
+                    pos = numpy.searchsorted(numpy.cumsum(weights), 
+                                             random.random() * total, 
+                                             side = 'right')
+                    pos = min(int(pos), num_samples - 1)
+                    
+                if total <= 0 or chosen[pos]:
+                    #all remaining docs equal a seed
+                    pos = random.choice(numpy.flatnonzero(~chosen))
+                    
+            if count % 1000 == 0:
+                logger.info("PROGRESS: Drawing seed #%d." % count)
+                    
+            chosen[pos] = True
+            similarities = (sample * sample[pos].T).toarray().ravel()
+            best_similarities = numpy.maximum(best_similarities, similarities)
             
-        #create similarity index of medoids  
-        self.__create_medoid_similarity_index()
+        self.__set_medoids(sample_ids[chosen])
+        
+    def __vectors_by_ids(self, doc_ids):
+        '''
+        Returns the unit length documents with ids doc_ids as csr matrix.
+        '''
+        vectors = [scipy.sparse.csr_matrix(self.similarity_index.vector_by_id(doc_id))
+                   for doc_id in doc_ids]
+        return normalize_rows(scipy.sparse.vstack(vectors, format = 'csr'))
+    
+    def __random_unused_id(self, used_ids):
+        while True:
+            medoid_id = random.randrange(self.num_docs)
+            if medoid_id not in used_ids:
+                return medoid_id
             
     def __assign(self):
         #We use cosine-similarity as metric
@@ -128,98 +344,202 @@ class KMedoids(object):
         #dis = (dis * -1) +1 
 
         
-        #clear all clusters
-        for id, _ in self.medoids.iteritems():
-            self.medoids[id] = []
+        num_medoids = len(self.medoid_ids_)
         
         #assign each doc to closest medoid
-        args = itertools.izip(enumerate(self.corpus), 
-                              itertools.repeat(self.medoid_similarity_index))
-        pool = multiprocessing.Pool(POOL_SIZE)
-        #for id, pos in pool.imap_unordered(assign_doc_to_cluster, args, 
-        #                         chunksize= CHUNK_SIZE):
-        for id, pos in pool.imap_unordered(assign_doc_to_cluster, args):
-            self.medoids[self.medoids.keys()[pos]].append(id)
-            
-    def __get_centroid(self, cluster):
-        #averages all docs in cluster
-        count = 0
-        centroid = numpy.zeros(self.num_features, dtype=numpy.float32)
-        for doc_id in cluster:
-            doc = self.similarity_index.vector_by_id(doc_id).toarray().flatten()
-            #full_doc = matutils.sparse2full(doc, self.num_features)
-            
-            centroid = centroid + doc
-            count += 1
+        tasks = ((start, chunk, num_medoids) 
+                 for start, chunk in self.__chunks())
+        
+        #position of closest medoid of each doc
+        self.assignment_ = numpy.zeros(self.num_docs, dtype = numpy.intp)
+        
+        #partial sums of the docs of each cluster
+        rows, cols, data = [], [], []
+        for start, positions, centroid_sums in self.__map(assign_chunk, tasks):
+            self.assignment_[start:start + len(positions)] = positions
+            rows.append(centroid_sums.row)
+            cols.append(centroid_sums.col)
+            data.append(centroid_sums.data)
+            
+        #duplicate entries are summed up
+        self.centroid_sums_ = scipy.sparse.csr_matrix((numpy.concatenate(data),
+                                                       (numpy.concatenate(rows),
+                                                        numpy.concatenate(cols))),
+                                                      shape = (num_medoids,
+                                                               self.num_features))
+            
+        self.cluster_sizes_ = numpy.bincount(self.assignment_, 
+                                             minlength = num_medoids)
+        self.__group_members()
+        
+    def __group_members(self):
+        #group doc ids by medoid
+        doc_ids = numpy.argsort(self.assignment_, kind = 'mergesort')
+        bounds = numpy.cumsum(self.cluster_sizes_)
+        
+        #the keys are not touched to keep them in order of the medoid matrix
+        for pos, members in enumerate(numpy.split(doc_ids, bounds[:-1])):
+            self.medoids[self.medoid_ids_[pos]] = members.tolist()
+            
+    def __create_centroid_matrix(self):
+        '''
+        Writes the centroids of all clusters into the shared matrix. The 
+        centroids are the means of the unit length cluster members.
+        '''
+        num_medoids = len(self.medoid_ids_)
+        sizes = numpy.maximum(self.cluster_sizes_, 1).astype(numpy.float32)
+        
+        #densify in blocks of rows to limit memory usage
+        for start in xrange(0, num_medoids, self.chunk_size):
+            end = min(start + self.chunk_size, num_medoids)
+            block = self.centroid_sums_[start:end].toarray()
+            self.medoid_matrix_[start:end] = block / sizes[start:end, numpy.newaxis]
             
-        if count != 0:
-            centroid = centroid / count
+    def __closest_members(self):
+        '''
+        Returns for each cluster the id of the member closest to the centroid of
+        the cluster or -1 if the cluster is empty.
+        '''
+        num_medoids = len(self.medoid_ids_)
+        
+        best_ids = numpy.empty(num_medoids, dtype = numpy.intp)
+        best_ids.fill(-1)
+        best_similarities = numpy.empty(num_medoids)
+        best_similarities.fill(-numpy.inf)
+        
+        tasks = ((start, chunk, self.assignment_[start:start + chunk.shape[0]])
+                 for start, chunk in self.__chunks())
+        for positions, doc_ids, similarities in self.__map(closest_members_chunk, 
+                                                           tasks):
+            #positions are unique within a chunk
+            better = similarities > best_similarities[positions]
+            best_ids[positions[better]] = doc_ids[better]
+            best_similarities[positions[better]] = similarities[better]
             
-        return matutils.full2sparse(centroid)
+        return best_ids
             
     def __recalculate_medoids(self):
-        changed = False
-        count = 0
-        for medoid_id, cluster in self.medoids.items():
-            if count % 1000 == 0:
-                logger.info("PROGRESS: Recalculate medoid for cluster #%d id%d" 
-                            % (count, medoid_id))
-            count +=1 
-            
-            if len(cluster) < self.MIN_CLUSTER_SIZE:
-                #cluster is too small, init a new random medoid
-                #remove medoid
-                del self.medoids[medoid_id]
-                
-                #add new random medoid. the id could already be used as medoid.
-                # for now we just risk our it ;)
-                medoid_index = random.randrange(self.num_docs)
-                self.medoids[medoid_index] = [] 
-                
-                changed = True
+        #the shared matrix holds the centroids until the medoids are recreated
+        self.__create_centroid_matrix()
+        new_medoid_ids = self.__closest_members()
+        
+        #keep position of clusters and reseed too small clusters last
+        medoid_ids = list(self.medoid_ids_)
+        too_small = []
+        used_ids = set()
+        for pos in xrange(len(medoid_ids)):
+            if self.cluster_sizes_[pos] < self.MIN_CLUSTER_SIZE:
+                too_small.append(pos)
             else:
+                medoid_ids[pos] = int(new_medoid_ids[pos])
+                used_ids.add(medoid_ids[pos])
                 
-                logger.debug("Find new centroid for cluster %d." % medoid_id)
-                
-                #calculate centroid and assign closest doc as new medoid
-                centroid = self.__get_centroid(cluster)   
-                
-                
-                old_num_best = self.similarity_index.num_best
-                
-                #similarity index should only return the best fit
-                self.similarity_index.num_best = 1
-                try:
-                    new_medoid_id, _ = self.similarity_index[centroid][0]
-                except IndexError as e:
-                    logger.error("Could not find best fit for centroid: %s." % (e))
-                    #use random medoid index
-                    new_medoid_id = random.randrange(self.num_docs)
-                
-                self.similarity_index.num_best = old_num_best
-                
-                if new_medoid_id != medoid_id:
-                    changed = True
-                    #remove old medoid
-                    del self.medoids[medoid_id]
-                
-                #empty medoid in any case
-                self.medoids[new_medoid_id] = []
-
-        if changed:
-            self.__create_medoid_similarity_index()
-        
-        return changed
+        for pos in too_small:
+            #cluster is too small, init a new random medoid
+            medoid_ids[pos] = self.__random_unused_id(used_ids)
+            used_ids.add(medoid_ids[pos])
+            
+        changed = medoid_ids != self.medoid_ids_
         
-    def cluster(self):
-        logger.info("Init random medoids.")
-        self.__random_init_medoids()
+        #empty medoids and restore medoid matrix in any case
+        self.__set_medoids(medoid_ids)
         
-        logger.info("Assign elements to random clusters.")
-        self.__assign()
+        return changed
+    
+    def __minibatch_iterations(self, state):
+        '''
+        Updates the medoids from random samples of documents. Returns the number
+        of iterations.
+        '''
+        num_medoids = len(self.medoid_ids_)
+        batch_size = min(self.batch_size, self.num_docs)
         
-        changed = True
-        count = 0
+        if state is None:
+            centroids = self.get_medoids()
+            counts = numpy.zeros(num_medoids)
+            changed = True
+            count = 0
+        else:
+            centroids = state['centroids']
+            counts = state['counts']
+            changed = state['changed']
+            count = state['iteration']
+            
+        while changed and count < self.max_iterations:
+            count += 1
+            logger.info("Entering mini-batch iteration #%d." % count)
+            
+            batch_ids = numpy.asarray(sorted(random.sample(xrange(self.num_docs), 
+                                                           batch_size)))
+            batch = self.__vectors_by_ids(batch_ids)
+            
+            #assign batch to closest medoids
+            positions = numpy.asarray(batch * self.medoid_matrix_[:num_medoids].T
+                                      ).argmax(axis = 1)
+            
+            #update running means of touched clusters
+            batch_counts = numpy.bincount(positions, minlength = num_medoids)
+            indicator = scipy.sparse.csr_matrix((numpy.ones(batch_size),
+                                                 (positions, numpy.arange(batch_size))),
+                                                shape = (num_medoids, batch_size))
+            touched = numpy.flatnonzero(batch_counts)
+            sums = (indicator * batch)[touched].toarray()
+            
+            new_counts = counts[touched] + batch_counts[touched]
+            centroids[touched] = ((centroids[touched] * counts[touched, numpy.newaxis] 
+                                   + sums) / new_counts[:, numpy.newaxis])
+            counts[touched] = new_counts
+            
+            #a sampled member replaces a medoid if it is closer to the centroid
+            clusters, rows, similarities = closest_members(batch, positions, 
+                                                           centroids)
+            medoid_similarities = (self.medoid_matrix_[clusters] * 
+                                   centroids[clusters]).sum(axis = 1)
+            
+            medoid_ids = list(self.medoid_ids_)
+            used_ids = set(medoid_ids)
+            for cluster, row, sim, medoid_sim in itertools.izip(clusters, rows,
+                                                                similarities,
+                                                                medoid_similarities):
+                doc_id = int(batch_ids[row])
+                if sim > medoid_sim and doc_id not in used_ids:
+                    used_ids.add(doc_id)
+                    medoid_ids[cluster] = doc_id
+                    
+            changed = medoid_ids != self.medoid_ids_
+            if changed:
+                self.__set_medoids(medoid_ids)
+                
+            self.__save_checkpoint({'mode': 'minibatch',
+                                    'medoid_ids': self.medoid_ids_,
+                                    'centroids': centroids,
+                                    'counts': counts,
+                                    'iteration': count,
+                                    'changed': changed})
+                
+        return count
+    
+    def __full_iterations(self, state):
+        '''
+        Alternates assignment of all documents and recalculation of medoids.
+        Returns the number of iterations.
+        '''
+        if state is None:
+            logger.info("Assign elements to initial clusters.")
+            self.__assign()
+            
+            changed = True
+            count = 0
+            self.__save_full_checkpoint(count, changed)
+        else:
+            self.assignment_ = state['assignment']
+            self.cluster_sizes_ = state['cluster_sizes']
+            self.centroid_sums_ = state['centroid_sums']
+            self.__group_members()
+            
+            changed = state['changed']
+            count = state['iteration']
+            
         while changed and count < self.max_iterations:
             changed = False
             count += 1
@@ -232,11 +552,79 @@ class KMedoids(object):
             
             #assign all doc to medoids
             logger.info("Assign elements to new clusters.")
-            assignment = self.__assign()
+            self.__assign()
+            
+            self.__save_full_checkpoint(count, changed)
+            
+        return count
+    
+    def __save_full_checkpoint(self, count, changed):
+        self.__save_checkpoint({'mode': 'full',
+                                'medoid_ids': self.medoid_ids_,
+                                'assignment': self.assignment_,
+                                'cluster_sizes': self.cluster_sizes_,
+                                'centroid_sums': self.centroid_sums_,
+                                'iteration': count,
+                                'changed': changed})
+    
+    def __chunks(self):
+        '''
+        Yields (position of first document, csr matrix of documents) for each 
+        chunk of the corpus.
+        '''
+        for start, chunk in enumerate_chunks(self.corpus, self.chunk_size):
+            yield start, matutils.corpus2csc(chunk, 
+                                             num_terms = self.num_features, 
+                                             dtype = numpy.float32).T.tocsr()
+            
+    def __map(self, function, tasks):
+        if self.pool_ is None:
+            return itertools.imap(function, tasks)
+        
+        return self.pool_.imap_unordered(function, tasks)
+    
+    def __start_pool(self):
+        init_assign_worker(self.shared_medoids_, self.num_features)
+        
+        if self.processes > 1:
+            self.pool_ = multiprocessing.Pool(self.processes, 
+                                              initializer = init_assign_worker,
+                                              initargs = (self.shared_medoids_, 
+                                                          self.num_features))
+            
+    def __stop_pool(self):
+        if self.pool_ is not None:
+            self.pool_.close()
+            self.pool_.join()
+            self.pool_ = None
+        
+    def cluster(self):
+        state = self.__load_checkpoint()
+        if state is not None:
+            logger.info("Resuming after iteration #%d." % state['iteration'])
+            self.__set_medoids(state['medoid_ids'])
+        elif self.init == 'kmedoids++':
+            logger.info("Init medoids with method '%s'." % self.init)
+            self.__kmedoidspp_init_medoids()
+        else:
+            logger.info("Init medoids with method '%s'." % self.init)
+            self.__random_init_medoids()
+        
+        self.__start_pool()
+        try:
+            if self.batch_size:
+                count = self.__minibatch_iterations(state)
+                
+                logger.info("Assign elements to clusters.")
+                self.__assign()
+            else:
+                count = self.__full_iterations(state)
+        finally:
+            self.__stop_pool()
             
         if count < self.max_iterations:
             logger.info("Converged in %d iterations." % count)
         else:
             logger.info("May not have converged after %d iterations." % 
                         self.max_iterations)
-        return self.medoids
\ No newline at end of file
+        return self.medoids
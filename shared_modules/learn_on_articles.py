@@ -31,7 +31,8 @@ saved in a MongoDB database.
 
 import errno
 import exceptions
-from gensim import utils, corpora, models
+from feature_extractor.lemma_cache import LemmaCache
+from gensim import corpora, models
 import itertools
 import logging
 
@@ -65,7 +66,11 @@ class CleanCorpus(corpora.TextCorpus):
                  dictionary=None):
         '''
         See gensim.corpora.textcorpus for details.
+        
+        Lemmatized articles are cached. See feature_extractor.lemma_cache.
         '''
+        
+        self.lemma_cache = LemmaCache()
 
         if keep_words is None:
             keep_words = DEFAULT_DICT_SIZE
@@ -97,7 +102,7 @@ class CleanCorpus(corpora.TextCorpus):
             
             try:
                 doc = article.clean_content
-                tokens = utils.lemmatize(doc)
+                tokens = self.lemma_cache.lemmatize(doc)
                 yield tokens
             except Exception as e:
                 logger.error("Could not process article %s (%s): %s" %
@@ -99,9 +99,28 @@ class UserModel(Document):
     user_id = ObjectIdField()
     version = StringField()
     data = DynamicField()
+    trained_at = DateTimeField() #the date the model was saved by the trainer
+    #latest feedback and ranked article the model was trained with
+    last_feedback_id = ObjectIdField()
+    last_ranked_id = ObjectIdField()
+    #statistics to update the model with new feedback only
+    statistics = DynamicField()
     
     meta = {
-            'indexes': ['user_id']
+            'indexes': ['user_id', 'trained_at']
+            }
+
+class LemmatizedContent(Document):
+    '''
+    Cached lemmatization of a text. content_hash is the sha1 hexdigest of the
+    utf-8 encoded text. accessed is used to evict the least recently used texts.
+    '''
+    content_hash = StringField(required=True, unique=True)
+    tokens = ListField(StringField())
+    accessed = DateTimeField()
+    
+    meta = {
+            'indexes': ['accessed']
             }
 
 class User(Document):
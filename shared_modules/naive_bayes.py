@@ -18,8 +18,7 @@ are supervised learning methods based on applying Bayes' theorem with strong
 # License: BSD Style.
 
 from abc import ABCMeta, abstractmethod
-from collections import defaultdict
-from itertools import izip
+from itertools import islice
 
 import numpy as np
 from scipy.sparse import issparse
@@ -124,6 +123,12 @@ class GaussianNB(BaseNB):
     `sigma_` : array, shape = [n_classes, n_features]
         variance of each feature per class
 
+    `class_count_` : array, shape = [n_classes]
+        number of training samples of each class
+
+    `m2_` : array, shape = [n_classes, n_features]
+        sum of squared differences from the mean of each feature per class
+
     Examples
     --------
     >>> import numpy as np
@@ -137,11 +142,13 @@ class GaussianNB(BaseNB):
     [1]
     """
 
-    def fit(self, X, y):
+    epsilon = 1e-9
+    
+    def fit(self, X, y, chunk_size=1000):
         """Fit Gaussian Naive Bayes according to X, y
         
-        Mean and variance are calculated using an online algorithm described here: 
-        http://en.wikipedia.org/wiki/Algorithms_for_calculating_variance#Online_algorithm
+        Mean and variance are calculated online in one pass. The samples are
+        read in chunks of chunk_size and merged with partial_fit.
 
         Parameters
         ----------
@@ -157,58 +164,227 @@ class GaussianNB(BaseNB):
             Returns self.
         """
         
-        self.classes_ = unique_y = np.unique(y)
-        n_classes = unique_y.shape[0]
+        self._reset()
+        
+        X = iter(X)
+        y = iter(y)
+        while True:
+            X_chunk = list(islice(X, chunk_size))
+            if len(X_chunk) == 0:
+                break
+            
+            y_chunk = list(islice(y, len(X_chunk)))
+            if len(y_chunk) != len(X_chunk):
+                raise ValueError("X and y have incompatible shapes")
+            
+            self.partial_fit(np.array(X_chunk), np.array(y_chunk))
+            
+        if not hasattr(self, 'classes_'):
+            raise ValueError("X is empty")
+        
+        return self
+    
+    def partial_fit(self, X, y):
+        """Update Gaussian Naive Bayes with a batch of samples X, y
+        
+        The count, mean and sum of squared differences from the mean (M2) of
+        each class in the batch are merged with the previous statistics: 
+        http://en.wikipedia.org/wiki/Algorithms_for_calculating_variance#Parallel_algorithm
+        
+        Classes which were not seen before are added.
 
-        #n_samples, n_features = X.shape
+        Parameters
+        ----------
+        X : array-like, shape = [n_samples, n_features]
+            Training vectors, where n_features is the number of features.
 
-        #if n_samples != y.shape[0]:
-        #    raise ValueError("X and y have incompatible shapes")
+        y : array-like, shape = [n_samples]
+            Target values.
 
-        first_sample = None
-        for one in X:
-            first_sample = one
-            break
-        n_features = first_sample.shape[0]
+        Returns
+        -------
+        self : object
+            Returns self.
+        """
+        X = array2d(X)
+        y = np.asarray(y)
+        
+        if X.shape[0] != y.shape[0]:
+            raise ValueError("X and y have incompatible shapes")
+        
+        if not hasattr(self, 'classes_'):
+            self._init_statistics(np.unique(y), X.shape[1])
+        else:
+            self._add_classes(np.unique(y))
+            
+        for i, y_i in enumerate(self.classes_):
+            X_i = X[y == y_i]
+            n_b = X_i.shape[0]
+            if n_b == 0:
+                continue
+            
+            mean_b = np.mean(X_i, axis=0)
+            M2_b = np.sum((X_i - mean_b) ** 2, axis=0)
+            
+            n_a = self.class_count_[i]
+            n = n_a + n_b
+            delta = mean_b - self.theta_[i, :]
+            
+            self.theta_[i, :] += delta * n_b / n
+            self.m2_[i, :] += M2_b + delta ** 2 * n_a * n_b / n
+            self.class_count_[i] = n
+            
+        self._update_parameters()
+        return self
+    
+    def partial_unfit(self, X, y):
+        """Remove a batch of samples X, y which was fitted before
+        
+        Inverse of partial_fit: the count, mean and M2 of each class in the
+        batch are split off the previous statistics. Classes without samples
+        are removed.
 
+        Parameters
+        ----------
+        X : array-like, shape = [n_samples, n_features]
+            Training vectors, where n_features is the number of features.
 
-        self.theta_ = np.zeros((n_classes, n_features))
-        self.sigma_ = np.zeros((n_classes, n_features))
-        self.class_prior_ = np.zeros(n_classes)
+        y : array-like, shape = [n_samples]
+            Target values.
+
+        Returns
+        -------
+        self : object
+            Returns self.
+        """
+        X = array2d(X)
+        y = np.asarray(y)
         
-        mapping = defaultdict()
-        for i, y_i in enumerate(unique_y):
-            mapping[y_i] = i
+        if X.shape[0] != y.shape[0]:
+            raise ValueError("X and y have incompatible shapes")
         
-        epsilon = 1e-9
+        if not hasattr(self, 'classes_') or \
+           np.setdiff1d(np.unique(y), self.classes_).shape[0] > 0:
+            raise ValueError("y contains classes which were not fitted")
         
-        #calculate mean (theta_) and variance (sigma_) online in one pass
-        n_samples = 0
-        M2 = np.zeros((n_classes, n_features))
-        for sample, y_i in izip(X, y):
-            n_samples += 1
-            i = mapping[y_i]
+        for i, y_i in enumerate(self.classes_):
+            X_i = X[y == y_i]
+            n_b = X_i.shape[0]
+            if n_b == 0:
+                continue
             
-            delta = sample[:] - self.theta_[i, :]
-            self.theta_[i, :] += delta[:]/n_samples
-            M2[i, :] += delta[:]*(sample[:]-self.theta_[i, :])
+            n = self.class_count_[i]
+            n_a = n - n_b
+            if n_a < 0:
+                raise ValueError("More samples of class %s than fitted" % y_i)
             
-        self.sigma_[:, :] = M2[:, :]/(n_samples -1) + epsilon
-
-        #calculate prior
-        for i, y_i in enumerate(unique_y):
-            self.class_prior_[i] = np.float(np.sum(y == y_i)) / n_samples
-        return self            
+            if n_a == 0:
+                self.theta_[i, :] = 0
+                self.m2_[i, :] = 0
+                self.class_count_[i] = 0
+                continue
+            
+            mean_b = np.mean(X_i, axis=0)
+            M2_b = np.sum((X_i - mean_b) ** 2, axis=0)
+            
+            mean_a = (self.theta_[i, :] * n - mean_b * n_b) / n_a
+            delta = mean_b - mean_a
+            
+            self.theta_[i, :] = mean_a
+            self.m2_[i, :] -= M2_b + delta ** 2 * n_a * n_b / n
+            #rounding errors must not make the variance negative
+            np.maximum(self.m2_[i, :], 0, out=self.m2_[i, :])
+            self.class_count_[i] = n_a
+        
+        self._remove_empty_classes()
+        if hasattr(self, 'classes_'):
+            self._update_parameters()
+        return self
+    
+    def get_statistics(self):
+        """Returns the sufficient statistics as dict of lists which can be 
+        stored and passed to set_statistics to continue training."""
+        return {'classes': self.classes_.tolist(),
+                'class_count': self.class_count_.tolist(),
+                'theta': self.theta_.tolist(),
+                'm2': self.m2_.tolist()}
+        
+    def set_statistics(self, statistics):
+        """Restores the sufficient statistics returned by get_statistics"""
+        self.classes_ = np.array(statistics['classes'])
+        self.class_count_ = np.array(statistics['class_count'], dtype=np.float64)
+        self.theta_ = np.array(statistics['theta'], dtype=np.float64)
+        self.m2_ = np.array(statistics['m2'], dtype=np.float64)
+        self._update_parameters()
+        return self
+    
+    def _reset(self):
+        for attribute in ('classes_', 'class_count_', 'theta_', 'm2_', 
+                          'sigma_', 'class_prior_'):
+            if hasattr(self, attribute):
+                delattr(self, attribute)
+    
+    def _init_statistics(self, classes, n_features):
+        n_classes = classes.shape[0]
+        self.classes_ = classes
+        self.class_count_ = np.zeros(n_classes)
+        self.theta_ = np.zeros((n_classes, n_features))
+        self.m2_ = np.zeros((n_classes, n_features))
+        
+    def _add_classes(self, classes):
+        new_classes = np.setdiff1d(classes, self.classes_)
+        if new_classes.shape[0] == 0:
+            return
+        
+        #keep classes sorted like np.unique
+        all_classes = np.union1d(self.classes_, new_classes)
+        positions = np.searchsorted(all_classes, self.classes_)
+        
+        n_features = self.theta_.shape[1]
+        class_count, theta, m2 = (self.class_count_, self.theta_, self.m2_)
+        self._init_statistics(all_classes, n_features)
+        self.class_count_[positions] = class_count
+        self.theta_[positions] = theta
+        self.m2_[positions] = m2
+        
+    def _remove_empty_classes(self):
+        keep = self.class_count_ > 0
+        if not np.any(keep):
+            self._reset()
+            return
+        
+        self.classes_ = self.classes_[keep]
+        self.class_count_ = self.class_count_[keep]
+        self.theta_ = self.theta_[keep]
+        self.m2_ = self.m2_[keep]
+        
+    def _update_parameters(self):
+        #unbiased variance of each class. A class with one sample has none.
+        n = np.maximum(self.class_count_ - 1, 1)
+        self.sigma_ = self.m2_ / n[:, np.newaxis] + self.epsilon
+        self.class_prior_ = self.class_count_ / np.sum(self.class_count_)
+        self._precompute_likelihood_terms()
+        
+    def _precompute_likelihood_terms(self):
+        #terms of the joint log likelihood which do not depend on the samples
+        self._inv_sigma = 1.0 / self.sigma_
+        self._theta_inv_sigma = self.theta_ * self._inv_sigma
+        self._theta_sq_inv_sigma = np.sum(self.theta_ ** 2 * self._inv_sigma, 
+                                          axis=1)
+        self._log_normalizer = (np.log(self.class_prior_) 
+                                - 0.5 * np.sum(np.log(np.pi * self.sigma_), axis=1))
 
     def _joint_log_likelihood(self, X):
         X = array2d(X)
-        joint_log_likelihood = []
-        for i in xrange(np.size(self.classes_)):
-            jointi = np.log(self.class_prior_[i])
-            n_ij = - 0.5 * np.sum(np.log(np.pi * self.sigma_[i, :]))
-            n_ij -= 0.5 * np.sum(((X - self.theta_[i, :]) ** 2) / \
-                                 (self.sigma_[i, :]), 1)
-            joint_log_likelihood.append(jointi + n_ij)
-
-        joint_log_likelihood = np.array(joint_log_likelihood).T
+        
+        if not hasattr(self, '_log_normalizer'):
+            #classifier pickled before the terms were precomputed
+            self._precompute_likelihood_terms()
+        
+        #sum((x - theta)**2 / sigma) = x**2 . 1/sigma - 2 x . theta/sigma 
+        #                              + sum(theta**2 / sigma)
+        squared_distances = (np.dot(X ** 2, self._inv_sigma.T) 
+                             - 2 * np.dot(X, self._theta_inv_sigma.T)
+                             + self._theta_sq_inv_sigma)
+        joint_log_likelihood = self._log_normalizer - 0.5 * squared_distances
         return joint_log_likelihood
\ No newline at end of file
@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+The MIT License (MIT)
+Copyright (c) 2012-2013 Karsten Jeschkies <jeskar@web.de>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of 
+this software and associated documentation files (the "Software"), to deal in 
+the Software without restriction, including without limitation the rights to use, 
+copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the 
+Software, and to permit persons to whom the Software is furnished to do so, 
+subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all 
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, 
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A 
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT 
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION 
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE 
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+'''
+
+'''
+@author: karsten jeschkies <jeskar@web.de>
+
+Nearest neighbour backends for SMOTE.
+
+A backend is fit on the samples and returns the indices of the k nearest
+samples for each query:
+
+>>> neighbours = LSHNeighbours(n_bits = 12, n_tables = 4)
+>>> neighbours.fit(X)
+>>> nn = neighbours.kneighbors(Q, k)
+
+ExactNeighbours uses the euclidean distance of sklearn. It is the default.
+CosineNeighbours compares L2-normalized samples, dense or sparse, with
+matrix products. LSHNeighbours only compares a query with the samples which
+share a random projection hash with it. It is approximate and sub-quadratic.
+neighbour_recall measures how many exact neighbours an approximate backend
+finds.
+'''
+
+import logging
+import numpy as np
+import scipy.sparse
+from sklearn.neighbors import NearestNeighbors
+from sklearn.utils import check_random_state
+
+logger = logging.getLogger("main")
+
+def normalize_rows(X):
+    '''
+    Returns a copy of the array or sparse matrix X with unit length rows.
+    Sparse matrices are returned in csr format.
+    '''
+    if scipy.sparse.issparse(X):
+        X = scipy.sparse.csr_matrix(X, dtype = np.float64, copy = True)
+        rows = np.repeat(np.arange(X.shape[0]), np.diff(X.indptr))
+        norms = np.sqrt(np.bincount(rows, weights = X.data**2, 
+                                    minlength = X.shape[0]))
+        norms[norms == 0] = 1.0
+        X.data /= norms[rows]
+        return X
+    
+    X = np.array(X, dtype = np.float64)
+    norms = np.sqrt((X**2).sum(axis = 1))
+    norms[norms == 0] = 1.0
+    return X / norms[:, np.newaxis]
+
+def similarities(A, B):
+    '''
+    Returns the dense matrix of dot products of the rows of A and B.
+    '''
+    if scipy.sparse.issparse(A):
+        result = A.dot(B.T)
+    elif scipy.sparse.issparse(B):
+        result = B.dot(A.T).T
+    else:
+        result = np.dot(A, B.T)
+        
+    if scipy.sparse.issparse(result):
+        result = result.toarray()
+    return np.asarray(result)
+
+def top_k(sims, k):
+    '''
+    Returns the column indices of the k biggest values of each row of sims
+    in descending order.
+    '''
+    k = min(k, sims.shape[1])
+    best = np.argpartition(-sims, k - 1, axis = 1)[:, :k]
+    rows = np.arange(sims.shape[0])[:, np.newaxis]
+    order = np.argsort(-sims[rows, best], axis = 1)
+    return best[rows, order]
+
+class ExactNeighbours(object):
+    '''
+    Exact euclidean neighbours with sklearn.neighbors.NearestNeighbors.
+    '''
+    approximate = False
+    
+    def fit(self, X):
+        self.neigh_ = NearestNeighbors()
+        self.neigh_.fit(X)
+        return self
+    
+    def kneighbors(self, Q, k):
+        return self.neigh_.kneighbors(Q, n_neighbors = k, 
+                                      return_distance = False)
+
+class CosineNeighbours(object):
+    '''
+    Exact cosine neighbours by sparse or dense matrix products. The queries 
+    are compared in chunks of chunk_size to limit memory usage.
+    '''
+    approximate = False
+    
+    def __init__(self, chunk_size = 1000):
+        self.chunk_size = chunk_size
+        
+    def fit(self, X):
+        self.X_ = normalize_rows(X)
+        return self
+    
+    def kneighbors(self, Q, k):
+        Q = normalize_rows(Q)
+        
+        nn = [top_k(similarities(Q[start:start + self.chunk_size], self.X_), k)
+              for start in xrange(0, Q.shape[0], self.chunk_size)]
+        
+        if len(nn) == 0:
+            return np.zeros((0, k), dtype = np.intp)
+        return np.vstack(nn)
+    
+class LSHNeighbours(object):
+    '''
+    Approximate cosine neighbours by random hyperplane hashing.
+    
+    Each of n_tables hash tables maps the signs of n_bits random projections
+    of a sample to the samples with the same signs. A query is only compared
+    with the samples in its buckets. Queries with less than k candidates are
+    compared with all samples.
+    '''
+    approximate = True
+    
+    def __init__(self, n_bits = 12, n_tables = 4, random_state = None):
+        self.n_bits = n_bits
+        self.n_tables = n_tables
+        self.random_state = random_state
+        
+    def fit(self, X):
+        random_state = check_random_state(self.random_state)
+        
+        self.X_ = normalize_rows(X)
+        self.planes_ = [random_state.normal(size = (self.X_.shape[1], self.n_bits))
+                        for _ in xrange(self.n_tables)]
+        
+        #bucket code -> sample indices for each table
+        self.tables_ = []
+        for codes in self.__codes(self.X_):
+            order = np.argsort(codes, kind = 'mergesort')
+            keys, starts = np.unique(codes[order], return_index = True)
+            buckets = np.split(order, starts[1:])
+            self.tables_.append(dict(zip(keys, buckets)))
+            
+        return self
+    
+    def __codes(self, X):
+        '''
+        Returns an array of bucket codes of X for each table.
+        '''
+        powers = 1 << np.arange(self.n_bits, dtype = np.int64)
+        return [(similarities(X, planes.T) > 0).astype(np.int64).dot(powers)
+                for planes in self.planes_]
+        
+    def kneighbors(self, Q, k):
+        Q = normalize_rows(Q)
+        codes = self.__codes(Q)
+        
+        n_samples = self.X_.shape[0]
+        empty = np.zeros(0, dtype = np.intp)
+        
+        nn = np.zeros((Q.shape[0], min(k, n_samples)), dtype = np.intp)
+        for i in xrange(Q.shape[0]):
+            candidates = np.unique(np.concatenate([table.get(table_codes[i], empty)
+                                                   for table, table_codes 
+                                                   in zip(self.tables_, codes)]))
+            if len(candidates) < k:
+                candidates = np.arange(n_samples)
+            
+            sims = similarities(Q[i:i + 1], self.X_[candidates])
+            nn[i] = candidates[top_k(sims, k)[0]]
+            
+        return nn
+    
+def neighbour_recall(neighbours, X, k, exact = None, n_queries = 100, 
+                     random_state = None):
+    '''
+    Returns the mean fraction of the exact k nearest neighbours which the 
+    backend neighbours, fit on X, finds for n_queries random samples of X.
+    
+    exact : exact backend of the same metric, CosineNeighbours by default
+    '''
+    if exact is None:
+        exact = CosineNeighbours()
+        
+    random_state = check_random_state(random_state)
+    queries = random_state.permutation(X.shape[0])[:n_queries]
+    
+    approximate_nn = neighbours.kneighbors(X[queries], k)
+    exact_nn = exact.fit(X).kneighbors(X[queries], k)
+    
+    found = [len(np.intersect1d(a, e)) / float(len(e)) 
+             for a, e in zip(approximate_nn, exact_nn)]
+    return np.mean(found) if len(found) > 0 else 1.0
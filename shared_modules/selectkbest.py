@@ -11,10 +11,12 @@
 
 from abc import ABCMeta, abstractmethod
 
-from collections import defaultdict
+import itertools
 import logging
+import multiprocessing
 import numpy as np
 from scipy import stats
+import scipy.sparse
 
 from sklearn.feature_selection import SelectKBest
 from sklearn.utils import array2d, atleast2d_or_csr, deprecated, \
@@ -27,19 +29,219 @@ logger = logging.getLogger('gensim.models.esamodel')
 # Scoring functions
 
 
+class ClassifAccumulator(object):
+    """Accumulates the statistics of the Anova F-value sample by sample.
+
+    The statistics are the number of samples per class, the sum of the samples
+    of each class and the sum of squares of all samples. The memory usage only
+    depends on the number of features and classes. An accumulator can be 
+    pickled to resume an interrupted computation.
+
+    A sample X is either a dense array of length n_features, a sparse vector 
+    in gensim format, i.e. a list of (feature id, weight) tuples, or a scipy 
+    sparse row. Only the non-zero entries of sparse samples are accumulated.
+
+    Parameters
+    ----------
+    n_features : number of features. Length of X
+    """
+    
+    def __init__(self, n_features):
+        self.n_features = n_features
+        self.n_samples = 0
+        self.n_samples_per_class = {}
+        self.sums_args_d = {}
+        self.ss_alldata = np.zeros(shape=(n_features))
+        
+    def add(self, X, y):
+        if y not in self.sums_args_d:
+            self.n_samples_per_class[y] = 0
+            self.sums_args_d[y] = np.zeros(shape=(self.n_features))
+            
+        self.n_samples += 1
+        self.n_samples_per_class[y] += 1
+        
+        sparse_X = _as_sparse_vector(X)
+        if sparse_X is not None:
+            ids, weights = sparse_X
+            self.ss_alldata[ids] += weights**2
+            self.sums_args_d[y][ids] += weights
+        else:
+            self.ss_alldata[:] += X[:]**2
+            self.sums_args_d[y][:] += X[:]
+        
+    def add_batch(self, X, y):
+        """Adds the samples X, shape = [n_samples, n_features], with classes y 
+        at once. X is an array, a scipy sparse matrix or a list of samples."""
+        X = _as_matrix(X, self.n_features)
+        y = list(y)
+        y_array = np.asarray(y)
+        
+        self.n_samples += len(y)
+        if scipy.sparse.issparse(X):
+            self.ss_alldata += np.asarray(X.multiply(X).sum(axis=0)).ravel()
+        else:
+            self.ss_alldata += (X**2).sum(axis=0)
+        
+        for c in set(y):
+            if c not in self.sums_args_d:
+                self.n_samples_per_class[c] = 0
+                self.sums_args_d[c] = np.zeros(shape=(self.n_features))
+                
+            mask = y_array == c
+            self.n_samples_per_class[c] += int(mask.sum())
+            self.sums_args_d[c] += np.asarray(X[np.flatnonzero(mask)].sum(axis=0)).ravel()
+            
+    def merge(self, other):
+        """Adds the statistics of accumulator other"""
+        self.n_samples += other.n_samples
+        self.ss_alldata += other.ss_alldata
+        
+        for c, sums in other.sums_args_d.iteritems():
+            if c not in self.sums_args_d:
+                self.n_samples_per_class[c] = 0
+                self.sums_args_d[c] = np.zeros(shape=(self.n_features))
+                
+            self.n_samples_per_class[c] += other.n_samples_per_class[c]
+            self.sums_args_d[c] += sums
+        
+    def scores(self):
+        """Compute the Anova F-value of the accumulated samples
+
+        Returns
+        -------
+        F : array, shape = [n_features,]
+            The set of F values
+        pval : array, shape = [n_features,]
+            The set of p-values
+        """
+        n_samples = self.n_samples
+        classes = self.sums_args_d.keys()
+        n_classes = len(classes)
+        
+        #Convert dictionary to numpy array
+        sums_args = np.array(list(self.sums_args_d[y] for y in classes))
+        
+        square_of_sums_alldata = safe_sqr(reduce(lambda x, y: x + y, sums_args))
+        square_of_sums_args = [safe_sqr(s) for s in sums_args]
+        sstot = self.ss_alldata - square_of_sums_alldata / float(n_samples)
+        ssbn = 0.
+        for k, y in enumerate(classes):
+            ssbn += square_of_sums_args[k] / self.n_samples_per_class[y]
+        ssbn -= square_of_sums_alldata / float(n_samples)
+        sswn = sstot - ssbn
+        dfbn = n_classes - 1
+        dfwn = n_samples - n_classes
+        msb = ssbn / float(dfbn)
+        msw = sswn / float(dfwn)
+        f = msb / msw
+        # flatten matrix to vector in sparse case
+        f = np.asarray(f).ravel()
+        prob = stats.fprob(dfbn, dfwn, f)
+        return f, prob
+
+
+def _is_gensim_vector(X):
+    return isinstance(X, list) and (len(X) == 0 or isinstance(X[0], tuple))
+
+
+def _as_sparse_vector(X):
+    """Returns (ids, weights) of a sparse sample X or None if X is dense.
+    The ids have to be unique."""
+    if scipy.sparse.issparse(X):
+        X = X.tocsr()
+        X.sum_duplicates()
+        return X.indices, X.data
+    
+    if _is_gensim_vector(X):
+        if len(X) == 0:
+            return np.zeros(0, dtype=np.intp), np.zeros(0)
+        ids, weights = zip(*X)
+        return np.asarray(ids, dtype=np.intp), np.asarray(weights, dtype=float)
+    
+    return None
+
+
+def _as_matrix(X, n_features):
+    """Converts a list of samples to an array or a csr matrix if the samples
+    are sparse."""
+    if scipy.sparse.issparse(X):
+        return X.tocsr()
+    
+    if isinstance(X, list) and len(X) > 0:
+        if scipy.sparse.issparse(X[0]):
+            return scipy.sparse.vstack(X, format='csr')
+        
+        if _is_gensim_vector(X[0]):
+            indptr = np.cumsum([0] + [len(x) for x in X])
+            ids = [i for x in X for i, _ in x]
+            weights = [w for x in X for _, w in x]
+            return scipy.sparse.csr_matrix((np.asarray(weights, dtype=float),
+                                            np.asarray(ids, dtype=np.intp),
+                                            indptr),
+                                           shape=(len(X), n_features))
+        
+    return np.asarray(X)
+
+
+# Function which is applied to each X of a chunk in the workers of if_classif.
+# Set before the workers are forked.
+_transform = None
+
+def _accumulate_chunk(args):
+    n_features, X, y = args
+    
+    accumulator = ClassifAccumulator(n_features)
+    if _transform is None:
+        accumulator.add_batch(X, y)
+        return accumulator
+    
+    # Transform one sample at a time. The transformed samples can be dense and
+    # large, so a worker never holds more than one of them.
+    for X_i, y_i in itertools.izip(X, y):
+        accumulator.add(_transform(X_i), y_i)
+    return accumulator
+
+
+def _chunks(X_y, n_features, chunk_size):
+    X_y = iter(X_y)
+    while True:
+        chunk = list(itertools.islice(X_y, chunk_size))
+        if len(chunk) == 0:
+            return
+        
+        X, y = zip(*chunk)
+        yield n_features, list(X), list(y)
+        
+
 # The following function is a rewriting of sklearn.univariate_selection.f_oneway
 # The memory usage is independent of samples and only depends on the number of
 # features.
-def if_classif(X_y, n_features):
+def if_classif(X_y, n_features, accumulator=None, checkpoint=None, 
+               checkpoint_interval=1000, processes=1, chunk_size=1000,
+               transform=None):
     """Compute the Anova F-value for the provided sample
 
     Parameters
     ----------
     X_y : Tuples of (X, y) with 
           X {array-like, sparse matrix} shape = [n_samples, n_features]
-          The set of regressors that will tested sequentially
+          The set of regressors that will tested sequentially. Each X can
+          also be a sparse vector in gensim format.
           y array of shape(n_samples)
           The data matrix
+    accumulator : ClassifAccumulator to continue, e.g. loaded from a 
+                  checkpoint. X_y has to start after its last sample.
+    checkpoint : Callable which is called with the accumulator every 
+                 checkpoint_interval samples, e.g. to save it.
+    processes : With processes > 1 or a transform the samples are accumulated
+                in chunks of chunk_size samples by a pool of worker processes. 
+                The partial accumulators are merged in order.
+    transform : Callable which maps a single X to a sample of n_features in
+                the workers. Use it to move an expensive transformation of the
+                samples into the workers. The samples of a chunk are 
+                transformed one by one, so the memory of a worker does not
+                grow with chunk_size.
 
     Returns
     -------
@@ -49,44 +251,69 @@ def if_classif(X_y, n_features):
         The set of p-values
     """
     
-    n_samples = 0
-    n_samples_per_class = defaultdict(lambda: 0)
-    
-    sums_args_d = defaultdict(lambda: np.zeros(shape=(n_features))) 
-    ss_alldata = np.zeros(shape=(n_features))
+    if accumulator is None:
+        accumulator = ClassifAccumulator(n_features)
+        
+    if processes > 1 or transform is not None:
+        return _if_classif_chunked(X_y, n_features, accumulator, checkpoint,
+                                   checkpoint_interval, processes, chunk_size,
+                                   transform)
     
     for X, y in X_y:
-        if(n_samples % 100) == 0:
-            logger.info("Processing doc #%d..." % n_samples)
+        if(accumulator.n_samples % 100) == 0:
+            logger.info("Processing doc #%d..." % accumulator.n_samples)
             
-        n_samples += 1
-        n_samples_per_class[y] += 1
-        
-        ss_alldata[:] += X[:]**2
-        sums_args_d[y][:] += X[:]
+        accumulator.add(X, y)
         
-    n_classes = len(sums_args_d.keys())
+        if checkpoint is not None and \
+           accumulator.n_samples % checkpoint_interval == 0:
+            checkpoint(accumulator)
+            
+    return accumulator.scores()
+
+
+def _if_classif_chunked(X_y, n_features, accumulator, checkpoint, 
+                        checkpoint_interval, processes, chunk_size, transform):
+    global _transform
+    _transform = transform
     
-    #Convert dictionary to numpy array
-    sums_args = np.array(list(row for row in sums_args_d.itervalues()))
+    chunks = _chunks(X_y, n_features, chunk_size)
     
-    square_of_sums_alldata = safe_sqr(reduce(lambda x, y: x + y, sums_args))
-    square_of_sums_args = [safe_sqr(s) for s in sums_args]
-    sstot = ss_alldata - square_of_sums_alldata / float(n_samples)
-    ssbn = 0.
-    for k, y in enumerate(n_samples_per_class.keys()):
-        ssbn += square_of_sums_args[k] / n_samples_per_class[y]
-    ssbn -= square_of_sums_alldata / float(n_samples)
-    sswn = sstot - ssbn
-    dfbn = n_classes - 1
-    dfwn = n_samples - n_classes
-    msb = ssbn / float(dfbn)
-    msw = sswn / float(dfwn)
-    f = msb / msw
-    # flatten matrix to vector in sparse case
-    f = np.asarray(f).ravel()
-    prob = stats.fprob(dfbn, dfwn, f)
-    return f, prob
+    pool = None
+    if processes > 1:
+        pool = multiprocessing.Pool(processes)
+        results = _imap_bounded(pool, chunks, 2 * processes)
+    else:
+        results = itertools.imap(_accumulate_chunk, chunks)
+        
+    try:
+        for partial in results:
+            last_checkpoint = accumulator.n_samples // checkpoint_interval
+            accumulator.merge(partial)
+            logger.info("Processed %d docs..." % accumulator.n_samples)
+            
+            if checkpoint is not None and \
+               accumulator.n_samples // checkpoint_interval > last_checkpoint:
+                checkpoint(accumulator)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        _transform = None
+        
+    return accumulator.scores()
+
+
+def _imap_bounded(pool, chunks, window):
+    """Like pool.imap(_accumulate_chunk, chunks) but reads at most window 
+    chunks ahead. pool.imap would read the whole stream into memory."""
+    while True:
+        batch = list(itertools.islice(chunks, window))
+        if len(batch) == 0:
+            return
+        
+        for partial in pool.imap(_accumulate_chunk, batch):
+            yield partial
 
 
 ######################################################################
@@ -115,16 +342,18 @@ class iSelectKBest(SelectKBest):
 
     """
         
-    def fit(self, X_y, n_features):
+    def fit(self, X_y, n_features, **params):
         """
         Evaluate the function
         
         Parameters
         ==========
-        X_y: iterable over tuples (X, y) 
+        X_y: iterable over tuples (X, y). X is a dense array, a gensim sparse
+             vector or a scipy sparse row.
         n_features: number of features. Length of X
+        params: additional keyword arguments of score_func
         """
-        scores = self.score_func(X_y, n_features)
+        scores = self.score_func(X_y, n_features, **params)
         self.scores_ = scores[0]
         self.pvalues_ = scores[1]
         return self
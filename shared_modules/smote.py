@@ -32,13 +32,14 @@ See: "SMOTE: synthetic minority over-sampling technique" by
 Chawla, N.V et al.
 '''
 import logging
+from neighbours import ExactNeighbours, neighbour_recall
 import numpy as np
-from random import randrange, choice
-from sklearn.neighbors import NearestNeighbors
+import scipy.sparse
+from sklearn.utils import check_random_state
 
 logger = logging.getLogger("main")
 
-def SMOTE(T, N, k, h = 1.0):
+def SMOTE(T, N, k, h = 1.0, random_state = None, neighbours = None):
     """
     Returns (N/100) * n_minority_samples synthetic minority samples.
 
@@ -48,7 +49,13 @@ def SMOTE(T, N, k, h = 1.0):
         Holds the minority samples
     N : percetange of new synthetic samples: 
         n_synthetic_samples = N/100 * n_minority_samples. Can be < 100.
-    k : int. Number of nearest neighbours. 
+    k : int. Number of nearest neighbours including the sample itself. 
+    h : high in random.uniform to scale dif of snythetic sample
+    random_state : None, int or numpy RandomState used to draw neighbours 
+                   and gaps
+    neighbours : nearest neighbour backend, see neighbours.py. 
+                 ExactNeighbours by default. T can be a scipy sparse matrix if
+                 the backend supports it.
 
     Returns
     -------
@@ -66,30 +73,53 @@ def SMOTE(T, N, k, h = 1.0):
     if (N % 100) != 0:
         raise ValueError("N must be < 100 or multiple of 100")
     
+    if k < 2:
+        raise ValueError("k must be > 1. The neighbours include the sample itself.")
+    
     N = N/100
     n_synthetic_samples = N * n_minority_samples
-    S = np.zeros(shape=(n_synthetic_samples, n_features))
     
-    #Learn nearest neighbours
-    neigh = NearestNeighbors(n_neighbors = k)
-    neigh.fit(T)
+    if n_minority_samples == 0:
+        return T[:0]
+    
+    random_state = check_random_state(random_state)
+    
+    #Learn nearest neighbours and query all samples at once
+    if neighbours is None:
+        neighbours = ExactNeighbours()
+    neighbours.fit(T)
+    nn = neighbours.kneighbors(T, k)
+    
+    if neighbours.approximate:
+        recall = neighbour_recall(neighbours, T, k, random_state = random_state)
+        logger.info("Approximate neighbours contain %.1f%% of exact neighbours." %
+                    (100 * recall))
+    
+    #NOTE: nn includes T[i], we don't want to select it.
+    #Move the other neighbours to the front of each row. 
+    others = nn != np.arange(n_minority_samples)[:, np.newaxis]
+    order = np.argsort(~others, axis = 1, kind = 'mergesort')
+    candidates = nn[np.arange(n_minority_samples)[:, np.newaxis], order]
+    n_candidates = others.sum(axis = 1)
+    
+    #draw N neighbours for each sample. Sample i creates rows i*N to (i+1)*N-1
+    samples = np.repeat(np.arange(n_minority_samples), N)
+    choices = (random_state.uniform(size = n_synthetic_samples) * 
+               n_candidates[samples]).astype(np.intp)
+    neighbour_indices = candidates[samples, choices]
     
     #Calculate synthetic samples
-    for i in xrange(n_minority_samples):
-        nn = neigh.kneighbors(T[i], return_distance=False)
-        for n in xrange(N):
-            nn_index = choice(nn[0])
-            #NOTE: nn includes T[i], we don't want to select it 
-            while nn_index == i:
-                nn_index = choice(nn[0])
-                
-            dif = T[nn_index] - T[i]
-            gap = np.random.uniform(low = 0.0, high = h)
-            S[n + i * N, :] = T[i,:] + gap * dif[:]
+    gaps = random_state.uniform(low = 0.0, high = h, size = n_synthetic_samples)
+    dif = T[neighbour_indices] - T[samples]
+    if scipy.sparse.issparse(T):
+        S = (T[samples] + dif.multiply(gaps[:, np.newaxis])).tocsr()
+    else:
+        S = T[samples] + gaps[:, np.newaxis] * dif
     
     return S
 
-def borderlineSMOTE(X, y, minority_target, N, k):
+def borderlineSMOTE(X, y, minority_target, N, k, random_state = None,
+                    neighbours = None):
     """
     Returns synthetic minority samples.
 
@@ -103,7 +133,8 @@ def borderlineSMOTE(X, y, minority_target, N, k):
     N : percetange of new synthetic samples: 
         n_synthetic_samples = N/100 * n_minority_samples. Can be < 100.
     k : int. Number of nearest neighbours. 
-    h : high in random.uniform to scale dif of snythetic sample
+    random_state : None, int or numpy RandomState passed to SMOTE
+    neighbours : nearest neighbour backend, see SMOTE
 
     Returns
     -------
@@ -111,37 +142,39 @@ def borderlineSMOTE(X, y, minority_target, N, k):
     synthetic : Synthetic sample of minorities in danger zone
     danger : Minorities of danger zone
     """ 
+    y = np.asarray(y)
+    minority_indices = np.flatnonzero(y == minority_target)
     
-    n_samples, _ = X.shape
+    if len(minority_indices) == 0:
+        empty = X[minority_indices]
+        return empty, empty, empty
 
     #Learn nearest neighbours on complete training set
-    neigh = NearestNeighbors(n_neighbors = k)
-    neigh.fit(X)
+    if neighbours is None:
+        neighbours = ExactNeighbours()
+    neighbours.fit(X)
     
-    safe_minority_indices = list()
-    danger_minority_indices = list()
+    #query all minorities at once
+    nn = neighbours.kneighbors(X[minority_indices], k)
+    n_neighbours = nn.shape[1]
     
-    for i in xrange(n_samples):
-        if y[i] != minority_target: continue
-        
-        nn = neigh.kneighbors(X[i], return_distance=False)
-
-        majority_neighbours = 0
-        for n in nn[0]:
-            if y[n] != minority_target:
-                majority_neighbours += 1
-                
-        if majority_neighbours == len(nn):
-            continue
-        elif majority_neighbours < (len(nn)/2):
-            logger.debug("Add sample to safe minorities.")
-            safe_minority_indices.append(i)
-        else:
-            #DANGER zone
-            danger_minority_indices.append(i)
+    majority_neighbours = (y[nn] != minority_target).sum(axis = 1)
+    
+    #minorities with fewer than half majority neighbours are safe,
+    #minorities with only majority neighbours are noise and dropped
+    safe = 2 * majority_neighbours < n_neighbours
+    danger = ~safe & (majority_neighbours < n_neighbours)
+    
+    safe_minority_indices = minority_indices[safe]
+    danger_minority_indices = minority_indices[danger]
+    
+    logger.debug("%d safe and %d danger minorities." % 
+                 (len(safe_minority_indices), len(danger_minority_indices)))
             
     #SMOTE danger minority samples
-    synthetic_samples = SMOTE(X[danger_minority_indices], N, k, h = 0.5)
+    synthetic_samples = SMOTE(X[danger_minority_indices], N, k, h = 0.5,
+                              random_state = random_state,
+                              neighbours = neighbours)
     
     return (X[safe_minority_indices],
             synthetic_samples, 
@@ -76,6 +76,12 @@ class ArticleRankerTest(unittest.TestCase):
 
         self.assertEqual(vendor.config, 'vendor config')
         
+    def test_get_subscriber_ids(self):
+        vendor = self.ranker.get_vendor(self.article_as_dict)
+        user = User.objects(name = "Karsten Jeschkies").first()
+        
+        self.assertEqual([user.id], self.ranker.get_subscriber_ids(vendor))
+        
     def test_save_article_false(self):
         vendor = self.ranker.get_vendor(self.article_as_dict)  
         stored_article = self.ranker.save_article(vendor, 
@@ -100,6 +106,11 @@ class ArticleRankerTest(unittest.TestCase):
         self.assertEqual(3, ranked_articles.count())
         self.assertEqual(1.0, ranked_articles[0].rating) 
 
+    def test_flush_size_needs_interval(self):
+        #the last ratings would never be written
+        self.assertRaises(ValueError, ArticleRanker, 
+                          extractor = self.feature_extractor, flush_size = 10)
+        
     def test_rank_article(self):
         pass
         #some error in genism. probably because some features are not quite right
@@ -46,7 +46,7 @@ class CentroidClassifierTest(unittest.TestCase):
         clf = CentroidClassifier()
         clf.fit(self.X, self.Y)
         
-        np.testing.assert_almost_equal(clf.similarity_index.index[1], 
+        np.testing.assert_almost_equal(clf.centroids_[1], 
                                       [-2, -1.33333], 
                                       decimal = 5)
     
@@ -56,6 +56,13 @@ class CentroidClassifierTest(unittest.TestCase):
         result = clf.predict([[-0.8, -1]])
         
         self.assertEqual(result, [2])
+        
+    def test_predict_batch(self):
+        clf = CentroidClassifier()
+        clf.fit(self.X, self.Y)
+        result = clf.predict(self.X)
+        
+        np.testing.assert_array_equal(self.Y, result)
 
 if __name__ == "__main__":
     #import sys;sys.argv = ['', 'Test.testName']
@@ -31,7 +31,9 @@ Created on 23.11.2012
 from cosine_esamodel import CosineEsaModel, DocumentTitles
 from feature_extractor.extractors import (EsaFeatureExtractor, 
                                           TfidfFeatureExtractor,
-                                          LdaFeatureExtractor)
+                                          LdaFeatureExtractor,
+                                          cEsaFeatureExtractor)
+from feature_extractor.model_bundle import load_cesa, save_bundle
 from gensim import utils, matutils
 from gensim.corpora import Dictionary, MmCorpus
 from gensim.models import tfidfmodel
@@ -41,6 +43,9 @@ from models.mongodb_models import (Article, Features, User, UserModel,
                                    RankedArticle, ReadArticleFeedback)
 from mongoengine import *
 import numpy as np
+import os
+import shutil
+import tempfile
 import unittest 
 from utils.helper import load_config
 from random import sample
@@ -238,6 +243,128 @@ class TestCosineESAModel(unittest.TestCase):
         print esa_test_doc
         #for concept_id, weight in sorted(esa_test_doc, key=lambda item: -item[1]):
         #    print "%s %.3f" % (esa_model.document_titles[concept_id], weight)
+        
+    def test_num_best(self):
+        tfidf_model = tfidfmodel.TfidfModel(corpus, normalize=True)
+        esa_model = CosineEsaModel(tfidf_model[corpus],
+                                   document_titles = concepts,
+                                   test_corpus = test_corpus, 
+                                   test_corpus_targets = [1,2,2],
+                                   num_test_corpus = 3,
+                                   num_best_features = 3, 
+                                   num_features = len(dictionary))
+        
+        tfidf_test_doc = tfidf_model[dictionary.doc2bow(['graph', 'minors', 'trees'])]
+        full_esa_test_doc = esa_model[tfidf_test_doc]
+        best_concept_id, _ = max(full_esa_test_doc, key = lambda item: item[1])
+        
+        esa_model.num_best = 1
+        esa_test_doc = esa_model[tfidf_test_doc]
+        
+        self.assertEqual(1, len(esa_test_doc))
+        self.assertEqual(best_concept_id, esa_test_doc[0][0])
+        self.assertAlmostEqual(1.0, esa_test_doc[0][1])
+        
+    def test_save_load(self):
+        tfidf_model = tfidfmodel.TfidfModel(corpus, normalize=True)
+        esa_model = CosineEsaModel(tfidf_model[corpus],
+                                   document_titles = concepts,
+                                   test_corpus = test_corpus, 
+                                   test_corpus_targets = [1,2,2],
+                                   num_test_corpus = 3,
+                                   num_best_features = 3, 
+                                   num_features = len(dictionary))
+        tfidf_test_doc = tfidf_model[dictionary.doc2bow(['graph', 'minors', 'trees'])]
+        
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            prefix = os.path.join(tmp_dir, "test")
+            dictionary.save(prefix + "_wordids.dict")
+            esa_model.save(prefix + "_cesa.model")
+            
+            loaded = CosineEsaModel.load(prefix + "_cesa.model")
+            self.assertTrue(isinstance(loaded.similarity_index.index, np.memmap))
+            self.assertEqual(esa_model[tfidf_test_doc], loaded[tfidf_test_doc])
+            
+            #the bundle is a copy, the saved model stays loadable
+            save_bundle(prefix)
+            bundled = load_cesa(prefix)
+            loaded = CosineEsaModel.load(prefix + "_cesa.model")
+            self.assertEqual(esa_model[tfidf_test_doc], bundled[tfidf_test_doc])
+            self.assertEqual(esa_model[tfidf_test_doc], loaded[tfidf_test_doc])
+            self.assertEqual(list(esa_model.document_titles), 
+                             list(bundled.document_titles))
+        finally:
+            shutil.rmtree(tmp_dir)
+        
+    def test_extractor_version(self):
+        tfidf_model = tfidfmodel.TfidfModel(corpus, normalize=True)
+        esa_model = CosineEsaModel(tfidf_model[corpus],
+                                   document_titles = concepts,
+                                   test_corpus = test_corpus, 
+                                   test_corpus_targets = [1,2,2],
+                                   num_test_corpus = 3,
+                                   num_best_features = 3, 
+                                   num_features = len(dictionary))
+        
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            prefix = os.path.join(tmp_dir, "test")
+            dictionary.save(prefix + "_wordids.dict")
+            tfidf_model.save(prefix + "_tfidf.model")
+            esa_model.save(prefix + "_cesa.model")
+            
+            versions = [cEsaFeatureExtractor(prefix).get_version(),
+                        cEsaFeatureExtractor(prefix, num_best = 2).get_version(),
+                        cEsaFeatureExtractor(prefix, num_best = 2, 
+                                             threshold = 0.5).get_version()]
+        finally:
+            shutil.rmtree(tmp_dir)
+        
+        #features of different top-k settings are not mixed up
+        self.assertEqual(u"cESA-1.1", versions[0])
+        self.assertEqual(3, len(set(versions)))
+        
+    def test_resume_interrupted_build(self):
+        tfidf_model = tfidfmodel.TfidfModel(corpus, normalize=True)
+        tfidf_corpus = list(tfidf_model[corpus])
+        test_corpus_targets = [1,2,2]
+        
+        def build(test_corpus, checkpoint_prefix = None):
+            return CosineEsaModel(tfidf_corpus,
+                                  document_titles = concepts,
+                                  test_corpus = test_corpus, 
+                                  test_corpus_targets = test_corpus_targets,
+                                  num_test_corpus = 3,
+                                  num_best_features = 3, 
+                                  num_features = len(dictionary),
+                                  checkpoint_prefix = checkpoint_prefix,
+                                  checkpoint_interval = 1)
+        
+        def interrupted_test_corpus():
+            for doc in test_corpus[:2]:
+                yield doc
+            raise KeyboardInterrupt()
+        
+        uninterrupted = build(test_corpus)
+        
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            prefix = os.path.join(tmp_dir, "cesa")
+            self.assertRaises(KeyboardInterrupt, build, 
+                              interrupted_test_corpus(), prefix)
+            self.assertTrue(os.path.exists(prefix + ".similarity"))
+            self.assertTrue(os.path.exists(prefix + ".selection"))
+            
+            #the resumed build skips the two checkpointed test documents
+            resumed = build(test_corpus, prefix)
+        finally:
+            shutil.rmtree(tmp_dir)
+            
+        self.assertEqual(list(uninterrupted.selector.get_support()),
+                         list(resumed.selector.get_support()))
+        self.assertEqual(list(uninterrupted.document_titles), 
+                         list(resumed.document_titles))
          
     #@unittest.skip("Skip bigger test") 
     def test_constructor_with_file_wikicorpus(self):
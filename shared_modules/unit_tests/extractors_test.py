@@ -30,7 +30,15 @@ Created on 22.11.2012
 from feature_extractor.extractors import (EsaFeatureExtractor, 
                                           TfidfFeatureExtractor, 
                                           LdaFeatureExtractor)
+from feature_extractor.model_bundle import (MmapDictionary, load_lda, 
+                                            save_bundle)
+from gensim.corpora import Dictionary
+from gensim.models import LdaModel
 import logging
+import numpy
+import os
+import shutil
+import tempfile
 import unittest
 from utils.helper import load_config
 
@@ -55,6 +63,57 @@ class LDAFeatureExtractorTest(unittest.TestCase):
         num_topics = feature_extractor.get_feature_number()
         self.assertEqual(500, num_topics)
 
+        
+class MmapDictionaryTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.texts = [['human', 'interface', 'computer'],
+                      ['survey', 'user', 'computer', 'system', 'response', 'time'],
+                      ['eps', 'user', 'interface', 'system'],
+                      ['graph', 'minors', 'survey']]
+        self.dictionary = Dictionary(self.texts)
+        self.tmp_dir = tempfile.mkdtemp()
+        
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+        
+    def test_doc2bow(self):
+        mmap_dictionary = MmapDictionary(self.dictionary)
+        
+        document = ['system', 'human', 'system', 'unknown', 'a_very_long_unknown_token']
+        self.assertEqual(self.dictionary.doc2bow(document),
+                         mmap_dictionary.doc2bow(document))
+        self.assertEqual(len(self.dictionary), len(mmap_dictionary))
+        
+    def test_save_load(self):
+        fname = os.path.join(self.tmp_dir, "test_wordids.mmdict")
+        MmapDictionary(self.dictionary).save(fname)
+        mmap_dictionary = MmapDictionary.load(fname)
+        
+        for text in self.texts:
+            self.assertEqual(self.dictionary.doc2bow(text),
+                             mmap_dictionary.doc2bow(text))
+        token_id = self.dictionary.token2id['graph']
+        self.assertEqual(u'graph', mmap_dictionary[token_id])
+        
+    def test_bundle_lda(self):
+        prefix = os.path.join(self.tmp_dir, "test")
+        corpus = [self.dictionary.doc2bow(text) for text in self.texts]
+        lda_model = LdaModel(corpus, id2word = self.dictionary, num_topics = 2)
+        self.dictionary.save(prefix + "_wordids.dict")
+        lda_model.save(prefix + "_lda.model")
+        
+        save_bundle(prefix)
+        bundled = load_lda(prefix)
+        
+        #id2word is not stored with the LDA model but attached at load
+        self.assertTrue(isinstance(bundled.id2word, MmapDictionary))
+        self.assertTrue(isinstance(bundled.expElogbeta, numpy.memmap))
+        token_id = self.dictionary.token2id['graph']
+        self.assertEqual(u'graph', bundled.id2word[token_id])
+        self.assertTrue(numpy.allclose(lda_model.expElogbeta, 
+                                       bundled.expElogbeta))
+
 
 if __name__ == "__main__":
     #import sys;sys.argv = ['', 'Test.testName']
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+The MIT License (MIT)
+Copyright (c) 2012-2013 Karsten Jeschkies <jeskar@web.de>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of 
+this software and associated documentation files (the "Software"), to deal in 
+the Software without restriction, including without limitation the rights to use, 
+copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the 
+Software, and to permit persons to whom the Software is furnished to do so, 
+subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all 
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, 
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A 
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT 
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION 
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE 
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+'''
+'''
+@author: karsten jeschkies <jeskar@web.de>
+'''
+from feature_queue import FeatureQueue
+import logging
+from models.mongodb_models import Article, Features
+from mongoengine import *
+import unittest
+
+logger = logging.getLogger("unittesting")
+
+#Connect to test database
+connect("nyan_test", port = 20545)
+
+class CountingExtractor(object):
+    
+    def __init__(self):
+        self.batches = []
+    
+    def get_features_batch(self, documents, processes = 1):
+        self.batches.append(documents)
+        return [[(0, float(len(document)))] for document in documents]
+    
+    @classmethod
+    def get_version(cls):
+        return u"Counting-1.0"
+
+class FeatureQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        Article.drop_collection()
+        
+        self.articles = [Article(headline = "Test %d" % i, 
+                                 clean_content = "a" * (i + 1),
+                                 features = Features(version = u"Old-0.1", 
+                                                     data = [(1, 1.0)]))
+                         for i in xrange(3)]
+        for article in self.articles:
+            article.save()
+            
+        self.extractor = CountingExtractor()
+        self.queue = FeatureQueue(self.extractor, batch_size = 10)
+
+    def tearDown(self):
+        self.queue.stop()
+        Article.drop_collection()
+
+    def test_extract(self):
+        ids = [article.id for article in self.articles]
+        self.queue.put(ids)
+        
+        self.assertTrue(self.queue.wait(ids))
+        self.assertEqual(0, len(self.queue))
+        
+        for i, article in enumerate(self.articles):
+            article.reload()
+            self.assertEqual(u"Counting-1.0", article.features.version)
+            self.assertEqual([[0, float(i + 1)]], 
+                             [list(f) for f in article.features.data])
+            #only features are written
+            self.assertEqual("Test %d" % i, article.headline)
+            
+    def test_queued_once(self):
+        ids = [article.id for article in self.articles]
+        self.queue.put(ids + ids)
+        self.queue.wait(ids)
+        
+        self.assertEqual(3, sum(len(batch) for batch in self.extractor.batches))
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
@@ -31,6 +31,8 @@ import unittest
 
 from itertools import izip
 import numpy as np
+import pickle
+import scipy.sparse
 from sklearn.feature_selection import SelectKBest, f_classif
 from selectkbest import iSelectKBest, if_classif
 
@@ -81,6 +83,50 @@ class TestiSelectKBest(unittest.TestCase):
         np.testing.assert_array_equal(selector_original.pvalues_, 
                                       selector.pvalues_)
 
+    def test_resume(self):
+        checkpoints = []
+        def checkpoint(accumulator):
+            checkpoints.append(pickle.dumps(accumulator))
+        
+        if_classif(izip(self.X[:2], self.y[:2]), self.X.shape[1],
+                   checkpoint = checkpoint, checkpoint_interval = 2)
+        
+        accumulator = pickle.loads(checkpoints[-1])
+        self.assertEqual(2, accumulator.n_samples)
+        
+        selector = iSelectKBest(if_classif, k=1)
+        selector.fit(izip(self.X[2:], self.y[2:]), self.X.shape[1],
+                     accumulator = accumulator)
+        
+        np.testing.assert_array_almost_equal([0.05882353, 0.03846154, 0.17241379], 
+                                             selector.scores_, 8)
+
+    def test_map_reduce(self):
+        for processes in [1, 2]:
+            selector = iSelectKBest(if_classif, k=1)
+            selector.fit(izip(self.X, self.y), self.X.shape[1], 
+                         processes = processes, chunk_size = 3,
+                         transform = np.array)
+            
+            np.testing.assert_array_almost_equal([0.05882353, 0.03846154, 0.17241379], 
+                                                 selector.scores_, 8)
+            np.testing.assert_array_almost_equal([0.83096915, 0.86263944, 0.71828192], 
+                                                 selector.pvalues_, 8)
+
+    def test_sparse(self):
+        X_gensim = [[(i, x) for i, x in enumerate(row) if x != 0] 
+                    for row in self.X]
+        X_scipy = [scipy.sparse.csr_matrix(row) for row in self.X]
+        
+        for X in [X_gensim, X_scipy]:
+            for processes in [1, 2]:
+                selector = iSelectKBest(if_classif, k=1)
+                selector.fit(izip(X, self.y), self.X.shape[1], 
+                             processes = processes, chunk_size = 3)
+                
+                np.testing.assert_array_almost_equal([0.05882353, 0.03846154, 0.17241379], 
+                                                     selector.scores_, 8)
+
 if __name__ == "__main__":
     #import sys;sys.argv = ['', 'Test.testName']
     unittest.main()
\ No newline at end of file
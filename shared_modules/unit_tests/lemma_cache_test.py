@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+The MIT License (MIT)
+Copyright (c) 2012-2013 Karsten Jeschkies <jeskar@web.de>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of 
+this software and associated documentation files (the "Software"), to deal in 
+the Software without restriction, including without limitation the rights to use, 
+copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the 
+Software, and to permit persons to whom the Software is furnished to do so, 
+subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all 
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, 
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A 
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT 
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION 
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE 
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+'''
+
+'''
+Created on 18.10.2026
+@author: karsten jeschkies <jeskar@web.de>
+'''
+from datetime import datetime
+from feature_extractor.lemma_cache import LemmaCache, content_hash
+import logging
+from models.mongodb_models import LemmatizedContent
+from mongoengine import *
+import unittest
+
+logger = logging.getLogger("unittesting")
+
+#Connect to test database
+connect("nyan_test", port = 20545)
+
+class LemmaCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        LemmatizedContent.drop_collection()
+        self.cache = LemmaCache(max_size = 2, check_interval = 1)
+        self.calls = []
+
+    def tearDown(self):
+        LemmatizedContent.drop_collection()
+
+    def lemmatize(self, documents):
+        self.calls.append(documents)
+        return [["%s/NN" % doc.lower()] for doc in documents]
+
+    def test_lemmatize_batch(self):
+        tokens = self.cache.lemmatize_batch(["Foo", "Bar", "Foo"], self.lemmatize)
+
+        self.assertEqual([["foo/NN"], ["bar/NN"], ["foo/NN"]], tokens)
+        #duplicate texts are lemmatized once
+        self.assertEqual(2, len(self.calls[0]))
+
+    def test_cache_hit(self):
+        self.cache.lemmatize_batch(["Foo"], self.lemmatize)
+        tokens = self.cache.lemmatize_batch(["Foo"], self.lemmatize)
+
+        self.assertEqual([["foo/NN"]], tokens)
+        self.assertEqual(1, len(self.calls))
+
+    def test_evict(self):
+        #"Bar" was used last
+        for day, doc in [(3, "Foo"), (1, "Bar"), (2, "Baz")]:
+            LemmatizedContent(content_hash = content_hash(doc),
+                              tokens = ["%s/NN" % doc.lower()],
+                              accessed = datetime(2012, 11, day)).save()
+        self.cache.lemmatize_batch(["Bar"], self.lemmatize)
+        
+        self.cache.evict()
+
+        self.assertEqual(2, LemmatizedContent.objects.count())
+        self.assertEqual(0, LemmatizedContent.objects(content_hash = content_hash("Baz")).count())
+        self.assertEqual(1, LemmatizedContent.objects(content_hash = content_hash("Bar")).count())
+        
+    def test_insert_cached_text(self):
+        def lemmatize_while_cached(documents):
+            #another process caches "Foo" in between
+            LemmatizedContent(content_hash = content_hash("Foo"),
+                              tokens = ["cached/NN"]).save()
+            return self.lemmatize(documents)
+        
+        self.cache = LemmaCache(max_size = 10, check_interval = 1)
+        tokens = self.cache.lemmatize_batch(["Foo", "Bar"], lemmatize_while_cached)
+
+        #"Bar" is cached although "Foo" could not be inserted
+        self.assertEqual([["foo/NN"], ["bar/NN"]], tokens)
+        self.assertEqual(2, LemmatizedContent.objects.count())
+        self.assertEqual(["cached/NN"], 
+                         LemmatizedContent.objects(content_hash = content_hash("Foo")).first().tokens)
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+The MIT License (MIT)
+Copyright (c) 2012-2013 Karsten Jeschkies <jeskar@web.de>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of 
+this software and associated documentation files (the "Software"), to deal in 
+the Software without restriction, including without limitation the rights to use, 
+copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the 
+Software, and to permit persons to whom the Software is furnished to do so, 
+subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all 
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, 
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A 
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT 
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION 
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE 
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+'''
+
+'''
+Created on 18.10.2026
+
+@author: karsten jeschkies <jeskar@web.de>
+'''
+import unittest
+
+from neighbours import (CosineNeighbours, ExactNeighbours, LSHNeighbours, 
+                        neighbour_recall)
+import numpy as np
+import scipy.sparse
+from smote import SMOTE
+
+class NeighboursTest(unittest.TestCase):
+
+
+    def setUp(self):
+        random_state = np.random.RandomState(0)
+        self.X = random_state.uniform(size = (50, 20))
+        
+    def cosine_neighbours(self, X, k):
+        X = X / np.sqrt((X**2).sum(axis = 1))[:, np.newaxis]
+        return np.argsort(-np.dot(X, X.T), axis = 1)[:, :k]
+
+    def test_cosine_neighbours(self):
+        for X in [self.X, scipy.sparse.csr_matrix(self.X)]:
+            nn = CosineNeighbours(chunk_size = 7).fit(X).kneighbors(X, 3)
+            
+            np.testing.assert_array_equal(self.cosine_neighbours(self.X, 3), nn)
+            
+    def test_exact_neighbours(self):
+        nn = ExactNeighbours().fit(self.X).kneighbors(self.X, 3)
+        
+        self.assertEqual((50, 3), nn.shape)
+        np.testing.assert_array_equal(np.arange(50), nn[:, 0])
+        
+    def test_lsh_neighbours(self):
+        X = scipy.sparse.csr_matrix(self.X)
+        neighbours = LSHNeighbours(n_bits = 2, n_tables = 8, random_state = 0)
+        nn = neighbours.fit(X).kneighbors(X, 3)
+        
+        self.assertEqual((50, 3), nn.shape)
+        #a sample is always in its own buckets
+        np.testing.assert_array_equal(np.arange(50), nn[:, 0])
+        
+        recall = neighbour_recall(neighbours, X, 3, random_state = 0)
+        self.assertTrue(0.0 < recall <= 1.0)
+        
+    def test_smote_with_sparse_samples(self):
+        T = scipy.sparse.csr_matrix(self.X[:10])
+        S = SMOTE(T, 200, 3, random_state = 0, 
+                  neighbours = LSHNeighbours(random_state = 0))
+        
+        self.assertTrue(scipy.sparse.issparse(S))
+        self.assertEqual((20, 20), S.shape)
+
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
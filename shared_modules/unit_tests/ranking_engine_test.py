@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+The MIT License (MIT)
+Copyright (c) 2012-2013 Karsten Jeschkies <jeskar@web.de>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of 
+this software and associated documentation files (the "Software"), to deal in 
+the Software without restriction, including without limitation the rights to use, 
+copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the 
+Software, and to permit persons to whom the Software is furnished to do so, 
+subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all 
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, 
+INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A 
+PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT 
+HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION 
+OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE 
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+'''
+
+'''
+@author: karsten jeschkies <jeskar@web.de>
+'''
+from bson.objectid import ObjectId
+import numpy as np
+from ranking_engine import CentroidRankingEngine
+import unittest
+from user_models import UserModelCentroid
+
+class CentroidRankingEngineTest(unittest.TestCase):
+
+
+    def setUp(self):
+        self.user_a = ObjectId()
+        self.user_b = ObjectId()
+        self.user_c = ObjectId()
+        
+        self.engine = CentroidRankingEngine(num_features = 4, threshold = 0.3)
+        self.engine.set_profiles(self.user_a, [[(0, 1.0), (1, 1.0)]])
+        self.engine.set_profiles(self.user_b, [[(2, 2.0)], 
+                                               [(3, 0.5)]])
+
+    def tearDown(self):
+        pass
+
+    def test_similarities(self):
+        sims = self.engine.similarities([(0, 1.0)])
+        
+        np.testing.assert_almost_equal(sims[self.user_a], 1 / np.sqrt(2))
+        np.testing.assert_almost_equal(sims[self.user_b], 0.0)
+        
+    def test_best_profile(self):
+        sims = self.engine.similarities([(3, 1.0)])
+        
+        np.testing.assert_almost_equal(sims[self.user_b], 1.0)
+        
+    def test_rank(self):
+        rankings = dict(self.engine.rank([(1, 0.5)], 
+                                         [self.user_a, self.user_b, self.user_c]))
+        
+        self.assertEqual(rankings[self.user_a], UserModelCentroid.READ)
+        self.assertEqual(rankings[self.user_b], UserModelCentroid.UNREAD)
+        #no profile
+        self.assertEqual(rankings[self.user_c], UserModelCentroid.UNREAD)
+        
+    def test_remove_user(self):
+        self.engine.remove_user(self.user_a)
+        
+        self.assertEqual(len(self.engine), 1)
+        self.assertNotIn(self.user_a, self.engine.similarities([(0, 1.0)]))
+
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testName']
+    unittest.main()
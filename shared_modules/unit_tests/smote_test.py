@@ -30,7 +30,7 @@ Created on 24.11.2012
 import unittest
 
 import numpy as np
-from smote import SMOTE
+from smote import SMOTE, borderlineSMOTE
 
 class SMOTETest(unittest.TestCase):
 
@@ -48,8 +48,61 @@ class SMOTETest(unittest.TestCase):
     def test_smote(self):
         SMOTE(self.T, 100, 2)
         
+    def test_smote_interpolates_neighbours(self):
+        S = SMOTE(self.T, 300, 2, random_state = 0)
+        
+        self.assertEqual((9, 3), S.shape)
+        for i in xrange(len(S)):
+            sample = self.T[i // 3]
+            #with k = 2 the only neighbour is the closest other sample
+            dists = ((self.T - sample)**2).sum(axis = 1)
+            dists[i // 3] = np.inf
+            neighbour = self.T[dists.argmin()]
+            
+            #the synthetic sample lies on the segment between sample and 
+            #neighbour, both may share coordinates
+            difference = neighbour - sample
+            gap = np.dot(S[i] - sample, difference) / np.dot(difference, difference)
+            self.assertTrue(np.allclose(sample + gap * difference, S[i]))
+            self.assertTrue(0.0 <= gap <= 1.0)
+        
+    def clusters(self, labels):
+        '''
+        Returns samples and targets of clusters which are far apart. Each
+        list of targets in labels is one cluster on a line.
+        '''
+        X = np.array([[10.0 * c + 0.1 * i, 0.0] 
+                      for c, cluster in enumerate(labels)
+                      for i in xrange(len(cluster))])
+        y = np.array([target for cluster in labels for target in cluster])
+        return X, y
+        
     def test_borderline_smote(self):
-        pass
+        #with k = 3 every cluster holds the neighbours of its samples
+        X, y = self.clusters([[1, 1, 0], [1, 0, 0], [1, 0, 0], [1, 0, 0]])
+        
+        safe, synthetic, danger = borderlineSMOTE(X, y, 1, 100, 3, 
+                                                  random_state = 0)
+        
+        #1 of 3 neighbours is a majority: safe. 2 of 3: danger
+        np.testing.assert_array_equal([[0.0, 0.0], [0.1, 0.0]], safe)
+        np.testing.assert_array_equal([[10.0, 0.0], [20.0, 0.0], [30.0, 0.0]], 
+                                      danger)
+        self.assertEqual((3, 2), synthetic.shape)
+        
+    def test_borderline_smote_odd_k(self):
+        X, y = self.clusters([[1, 1, 1, 0, 0], 
+                              [1, 1, 0, 0, 0], 
+                              [1, 1, 0, 0, 0],
+                              [1, 0, 0, 0, 0]])
+        
+        safe, synthetic, danger = borderlineSMOTE(X, y, 1, 100, 5, 
+                                                  random_state = 0)
+        
+        #2 of 5 neighbours are majorities: safe. 3 of 5: danger
+        np.testing.assert_array_equal(X[[0, 1, 2]], safe)
+        np.testing.assert_array_equal(X[[5, 6, 10, 11, 15]], danger)
+        self.assertEqual((5, 2), synthetic.shape)
 
 
 if __name__ == "__main__":
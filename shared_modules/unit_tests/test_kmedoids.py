@@ -27,11 +27,18 @@ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
 The unittests are not complete.
 '''
-from kmedoids import KMedoids
+from kmedoids import (KMedoids, init_assign_worker, assign_chunk, 
+                      closest_members_chunk)
 from gensim.corpora import Dictionary, MmCorpus
 from gensim.models import tfidfmodel
 import logging
+import multiprocessing
+import numpy
 from profilehooks import profile
+import random
+import scipy.sparse
+import shutil
+import tempfile
 import unittest 
 
 logger = logging.getLogger("unittesting")
@@ -70,6 +77,116 @@ class TestKMedoids(unittest.TestCase):
         clusters = self.cluster(kmedoids)
 
         print clusters
+        
+    def test_assign_with_workers(self):
+        corpus = [[(0, 1.0), (1, 0.2)], [(0, 0.9)], [(0, 1.0), (1, 0.1)],
+                  [(2, 1.0)], [(2, 0.8), (3, 0.1)], [(3, 0.2), (2, 1.0)]]
+        
+        for processes in [1, 2]:
+            kmedoids = KMedoids(corpus = corpus, num_features = 4, 
+                                num_clusters = 2, max_iterations = 3,
+                                processes = processes, chunk_size = 4)
+            clusters = kmedoids.cluster()
+            
+            members = sorted(member 
+                             for cluster in clusters.itervalues() 
+                             for member in cluster)
+            self.assertEqual(range(len(corpus)), members)
+            self.assertEqual((len(clusters), 4), kmedoids.get_medoids().shape)
+            
+    def test_kmedoidspp_and_minibatch(self):
+        corpus = [[(0, 1.0), (1, 0.2)], [(0, 0.9)], [(0, 1.0), (1, 0.1)],
+                  [(2, 1.0)], [(2, 0.8), (3, 0.1)], [(3, 0.2), (2, 1.0)]]
+        
+        for batch_size in [None, 4]:
+            random.seed(0)
+            kmedoids = KMedoids(corpus = corpus, num_features = 4, 
+                                num_clusters = 2, max_iterations = 3,
+                                processes = 1, init = 'kmedoids++',
+                                batch_size = batch_size)
+            clusters = kmedoids.cluster()
+            
+            #seeds are distinct
+            self.assertEqual(2, len(clusters))
+            members = sorted(member 
+                             for cluster in clusters.itervalues() 
+                             for member in cluster)
+            self.assertEqual(range(len(corpus)), members)
+            
+            #the two groups of documents are found
+            self.assertEqual([[0, 1, 2], [3, 4, 5]], 
+                             sorted(sorted(cluster) 
+                                    for cluster in clusters.itervalues()))
+            
+    def test_resume_from_checkpoint(self):
+        corpus = [[(0, 1.0), (1, 0.2)], [(0, 0.9)], [(0, 1.0), (1, 0.1)],
+                  [(2, 1.0)], [(2, 0.8), (3, 0.1)], [(3, 0.2), (2, 1.0)]]
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            prefix = tmp_dir + "/clusters"
+            clusters = KMedoids(corpus = corpus, num_features = 4, 
+                                num_clusters = 2, max_iterations = 3,
+                                processes = 1, 
+                                checkpoint_prefix = prefix).cluster()
+            
+            #the finished run is resumed without further iterations
+            resumed = KMedoids(corpus = corpus, num_features = 4, 
+                               num_clusters = 2, max_iterations = 3,
+                               processes = 1, 
+                               checkpoint_prefix = prefix).cluster()
+            
+            self.assertEqual(clusters, resumed)
+        finally:
+            shutil.rmtree(tmp_dir)
+            
+    def test_resume_interrupted_run(self):
+        corpus = [[(0, 1.0), (1, 0.2)], [(0, 0.9)], [(0, 1.0), (1, 0.1)],
+                  [(2, 1.0)], [(2, 0.8), (3, 0.1)], [(3, 0.2), (2, 1.0)]]
+        
+        for batch_size in [None, 4]:
+            tmp_dir = tempfile.mkdtemp()
+            try:
+                random.seed(0)
+                uninterrupted = KMedoids(corpus = corpus, num_features = 4, 
+                                         num_clusters = 2, max_iterations = 3,
+                                         processes = 1, 
+                                         batch_size = batch_size).cluster()
+                
+                #stop after the first iteration
+                prefix = tmp_dir + "/clusters"
+                random.seed(0)
+                KMedoids(corpus = corpus, num_features = 4, 
+                         num_clusters = 2, max_iterations = 1,
+                         processes = 1, batch_size = batch_size,
+                         checkpoint_prefix = prefix).cluster()
+                
+                #the resumed run continues with the saved medoids
+                resumed = KMedoids(corpus = corpus, num_features = 4, 
+                                   num_clusters = 2, max_iterations = 3,
+                                   processes = 1, batch_size = batch_size,
+                                   checkpoint_prefix = prefix).cluster()
+                
+                self.assertEqual(uninterrupted, resumed)
+            finally:
+                shutil.rmtree(tmp_dir)
+            
+    def test_closest_members_chunk(self):
+        shared = multiprocessing.RawArray('f', 2 * 3)
+        init_assign_worker(shared, 3)
+        centroids = numpy.frombuffer(shared, dtype = numpy.float32).reshape((2, 3))
+        centroids[:] = [[1.0, 0.0, 0.0], [0.0, 0.5, 0.5]]
+        
+        chunk = scipy.sparse.csr_matrix(numpy.array([[1.0, 1.0, 0.0],
+                                                     [0.0, 1.0, 1.0],
+                                                     [2.0, 0.0, 0.0],
+                                                     [0.0, 0.0, 1.0]]))
+        
+        _, positions, sums = assign_chunk((0, chunk, 2))
+        self.assertEqual([0, 1, 0, 1], positions.tolist())
+        self.assertAlmostEqual(1.0 + 1 / numpy.sqrt(2), sums.tocsr()[0, 0], 5)
+        
+        clusters, doc_ids, _ = closest_members_chunk((10, chunk, positions))
+        self.assertEqual({0: 12, 1: 11}, dict(zip(clusters, doc_ids)))
       
         
         
@@ -32,7 +32,8 @@ from naive_bayes import GaussianNB
 from user_models import UserModelCentroid, UserModelBayes, UserModelSVM
 from FillTestDatabase import fill_database, clear_database
 import logging
-from models.mongodb_models import Article,  User, UserModel
+from models.mongodb_models import (Article, RankedArticle, ReadArticleFeedback, 
+                                   User, UserModel)
 from mongoengine import *
 import numpy as np
 import unittest
@@ -86,6 +87,25 @@ class UserModelCentroidTest(unittest.TestCase):
         self.assertAlmostEqual(user_model.data[0][1], 
                                0.0021, 4)    
         
+    def test_update(self):
+        self.trainer.train()
+        self.trainer.save()
+        self.assertFalse(self.trainer.has_new_data())
+
+        article = Article.objects(headline = u"Sony = Bad").first()
+        ReadArticleFeedback(user_id = self.user_id, article = article,
+                            score = 1.0).save()
+        self.assertTrue(self.trainer.has_new_data())
+
+        updated = UserModelCentroid(self.user_id,
+                                    extractor = self.feature_extractor)
+        updated.update()
+        self.trainer.train()
+
+        self.assertEqual(self.trainer.centroid_count_, updated.centroid_count_)
+        np.testing.assert_array_almost_equal(self.trainer.centroid_sum_,
+                                             updated.centroid_sum_, 5)
+        
 class NaiveBayesTest(unittest.TestCase):
     
     def setUp(self):
@@ -113,6 +133,69 @@ class NaiveBayesTest(unittest.TestCase):
         
         self.assertEqual(result, [1])      
         
+    def test_partial_fit(self):
+        clf = GaussianNB()
+        clf.partial_fit(self.X[[0, 3]], self.Y[[0, 3]])
+        clf.partial_fit(self.X[[1, 2, 4, 5]], self.Y[[1, 2, 4, 5]])
+        
+        full_clf = GaussianNB()
+        full_clf.fit(self.X, self.Y)
+        
+        for c in [clf, full_clf]:
+            np.testing.assert_array_almost_equal([[-2, -4 / 3.], [2, 4 / 3.]], 
+                                                 c.theta_)
+            #variance per class
+            np.testing.assert_array_almost_equal([np.var(self.X[:3], axis = 0, ddof = 1),
+                                                  np.var(self.X[3:], axis = 0, ddof = 1)],
+                                                 c.sigma_)
+            np.testing.assert_array_almost_equal([0.5, 0.5], c.class_prior_)
+            
+    def test_partial_fit_new_class(self):
+        clf = GaussianNB()
+        clf.partial_fit(self.X[3:], self.Y[3:])
+        clf.partial_fit(self.X[:3], self.Y[:3])
+        
+        np.testing.assert_array_equal([1, 2], clf.classes_)
+        np.testing.assert_array_almost_equal([[-2, -4 / 3.], [2, 4 / 3.]], 
+                                             clf.theta_)
+        
+    def test_partial_unfit(self):
+        clf = GaussianNB().fit(self.X, self.Y)
+        clf.partial_unfit(self.X[[1, 4]], self.Y[[1, 4]])
+        
+        rest = [0, 2, 3, 5]
+        expected = GaussianNB().fit(self.X[rest], self.Y[rest])
+        np.testing.assert_array_almost_equal(expected.class_count_, clf.class_count_)
+        np.testing.assert_array_almost_equal(expected.theta_, clf.theta_)
+        np.testing.assert_array_almost_equal(expected.sigma_, clf.sigma_)
+        
+        #a class without samples is removed
+        clf.partial_unfit(self.X[[0, 2]], self.Y[[0, 2]])
+        np.testing.assert_array_equal([2], clf.classes_)
+        self.assertRaises(ValueError, clf.partial_unfit, self.X[:1], self.Y[:1])
+        
+    def test_joint_log_likelihood(self):
+        clf = GaussianNB().fit(self.X, self.Y)
+        X = np.array([[-0.8, -1], [2.5, 0.3]])
+        
+        #per class formula of the likelihood
+        expected = np.array([np.log(clf.class_prior_[i]) 
+                             - 0.5 * np.sum(np.log(np.pi * clf.sigma_[i]))
+                             - 0.5 * np.sum((X - clf.theta_[i]) ** 2 / clf.sigma_[i], 1)
+                             for i in xrange(2)]).T
+        
+        np.testing.assert_array_almost_equal(expected, 
+                                             clf._joint_log_likelihood(X), 4)
+        np.testing.assert_array_equal([1, 2], clf.predict(X))
+        
+    def test_statistics(self):
+        clf = GaussianNB().fit(self.X, self.Y)
+        
+        restored = GaussianNB().set_statistics(clf.get_statistics())
+        
+        self.assertEqual([1], restored.predict([[-0.8, -1]]))
+        np.testing.assert_array_almost_equal(clf.sigma_, restored.sigma_)
+        
 class UserModelBayesTest(unittest.TestCase):
 
     def setUp(self):
@@ -163,7 +246,65 @@ class UserModelBayesTest(unittest.TestCase):
         self.assertIn(u"Apple = Bad", headlines)
         self.assertNotIn(u"Apple", headlines)
         self.assertEqual(len(headlines), 1)
-     
+
+    def test_update_watermark(self):
+        self.trainer.train()
+        self.trainer.save()
+        num_samples = self.trainer.clf.class_count_.sum()
+
+        article = Article.objects(headline = u"Sony = Bad").first()
+        ReadArticleFeedback(user_id = self.user_id, article = article,
+                            score = 1.0).save()
+
+        #the unread sample of the ranked article is replaced by a read one
+        self.trainer.update()
+        self.trainer.save()
+        self.assertEqual(num_samples, self.trainer.clf.class_count_.sum())
+        self.assertFalse(self.trainer.has_new_data())
+
+        #the same feedback is not added twice
+        self.trainer.update()
+        self.assertEqual(num_samples, self.trainer.clf.class_count_.sum())
+        
+    def test_update_like_train(self):
+        self.trainer.train()
+        self.trainer.save()
+        
+        #read the article ranked before the watermark and rank a new one
+        article = Article.objects(headline = u"Sony = Bad").first()
+        ReadArticleFeedback(user_id = self.user_id, article = article,
+                            score = 1.0).save()
+        RankedArticle(user_id = self.user_id, 
+                      article = Article.objects(headline = u"Apple").first(),
+                      rating = 0.5).save()
+        
+        self.trainer.update()
+        
+        trained = UserModelBayes(self.user_id, extractor = self.trainer.extractor)
+        trained.train()
+        
+        np.testing.assert_array_equal(trained.clf.classes_, 
+                                      self.trainer.clf.classes_)
+        np.testing.assert_array_almost_equal(trained.clf.class_count_, 
+                                             self.trainer.clf.class_count_)
+        np.testing.assert_array_almost_equal(trained.clf.theta_, 
+                                             self.trainer.clf.theta_)
+        np.testing.assert_array_almost_equal(trained.clf.m2_, 
+                                             self.trainer.clf.m2_)
+
+    def test_iter_samples(self):
+        read_id = Article.objects(headline = u"Apple").first().id
+        unread_id = Article.objects(headline = u"Sony = Bad").first().id
+
+        marks = []
+        for X, y in self.trainer.iter_samples([read_id], [unread_id],
+                                              chunk_size = 1):
+            self.assertEqual(X.shape, (1, self.trainer.num_features_))
+            self.assertEqual(X.dtype, np.float32)
+            marks.extend(y)
+
+        self.assertEqual(marks, [UserModelBayes.READ, UserModelBayes.UNREAD])
+
     @unittest.skip("ranking")
     def test_rank(self):
         self.trainer.train()
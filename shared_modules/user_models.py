@@ -30,24 +30,33 @@ Created on 29.10.2012
 Several different user models for capturing a user's interests.
 '''
 import cPickle
+from datetime import datetime
+from feature_matrix import load_feature_matrix
+from feature_queue import save_features, SKIP, WAIT
 from gensim import interfaces, utils, matutils, similarities
-from itertools import chain, izip
+from itertools import chain, islice, izip
 import logging
 from models.mongodb_models import (Article, User, UserModel, Feedback, Features, 
                                    ReadArticleFeedback, RankedArticle)
-from mongoengine import queryset
 import numpy
 from random import sample
 import scipy.sparse
 from sets import Set
-#from naive_bayes import GaussianNB #iterative GaussainNB
-from sklearn.naive_bayes import GaussianNB
+from naive_bayes import GaussianNB #iterative GaussainNB
 from sklearn import svm, tree
 from smote import SMOTE, borderlineSMOTE
 
 logger = logging.getLogger("main")
 
 class UserModelBase(object):
+    '''
+    If feature_queue is set to a FeatureQueue outdated article features are 
+    extracted by the queue. stale_policy decides whether training waits for
+    them (WAIT) or leaves these articles out (SKIP).
+    '''
+    
+    feature_queue = None
+    stale_policy = WAIT
     
     def __init__(self, user_id, extractor):
         self.user  = User.objects(id = user_id).first()
@@ -55,6 +64,9 @@ class UserModelBase(object):
         self.extractor = extractor
         
         self.num_features_ = self.extractor.get_feature_number()
+        
+        #(last feedback id, last ranked article id) of the training data
+        self.watermark_ = None
     
     def train(self):
         logger.debug("train() not implemented!")
@@ -80,6 +92,70 @@ class UserModelBase(object):
         logger.debug("get_version not implemented!")
         raise NotImplementedError()
     
+    def get_watermark(self):
+        '''
+        Returns (id of latest read article feedback, id of latest ranked 
+        article) of user. An id is None if there is no such document.
+        
+        Object ids grow with time, i.e. newer documents have larger ids.
+        '''
+        last_feedback = ReadArticleFeedback.objects(user_id = self.user.id).order_by("-id").only("id").first()
+        last_ranked = RankedArticle.objects(user_id = self.user.id).order_by("-id").only("id").first()
+        
+        return (None if last_feedback is None else last_feedback.id,
+                None if last_ranked is None else last_ranked.id)
+        
+    def load_watermark(self):
+        '''
+        Returns the watermark of the saved user model or None if there is no
+        saved model of this version.
+        '''
+        user_model = UserModel.objects(user_id = self.user.id, 
+                                       version = self.get_version()
+                                       ).only("last_feedback_id", 
+                                              "last_ranked_id").first()
+        
+        if user_model is None:
+            return None
+        
+        return user_model.last_feedback_id, user_model.last_ranked_id
+    
+    def has_new_data(self):
+        '''
+        Returns True if there is new feedback or there are new ranked articles
+        since the saved user model was trained.
+        '''
+        return self.load_watermark() != self.get_watermark()
+    
+    def get_read_article_ids(self, since = None):
+        '''
+        Sets watermark_ to the current watermark and returns the ids of 
+        articles read by user up to it. With since only feedback newer than
+        the feedback id since is used.
+        '''
+        self.watermark_ = self.get_watermark()
+        
+        last_feedback_id = self.watermark_[0]
+        if last_feedback_id is None:
+            return []
+        
+        feedback = ReadArticleFeedback.objects(user_id = self.user.id,
+                                               id__lte = last_feedback_id)
+        if since is not None:
+            feedback = feedback.filter(id__gt = since)
+        
+        return [r.article.id for r in feedback.only("article")]
+    
+    def get_watermark_fields(self):
+        '''
+        Returns the update arguments which save watermark_ with the user model.
+        '''
+        if self.watermark_ is None:
+            return {}
+        
+        return {'set__last_feedback_id': self.watermark_[0],
+                'set__last_ranked_id': self.watermark_[1]}
+    
     def get_features(self, article):
         '''
         Reaturns full features vector from article.
@@ -96,26 +172,85 @@ class UserModelBase(object):
                 raise 
              
         if feature_version != self.extractor.get_version():
+            if self.feature_queue is not None:
+                #extracted together with other queued articles
+                self.feature_queue.put([article.id])
+                self.feature_queue.wait([article.id])
+                article.reload()
+            
+        if article.features.version != self.extractor.get_version():
             clean_content = article.clean_content
                 
             #get new features
             new_features = self.extractor.get_features(clean_content)
                 
             #save new features
-            features = Features(version = self.extractor.get_version(), 
-                                data = new_features)
-            article.features = features
-            try:
-                article.save()
-            except queryset.OperationError as e:
-                logger.error("Could not save article with id %s: %s" %
-                             (article.id, e))
+            article.features = Features(version = self.extractor.get_version(), 
+                                         data = new_features)
+            save_features(article.id, self.extractor.get_version(), new_features)
         
         #sparse2full converts list of 2-tuples to numpy array
         article_features_as_full_vec = matutils.sparse2full(article.features.data, 
                                                             self.num_features_)
         
         return article_features_as_full_vec
+    
+    def get_feature_matrix(self, article_ids, dense = False):
+        '''
+        Returns (features, id_to_row) of the articles with ids article_ids. 
+        features is a float32 csr matrix or a dense array if dense is True.
+        id_to_row maps article ids to rows. Articles without features are 
+        left out.
+        
+        Only the features of the articles are loaded. Articles with outdated
+        features are handled as set by feature_queue and stale_policy. 
+        Without a queue they are converted by get_features.
+        '''
+        X, id_to_row, stale_ids = load_feature_matrix(article_ids, 
+                                                      self.num_features_, 
+                                                      self.extractor.get_version())
+        
+        if len(stale_ids) > 0 and self.feature_queue is not None:
+            self.feature_queue.put(stale_ids)
+            
+            if self.stale_policy == SKIP:
+                logger.info("Skip %d articles with outdated features." % 
+                            len(stale_ids))
+                stale_ids = []
+            else:
+                logger.info("Wait for features of %d articles." % len(stale_ids))
+                self.feature_queue.wait(stale_ids)
+                
+                X_new, new_id_to_row, stale_ids = load_feature_matrix(stale_ids,
+                                                                      self.num_features_, 
+                                                                      self.extractor.get_version())
+                for article_id, row in new_id_to_row.iteritems():
+                    id_to_row[article_id] = X.shape[0] + row
+                X = scipy.sparse.vstack((X, X_new), format = 'csr')
+        
+        if len(stale_ids) > 0:
+            logger.info("Convert features of %d articles." % len(stale_ids))
+            
+            stale_rows = []
+            for article in Article.objects(id__in = stale_ids):
+                try:
+                    stale_rows.append(self.get_features(article))
+                except Exception as inst:
+                    logger.error("Could not get features for article %s: %s" %
+                                 (article.id, inst))
+                    continue
+                
+                id_to_row[article.id] = X.shape[0] + len(stale_rows) - 1
+                
+            if len(stale_rows) > 0:
+                X = scipy.sparse.vstack((X, scipy.sparse.csr_matrix(numpy.array(stale_rows,
+                                                                                dtype = numpy.float32))),
+                                        format = 'csr')
+                
+        if dense:
+            X = X.toarray()
+            
+        return X, id_to_row
         
 
 class UserModelCentroid(UserModelBase):
@@ -134,36 +269,74 @@ class UserModelCentroid(UserModelBase):
     def get_version(cls):
         return "UserModelCentroid-1.0"
      
+    def has_new_data(self):
+        '''
+        Only read articles are used to train the centroid.
+        '''
+        watermark = self.load_watermark()
+        return watermark is None or watermark[0] != self.get_watermark()[0]
+    
     def train(self, read_article_ids = None, unread_article_ids = None):
         #Load user feedback if needed
         if read_article_ids is None:
-            read_article_ids = (r.article.id for r in ReadArticleFeedback.objects(user_id = self.user.id).only("article"))
+            read_article_ids = self.get_read_article_ids()
             
-        user_feedback = Article.objects(id__in = read_article_ids)
-        
         #TODO: cluster feedback articles and save more than one profile
         
-        num_loaded_articles = 0
-        centroid = numpy.zeros(self.num_features_, dtype=numpy.float32)
+        self.centroid_sum_, self.centroid_count_ = self.__unit_sum(read_article_ids)
+        self.__set_centroid()
         
-        for article in user_feedback:
-            try:
-                article_features_as_full_vec = self.get_features(article)
-            except Exception as inst:
-                logger.error("Could not get features for article %s: %s" %
-                             (article.id, inst))
-                continue
-            
-            #do we need this?
-            tmp_doc = matutils.unitvec(article_features_as_full_vec)
-            
-            #add up tmp_doc
-            centroid = numpy.add(centroid, tmp_doc)
-            num_loaded_articles += 1 
-            
+    def update(self):
+        '''
+        Adds the feedback since the saved model was trained to the saved sum
+        of feedback vectors. Trains on all feedback if the saved model cannot
+        be updated.
+        '''
+        user_model = UserModel.objects(user_id = self.user.id,
+                                       version = self.get_version()
+                                       ).only("last_feedback_id", 
+                                              "statistics").first()
+        
+        statistics = None if user_model is None else user_model.statistics
+        if statistics is None or \
+           statistics.get('features_version') != self.extractor.get_version():
+            logger.info("No centroid to update for user %s. Train a new one." %
+                        self.user.id)
+            self.train()
+            return
+        
+        read_article_ids = self.get_read_article_ids(since = user_model.last_feedback_id)
+        logger.info("Update centroid with %d articles." % len(read_article_ids))
+        
+        new_sum, new_count = self.__unit_sum(read_article_ids)
+        self.centroid_sum_ = matutils.sparse2full(statistics['sum'], 
+                                                  self.num_features_) + new_sum
+        self.centroid_count_ = statistics['count'] + new_count
+        self.__set_centroid()
+        
+    def __unit_sum(self, article_ids):
+        '''
+        Returns (sum of unit length feature vectors, number of vectors) of the
+        articles.
+        '''
+        user_feedback, _ = self.get_feature_matrix(article_ids)
+        num_loaded_articles = user_feedback.shape[0]
+        
+        norms = numpy.sqrt(numpy.asarray(user_feedback.multiply(user_feedback).sum(axis = 1)).ravel())
+        norms[norms == 0] = 1.0
+        user_feedback = scipy.sparse.spdiags(1.0 / norms, 0, 
+                                             num_loaded_articles, 
+                                             num_loaded_articles) * user_feedback
+        
+        return (numpy.asarray(user_feedback.sum(axis = 0), 
+                              dtype = numpy.float32).ravel(), 
+                num_loaded_articles)
+        
+    def __set_centroid(self):
         #average each element
-        if num_loaded_articles != 0:
-            centroid = centroid / num_loaded_articles
+        centroid = self.centroid_sum_
+        if self.centroid_count_ != 0:
+            centroid = centroid / self.centroid_count_
             
         centroid = matutils.full2sparse(centroid)
         
@@ -173,33 +346,42 @@ class UserModelCentroid(UserModelBase):
     def save(self): 
         #replace old user model with new
         try:
+            statistics = {'features_version': self.extractor.get_version(),
+                          'sum': [(int(i), float(w)) 
+                                  for i, w 
+                                  in matutils.full2sparse(self.centroid_sum_)],
+                          'count': self.centroid_count_}
+            
             #replace profile
             UserModel.objects(user_id = self.user.id).update(upsert = True,
                                                              set__user_id = self.user.id,
                                                              set__data = self.user_model_features,
-                                                             set__version = self.get_version())
+                                                             set__version = self.get_version(),
+                                                             set__trained_at = datetime.now(),
+                                                             set__statistics = statistics,
+                                                             **self.get_watermark_fields())
         except Exception as inst:
             logger.error("Could not save learned user model due to unknown"
                          " error %s: %s" % (type(inst), inst))
             
     def load(self):
         '''
-        Loads user model from self.user. Not yet from UserModel
+        Loads user model of self.user from UserModel
         
         NOTE: No feature conversion is done!
         '''
         
-        #learned_user_model = UserModel.objects(user_id = self.user.id).first()
+        learned_user_model = UserModel.objects(user_id = self.user.id).first()
         
-        #if learned_user_model is None:
-        #    self.user_model_features = []
-        #    return
+        if learned_user_model is None or learned_user_model.version != self.get_version():
+            self.user_model_features = []
+            return
         
         #get learned profile/model
         #convert features to list of tuples. 
         #we make a double list because we will have more than one model soon.
-        self.user_model_features = [[tuple(a) for a in learned_user_model.data] 
-                                   for profile in self.user.learned_profile]
+        self.user_model_features = [[tuple(a) for a in profile] 
+                                   for profile in learned_user_model.data]
             
     def rank(self, doc):
         '''
@@ -256,6 +438,9 @@ class UserModelBayes(UserModelBase):
     "read" articles or not.
     
     Does not use SMOTE
+    
+    The classifier keeps the sufficient statistics of the feedback. New 
+    feedback is added with update() without training on the whole history.
     '''
     
     READ = 2
@@ -263,52 +448,47 @@ class UserModelBayes(UserModelBase):
 
     @classmethod
     def get_version(cls):
-        return "UserModelBayes-1.0"
+        return "UserModelBayes-1.1"
     
-    class AllArticles(object):
-        
-        def __init__(self, 
-                     read_articles, 
-                     unread_articles, 
-                     get_features_function):
-            '''
-            Parameters:
-            read_articles : Article Queryset
-            unread_article : Article Queryset
-            get_features_function : should be a function that takes an article
-                                    as Article instance and returns the full 
-                                    features vector
-            '''
-            self.read_articles = read_articles
-            self.unread_articles = unread_articles
-            self.get_features = get_features_function
-            
-        def _iter_features_and_marks(self):
-            marked_read_articles = ((article, UserModelBayes.READ) 
-                                    for article 
-                                    in self.read_articles) 
-            marked_unread_articles = ((article, UserModelBayes.UNREAD) 
-                                      for 
-                                      article 
-                                      in self.unread_articles) 
-            
-            all_articles = chain(marked_read_articles, marked_unread_articles)
-            
-            for article, mark in all_articles:
-                try:
-                    article_features_as_full_vec = self.get_features(article)
-                    yield article_features_as_full_vec, mark
-                except AttributeError as e:
-                    logger.error("Article %s does not have attribute: %s." 
-                                  % (article.id, e))
-                    
-        def __iter__(self):
-            for a, _ in self._iter_features_and_marks():
-                yield a
+    def iter_samples(self, read_article_ids, unread_article_ids, 
+                     chunk_size = 1000):
+        '''
+        Yields chunks (X, y) of the features and marks of read and unread 
+        articles. Each article is loaded once and its features and mark are 
+        written together, so X and y are always aligned.
+        
+        X is a float32 array, shape = [n_samples, n_features]. X and y are 
+        views of arrays which are allocated once and reused for each chunk, 
+        i.e. a chunk is only valid until the next chunk is requested.
+        '''
+        X = numpy.zeros((chunk_size, self.num_features_), dtype = numpy.float32)
+        y = numpy.empty(chunk_size, dtype = numpy.int32)
+        
+        marked_ids = chain(((article_id, UserModelBayes.READ) 
+                            for article_id in read_article_ids),
+                           ((article_id, UserModelBayes.UNREAD) 
+                            for article_id in unread_article_ids))
+        
+        while True:
+            marks = dict(islice(marked_ids, chunk_size))
+            if len(marks) == 0:
+                break
+            
+            features, id_to_row = self.get_feature_matrix(marks.keys())
+            num_samples = features.shape[0]
+            if num_samples == 0:
+                continue
+            
+            #scatter sparse rows into the dense buffer
+            X[:num_samples] = 0
+            rows = numpy.repeat(numpy.arange(num_samples), 
+                                numpy.diff(features.indptr))
+            X[rows, features.indices] = features.data
+            
+            for article_id, row in id_to_row.iteritems():
+                y[row] = marks[article_id]
                 
-        def get_marks(self):
-            for _, mark in self._iter_features_and_marks():
-                yield mark 
+            yield X[:num_samples], y[:num_samples]
 
     def train(self, read_article_ids = None, unread_article_ids = None):
         '''
@@ -321,20 +501,21 @@ class UserModelBayes(UserModelBase):
         
         #Load user feedback if needed
         if read_article_ids is None:
-            read_article_ids = Set(r.article.id 
-                                for r 
-                                in ReadArticleFeedback.objects(user_id = self.user.id).only("article"))
+            read_article_ids = Set(self.get_read_article_ids())
         else:
             read_article_ids = Set(read_article_ids)
         
         logger.info("Use %d read articles for learning." % len(read_article_ids))
-        read_articles = Article.objects(id__in = read_article_ids)
 
         #Get all articles the user did not read.
         if unread_article_ids is None:
+            ranked_articles = RankedArticle.objects(user_id = self.user.id)
+            #unread articles up to the watermark, update() adds the later ones
+            if self.watermark_ is not None and self.watermark_[1] is not None:
+                ranked_articles = ranked_articles.filter(id__lte = self.watermark_[1])
             ranked_article_ids = (a.article.id 
                                for a 
-                               in RankedArticle.objects(user_id = self.user.id).only("article"))
+                               in ranked_articles.only("article"))
             all_article_ids = Set(a.id 
                                   for a 
                                   in Article.objects(id__in = ranked_article_ids).only("id"))
@@ -343,15 +524,116 @@ class UserModelBayes(UserModelBase):
         #undersample unreads
         logger.info("Use %d unread articles for learning." % (len(unread_article_ids)))
         
-        unread_articles = Article.objects(id__in = unread_article_ids)
+        #statistics are accumulated chunk by chunk
+        self.clf = GaussianNB()
+        for X, y in self.iter_samples(read_article_ids, unread_article_ids):
+            self.clf.partial_fit(X, y)
         
-        #convert all article features
-        all_articles = UserModelBayes.AllArticles(read_articles, 
-                                                  unread_articles,
-                                                  self.get_features)
+    def update(self, read_article_ids = None, unread_article_ids = None):
+        '''
+        Updates the learned classifier with new feedback only.
+        read_article_ids should be an iterable over new read article ids
+        unread_article_ids should be an iterable over new unread article ids
+        
+        If they are None the feedback and ranked articles since the watermark
+        of the saved model are used. Explicit ids have to cover all new data
+        up to now because the current watermark is saved with the model.
+        
+        Trains on the complete history if there is no learned classifier or it
+        cannot be updated.
+        
+        Articles ranked before the watermark were learned as unread. If they 
+        are read now their unread samples are removed before they are added 
+        as read.
+        '''
+        self.load()
+        
+        #models saved without watermark cannot tell which data they contain
+        saved_watermark = self.load_watermark()
+        
+        if getattr(self, 'clf', None) is None or \
+           not hasattr(self.clf, 'partial_fit') or \
+           saved_watermark in (None, (None, None)):
+            logger.info("No classifier to update for user %s. Train a new one." %
+                        self.user.id)
+            self.train()
+            return
+        
+        last_feedback_id, last_ranked_id = saved_watermark
+        
+        if read_article_ids is None:
+            read_article_ids = Set(self.get_read_article_ids(since = last_feedback_id))
+        else:
+            read_article_ids = Set(read_article_ids)
+            self.watermark_ = self.get_watermark()
             
-        self.clf = GaussianNB()
-        self.clf.fit(numpy.array(list(all_articles)), numpy.array(list(all_articles.get_marks())))
+        if unread_article_ids is None:
+            unread_article_ids = Set()
+            if self.watermark_[1] is not None:
+                ranked_articles = RankedArticle.objects(user_id = self.user.id,
+                                                        id__lte = self.watermark_[1])
+                if last_ranked_id is not None:
+                    ranked_articles = ranked_articles.filter(id__gt = last_ranked_id)
+                    
+                unread_article_ids = Set(a.article.id 
+                                         for a 
+                                         in ranked_articles.only("article")) - read_article_ids
+        
+        #skip articles the classifier already learned
+        learned_read_ids, learned_ranked_ids = self.__get_learned_article_ids(
+                                read_article_ids | unread_article_ids,
+                                saved_watermark)
+        stale_unread_ids = (read_article_ids & learned_ranked_ids) - learned_read_ids
+        read_article_ids = read_article_ids - learned_read_ids
+        unread_article_ids = unread_article_ids - learned_read_ids - learned_ranked_ids
+        
+        num_articles = 0
+        for X, y in self.iter_samples(Set(), stale_unread_ids):
+            self.clf.partial_unfit(X, y)
+            num_articles += len(y)
+            
+        logger.info("Removed %d unread articles which are read now." % 
+                    num_articles)
+        
+        if not hasattr(self.clf, 'classes_'):
+            #all samples were removed
+            self.clf = GaussianNB()
+        
+        num_articles = 0
+        for X, y in self.iter_samples(read_article_ids, unread_article_ids):
+            self.clf.partial_fit(X, y)
+            num_articles += len(y)
+        
+        logger.info("Updated classifier with %d articles." % num_articles)
+        
+    def __get_learned_article_ids(self, article_ids, watermark):
+        '''
+        Returns (ids of read articles, ids of ranked articles) among article_ids
+        up to watermark, i.e. the articles a classifier trained up to watermark
+        learned as read or unread.
+        '''
+        last_feedback_id, last_ranked_id = watermark
+        article_ids = list(article_ids)
+        
+        read_article_ids = Set()
+        if last_feedback_id is not None and len(article_ids) > 0:
+            read_article_ids = Set(r.article.id 
+                                   for r 
+                                   in ReadArticleFeedback.objects(user_id = self.user.id,
+                                                                  id__lte = last_feedback_id,
+                                                                  article__in = article_ids
+                                                                  ).only("article"))
+            
+        ranked_article_ids = Set()
+        if last_ranked_id is not None and len(article_ids) > 0:
+            ranked_article_ids = Set(a.article.id 
+                                     for a 
+                                     in RankedArticle.objects(user_id = self.user.id,
+                                                              id__lte = last_ranked_id,
+                                                              article__in = article_ids
+                                                              ).only("article"))
+            
+        return read_article_ids, ranked_article_ids
         
     def save(self):
         #replace old user model with new
@@ -363,7 +645,9 @@ class UserModelBayes(UserModelBase):
             UserModel.objects(user_id = self.user.id).update(upsert = True,
                                                              set__user_id = self.user.id,
                                                              set__data = pickled_classifier,
-                                                             set__version = self.get_version())
+                                                             set__version = self.get_version(),
+                                                             set__trained_at = datetime.now(),
+                                                             **self.get_watermark_fields())
             
         except Exception as inst:
             logger.error("Could not save learned user model due to unknown"
@@ -371,7 +655,7 @@ class UserModelBayes(UserModelBase):
             
     def load(self):
         try:
-            if self.clf is not None:
+            if getattr(self, 'clf', None) is not None:
                 return
             
             user_model = UserModel.objects(user_id = self.user.id).first()
@@ -427,6 +711,7 @@ class UserModelSVM(UserModelBayes):
     
     def __init__(self, user_id, extractor):
         self.set_samples_sizes()
+        self.set_neighbours()
         
         super(UserModelSVM, self).__init__(user_id, extractor)  
         
@@ -478,7 +763,8 @@ class UserModelSVM(UserModelBayes):
                      unread_article_ids,
                      p_synthetic_samples = 300,
                      p_majority_samples = 500,
-                     k = 5):
+                     k = 5,
+                     neighbours = None):
         '''
         read_article_ids : Set
         unread_article_ids : Set
@@ -488,6 +774,8 @@ class UserModelSVM(UserModelBayes):
                              500 for 500%
                              If None under sampling ist not done
         k : neighbourhood for k nearest neighbour, standard 5
+        neighbours : nearest neighbour backend of borderlineSMOTE, 
+                     exact by default
 
         Returns
         -------
@@ -504,33 +792,16 @@ class UserModelSVM(UserModelBayes):
                                      )
         
         #Create unread article vectors
-        unread_marks = numpy.empty(len(unread_article_ids))
+        unread_articles, _ = self.get_feature_matrix(unread_article_ids, 
+                                                     dense = True)
+        unread_marks = numpy.empty(len(unread_articles))
         unread_marks.fill(UserModelSVM.UNREAD)
-        unread_articles = numpy.empty(shape=(len(unread_article_ids), 
-                                             self.num_features_))
-        
-        
-        for i, article in enumerate(Article.objects(id__in = unread_article_ids)):
-            try:
-                article_features_as_full_vec = self.get_features(article)
-                unread_articles[i,:] = article_features_as_full_vec[:]
-            except AttributeError as e:
-                logger.error("Article %s does not have attribute: %s." 
-                             % (article.id, e))  
                 
         #Create read article vectors
-        read_marks = numpy.empty(len(read_article_ids))
+        read_articles, _ = self.get_feature_matrix(read_article_ids, 
+                                                   dense = True)
+        read_marks = numpy.empty(len(read_articles))
         read_marks.fill(UserModelSVM.READ)  
-        read_articles = numpy.empty(shape=(len(read_article_ids), 
-                                             self.num_features_))
-        
-        for i, article in enumerate(Article.objects(id__in = read_article_ids)):
-            try:
-                article_features_as_full_vec = self.get_features(article)
-                read_articles[i,:] = article_features_as_full_vec[:]
-            except AttributeError as e:
-                logger.error("Article %s does not have attribute: %s." 
-                             % (article.id, e))           
         
         #SMOTE sample minorities
         #synthetic_read_articles = SMOTE(read_articles, p_synthetic_samples, k) 
@@ -548,7 +819,8 @@ class UserModelSVM(UserModelBayes):
             new_read_articles, synthetic_read_articles, danger_read_articles = borderlineSMOTE(X = X,
                                                                                                y = y,
                                                                                                minority_target = UserModelSVM.READ,
-                                                                                               N = p_synthetic_samples, k = k)
+                                                                                               N = p_synthetic_samples, k = k,
+                                                                                               neighbours = neighbours)
             
             #Create synthetic read samples
             synthetic_marks = numpy.zeros(len(synthetic_read_articles))
@@ -579,6 +851,13 @@ class UserModelSVM(UserModelBayes):
                           p_majority_samples = 500):
         self.p_synthetic_samples = p_synthetic_samples
         self.p_majority_samples = p_majority_samples
+        
+    def set_neighbours(self, neighbours = None):
+        '''
+        Sets the nearest neighbour backend for oversampling, e.g. 
+        neighbours.LSHNeighbours() for users with a large history.
+        '''
+        self.neighbours = neighbours
     
     def train(self, read_article_ids = None, unread_article_ids = None):
         '''
@@ -591,9 +870,7 @@ class UserModelSVM(UserModelBayes):
         
         #Load user feedback if needed
         if read_article_ids is None:
-            read_article_ids = Set(r.article.id 
-                                for r 
-                                in ReadArticleFeedback.objects(user_id = self.user.id).only("article"))
+            read_article_ids = Set(self.get_read_article_ids())
         else:
             read_article_ids = Set(read_article_ids)
 
@@ -611,7 +888,8 @@ class UserModelSVM(UserModelBayes):
         all_articles, marks = self._get_samples(read_article_ids, 
                                                 unread_article_ids,
                                                 p_synthetic_samples = self.p_synthetic_samples,
-                                                p_majority_samples = self.p_majority_samples)
+                                                p_majority_samples = self.p_majority_samples,
+                                                neighbours = self.neighbours)
 
         logger.debug("Learn on %d samples." % len(marks))            
 
@@ -635,7 +913,9 @@ class UserModelSVM(UserModelBayes):
             UserModel.objects(user_id = self.user.id).update(upsert = True,
                                                              set__user_id = self.user.id,
                                                              set__data = data,
-                                                             set__version = self.get_version())
+                                                             set__version = self.get_version(),
+                                                             set__trained_at = datetime.now(),
+                                                             **self.get_watermark_fields())
             
         except Exception as inst:
             logger.error("Could not save learned user model due to unknown"
@@ -643,7 +923,7 @@ class UserModelSVM(UserModelBayes):
             
     def load(self):
         try:
-            if self.clf is not None:
+            if getattr(self, 'clf', None) is not None:
                 return
             
             user_model = UserModel.objects(user_id = self.user.id).first()
@@ -715,9 +995,7 @@ class UserModelTree(UserModelSVM):
         
         #Load user feedback if needed
         if read_article_ids is None:
-            read_article_ids = Set(r.article.id 
-                                for r 
-                                in ReadArticleFeedback.objects(user_id = self.user.id).only("article"))
+            read_article_ids = Set(self.get_read_article_ids())
         else:
             read_article_ids = Set(read_article_ids)
 
@@ -735,7 +1013,8 @@ class UserModelTree(UserModelSVM):
         all_articles, marks = self._get_samples(read_article_ids, 
                                                 unread_article_ids,
                                                 p_synthetic_samples = self.p_synthetic_samples,
-                                                p_majority_samples = self.p_majority_samples)
+                                                p_majority_samples = self.p_majority_samples,
+                                                neighbours = self.neighbours)
 
         logger.debug("Learn on %d samples." % len(marks))            
 
@@ -794,9 +1073,7 @@ class UserModelMeta(UserModelSVM):
         
         #Load user feedback if needed
         if read_article_ids is None:
-            read_article_ids = Set(r.article.id 
-                                for r 
-                                in ReadArticleFeedback.objects(user_id = self.user.id).only("article"))
+            read_article_ids = Set(self.get_read_article_ids())
         else:
             read_article_ids = Set(read_article_ids)
 
@@ -30,6 +30,7 @@ Created on 19.10.2012
 Converts features of article from TFIDF to ESA Model
 '''
 from feature_extractor.extractors import EsaFeatureExtractor
+from feature_extractor.lemma_cache import LemmaCache
 from gensim import utils, corpora, models 
 import logging
 from models.mongodb_models import (Article, Features)
@@ -44,6 +45,12 @@ if __name__ == '__main__':
     p = OptionParser()
     p.add_option('-c', '--config', action="store", dest='config',
                      help="specify path to config file")
+    p.add_option('-b', '--batch-size', action="store", dest='batch_size',
+                 type="int", default=100,
+                 help="number of articles converted at once. Default is 100")
+    p.add_option('-p', '--processes', action="store", dest='processes',
+                 type="int", default=1,
+                 help="number of processes for lemmatization. Default is 1")
     (options, args) = p.parse_args()
     
     logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s')
@@ -66,9 +73,29 @@ if __name__ == '__main__':
     
     
     feature_extractor = EsaFeatureExtractor(prefix = config['prefix'] )
+    feature_extractor.lemma_cache = LemmaCache()
+    
+    def convert(articles):
+        '''
+        Extracts and saves new features of a batch of articles.
+        '''
+        #get new features
+        new_features = feature_extractor.get_features_batch(
+                            [article.clean_content for article in articles],
+                            processes = options.processes)
+        
+        #save new features
+        for article, data in zip(articles, new_features):
+            features = Features(version = feature_extractor.get_version(), data = data)
+            article.features = features
+            try:
+                article.save()
+            except queryset.OperationError as e:
+                logger.error("Could not save article %s: %s" % (article.id, e))
     
     #go through each article and convert features
     count = 0
+    batch = []
     for article in Article.objects(features__version__ne = feature_extractor.get_version()):
         if count % 10 == 0:
             logger.info("PROGRESS: processing article #%d" % count)
@@ -77,15 +104,10 @@ if __name__ == '__main__':
         if article.features.version == EsaFeatureExtractor.get_version():
             continue
         
-        clean_content = article.clean_content
-        
-        #get new features
-        new_features = feature_extractor.get_features(clean_content)
-        
-        #save new features
-        features = Features(version = feature_extractor.get_version(), data = new_features)
-        article.features = features
-        try:
-            article.save()
-        except queryset.OperationError as e:
-            logger.error("Could not save article #%d: %s" % (count, e))
\ No newline at end of file
+        batch.append(article)
+        if len(batch) >= options.batch_size:
+            convert(batch)
+            batch = []
+            
+    if len(batch) > 0:
+        convert(batch)
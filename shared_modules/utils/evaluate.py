@@ -43,6 +43,7 @@ from feature_extractor.extractors import (EsaFeatureExtractor,
                                           LdaFeatureExtractor,
                                           LdaBowFeatureExtractor,
                                           cEsaFeatureExtractor)
+from feature_extractor.lemma_cache import LemmaCache
 import logging
 from models.mongodb_models import (Article, Features, User, UserModel, 
                                    RankedArticle, ReadArticleFeedback)
@@ -102,6 +103,7 @@ if __name__ == '__main__':
     #feature_extractor = LdaFeatureExtractor(prefix = config_['prefix'])
     #feature_extractor = LdaBowFeatureExtractor(prefix = config_['prefix'])
     feature_extractor = cEsaFeatureExtractor(prefix = config_['prefix'])
+    feature_extractor.lemma_cache = LemmaCache()
     
     #get user
     user = User.objects(email=u"jeskar@web.de").first()
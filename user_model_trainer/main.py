@@ -25,18 +25,122 @@ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
 '''
 from feature_extractor.extractors import EsaFeatureExtractor
+from feature_extractor.lemma_cache import LemmaCache
+from feature_queue import FeatureQueue
 import logging
 from models.mongodb_models import User
 from mongoengine import *
+import multiprocessing
+from multiprocessing.util import Finalize
+import numpy
+import signal
 import sys
+import time
 from user_models import UserModelCentroid
 from utils.helper import load_config
 import yaml
 
 """
 Learns a new user model when called.
+
+Only users with new feedback since their saved model are trained. Their 
+models are updated with the new feedback only unless a full training is 
+requested.
+
+With more than one worker the users are trained by a pool of processes. Each 
+user is trained independently: a failed or timed out user is logged and the
+other users are trained anyway.
 """
 
+logger = logging.getLogger("main")
+
+#feature extractor and queue of a training process. The extractor is shared 
+#with the workers by forking.
+_extractor = None
+_feature_queue = None
+
+class TrainingTimeout(Exception):
+    pass
+
+def _raise_timeout(signum, frame):
+    raise TrainingTimeout("Training took too long.")
+
+def init_train_worker():
+    '''
+    Threads are not forked. Each worker extracts outdated features with its 
+    own queue. The queue is stopped when the worker exits, so articles which
+    are still queued, e.g. by skipping or timed out users, are extracted.
+    '''
+    global _feature_queue
+    _feature_queue = FeatureQueue(_extractor)
+    Finalize(None, _feature_queue.stop, exitpriority = 10)
+
+def train_user(args):
+    '''
+    Trains and saves the model of one user if there is new feedback. With 
+    full the model is trained on all feedback.
+    
+    Returns (user id, user name, duration in seconds, error or None, 
+    whether the model was trained).
+    '''
+    user_id, user_name, timeout, full = args
+    
+    start = time.time()
+    if timeout > 0:
+        signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.alarm(timeout)
+    
+    try:
+        trainer = UserModelCentroid(user_id = user_id,
+                                    extractor = _extractor)
+        trainer.feature_queue = _feature_queue
+        
+        trained = False
+        if full:
+            trainer.train()
+            trainer.save()
+            trained = True
+        elif trainer.has_new_data():
+            trainer.update()
+            trainer.save()
+            trained = True
+        error = None
+    except Exception as inst:
+        error = "%s: %s" % (type(inst), inst)
+    finally:
+        if timeout > 0:
+            signal.alarm(0)
+            
+    return user_id, user_name, time.time() - start, error, trained
+
+def log_summary(results, duration):
+    '''
+    Logs the number of trained, unchanged and failed users and the training 
+    durations.
+    '''
+    failed = [(user_name, error) for _, user_name, _, error, _ in results 
+              if error is not None]
+    trained = [result for result in results if result[4]]
+    num_trained = len(trained)
+    durations = numpy.array([d for _, _, d, _, _ in trained])
+    
+    logger.info("Trained %d users in %.1f s. %d unchanged, %d failed." % 
+                (num_trained, duration, 
+                 len(results) - num_trained - len(failed), len(failed)))
+    
+    if len(failed) > 0:
+        logger.info("Failed users: %s" % ", ".join("%s" % name for name, _ in failed))
+    
+    if len(durations) > 0:
+        logger.info("Duration per user: mean %.2f s, median %.2f s, "
+                    "max %.2f s." % (durations.mean(), 
+                                     numpy.median(durations), 
+                                     durations.max()))
+        
+        slowest = sorted(trained, key = lambda r: r[2], reverse = True)[:10]
+        for _, user_name, user_duration, _, _ in slowest:
+            logger.info("%s: %.2f s" % (user_name, user_duration))
+
 if __name__ == '__main__':
     from optparse import OptionParser
     
@@ -45,6 +149,15 @@ if __name__ == '__main__':
                  help="specify config file")
     p.add_option('-l', '--log', action="store", dest='log',
                  help="specify log file")
+    p.add_option('-w', '--workers', action="store", dest='workers', 
+                 type="int", default=1,
+                 help="number of processes which train users")
+    p.add_option('-t', '--timeout', action="store", dest='timeout', 
+                 type="int", default=0,
+                 help="maximum seconds to train one user, 0 for no limit")
+    p.add_option('-f', '--full', action="store_true", dest='full', 
+                 default=False,
+                 help="train all users on all feedback")
     
     (options, args) = p.parse_args()
 
@@ -53,7 +166,6 @@ if __name__ == '__main__':
                             filename=options.log)
     
     #load config
-    logger = logging.getLogger("main")
     logging.info("Load config")
     
     config_ = load_config(options.config, logger, exit_with_error = True)
@@ -62,20 +174,51 @@ if __name__ == '__main__':
         logger.error("No config. Exit.")
         sys.exit(1)
         
-    #Connect to mongo database
+    #Connect to mongo database. connect() opens the connection at once. The 
+    #forked workers share it, pymongo opens new sockets in each child process.
     connect(config_['database']['db-name'], 
             username= config_['database']['user'], 
             password= config_['database']['passwd'], 
             port = config_['database']['port'])
     
-    feature_extractor = EsaFeatureExtractor(prefix = config_['prefix'])
+    _extractor = EsaFeatureExtractor(prefix = config_['prefix'])
+    _extractor.lemma_cache = LemmaCache()
+    
+    if options.workers > 1:
+        pool = multiprocessing.Pool(options.workers, 
+                                    initializer = init_train_worker)
+    else:
+        pool = None
+        #outdated article features are extracted in batches
+        init_train_worker()
     
     logger.info("Learn user model...")
-    users = User.objects()
-    for u in users:
-        logger.info("for %s" % u.name)
-        trainer = UserModelCentroid(user_id = u.id,
-                                    extractor = feature_extractor)
-        trainer.train()
-        trainer.save()
+    start = time.time()
+    
+    users = [(u.id, u.name, options.timeout, options.full) 
+             for u in User.objects().only("id", "name")]
+    
+    if pool is None:
+        user_results = (train_user(user) for user in users)
+    else:
+        user_results = pool.imap_unordered(train_user, users)
+        
+    results = []
+    try:
+        for user_id, user_name, user_duration, error, trained in user_results:
+            if error is not None:
+                logger.error("Could not train user %s due to error %s" % 
+                             (user_name, error))
+            elif trained:
+                logger.info("Trained %s in %.2f s." % (user_name, user_duration))
+            results.append((user_id, user_name, user_duration, error, trained))
+    finally:
+        #wait for queued feature extractions
+        if pool is None:
+            _feature_queue.stop()
+        else:
+            pool.close()
+            pool.join()
+        
+    log_summary(results, time.time() - start)
     logger.info("...done.")